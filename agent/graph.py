@@ -2,33 +2,60 @@
 LangGraph workflow definition
 Định nghĩa các node và edges cho agent
 """
+import asyncio
 import os
-from typing import Literal, TypedDict
+import time
+from typing import Dict, Literal, Optional, Tuple, TypedDict
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langgraph.graph import StateGraph, MessagesState, START, END
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph import StateGraph, START, END
 
 from .prompts import SYSTEM_PROMPT, INTENT_DETECTION_PROMPT
-from .tools.answer_tool import answer_with_context, answer_with_confidence
-from .tools.explain_tool import explain_with_context
-from .tools.retriever_tool import get_context, get_context_smart
-from .tools.intent_classifier_tool import classify_intent, should_use_intent_classifier
+from .tools.answer_tool import aanswer_with_confidence
+from .tools.explain_tool import adraft_explanation, aexplain_with_context
+from .tools.retriever_tool import aget_context_smart
+from .tools.intent_classifier_tool import aclassify_intent, should_use_intent_classifier
+from .tools.summarizer_tool import afold_into_summary
+from .memory import session_memory
+from .metrics import request_metrics
+from .persistence import create_checkpointer
+from .prompt_budget import declare_budget
+from .semantic_cache import answer_cache
 
 # Load environment variables
 load_dotenv()
 
-# Khởi tạo LLM
-llm = ChatOpenAI(model="gpt-4", temperature=0)
+# Rolling summary: khi thread có > SUMMARY_TRIGGER_MESSAGES messages chưa tóm tắt, các
+# messages cũ hơn SUMMARY_KEEP_RECENT messages gần nhất được gộp vào summary của session
+SUMMARY_TRIGGER_MESSAGES = int(os.getenv("SUMMARY_TRIGGER_MESSAGES", "6"))
+SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", "4"))
+
+# Ngân sách token cho context bài học (k chỉ còn là số chunk ứng viên tối đa).
+# Prompt answer/explain không có history nên không khai báo ngân sách history.
+# answer 3000: thấp hơn thì bench_prompt_budget cho recall giảm (1800: 0.83 so với 0.92 của k=7)
+ANSWER_BUDGET = declare_budget("answer", context_tokens=3000)
+EXPLAIN_BUDGET = declare_budget("explain", context_tokens=3000)
+
+# Speculative fallback: intent classifier + re-retrieve chạy song song với câu trả lời đầu tiên
+# thay vì chỉ chạy sau khi câu trả lời có confidence thấp (tốn thêm một call classifier mỗi câu)
+SPECULATIVE_FALLBACK = os.getenv("SPECULATIVE_FALLBACK", "0") == "1"
 
 # Định nghĩa State
-class AgentState(MessagesState):
-    """State của agent bao gồm messages và metadata"""
-    context: str = ""
-    intent: str = ""
-    current_query: str = ""
-    lesson_id: str = ""  # Thêm lesson_id vào state
+class AgentState(TypedDict, total=False):
+    """
+    State của một lượt hỏi đáp
+
+    Lịch sử hội thoại chỉ nằm trong SessionMemory, graph chỉ nhận câu hỏi hiện tại
+    và trả về câu trả lời.
+    """
+    current_query: str  # Câu hỏi của học sinh (input)
+    reply: str  # Câu trả lời (output)
+    context: str
+    intent: str
+    lesson_id: str  # Thêm lesson_id vào state
+    cached_answer: str  # Câu trả lời lấy từ semantic cache (nếu hit)
+    defer_validation: bool  # Deep mode: trả giải thích ngay, caller tự chạy validator LLM (input)
+    needs_validation: bool  # Giải thích chưa qua grounding check, cần validator LLM (output)
 
 
 def intent_node(state: AgentState) -> dict:
@@ -37,17 +64,10 @@ def intent_node(state: AgentState) -> dict:
     Trả về: "normal" hoặc "deep"
     KHÔNG BAO GỒM "mindmap" - mindmap có API riêng
     """
-    messages = state["messages"]
-    if not messages:
+    query = state.get("current_query", "")
+    if not query:
         return {"intent": "normal"}
     
-    # Lấy câu hỏi mới nhất từ user
-    last_message = messages[-1]
-    if isinstance(last_message, HumanMessage):
-        query = last_message.content
-    else:
-        query = ""
-    
     # Phát hiện intent đơn giản dựa trên keywords
     query_lower = query.lower()
     
@@ -57,41 +77,117 @@ def intent_node(state: AgentState) -> dict:
     else:
         intent = "normal"
     
-    return {
-        "intent": intent,
-        "current_query": query
-    }
+    return {"intent": intent}
 
 
-def retrieve_node(state: AgentState) -> dict:
+async def cache_node(state: AgentState) -> dict:
     """
-    Node truy vấn ngữ cảnh từ ChromaDB với Smart Retrieval
+    Node tra semantic answer cache (chỉ cho normal mode)
+    Hit → bỏ qua retrieval và LLM, answer_node trả lời luôn từ cache
+    """
+    if state.get("intent", "normal") != "normal":
+        return {"cached_answer": ""}
+    
+    query = state.get("current_query", "")
+    lesson_id = state.get("lesson_id", "")
+    
+    cached_answer = await answer_cache.alookup(lesson_id, query)
+    if cached_answer:
+        print(f"[CACHE NODE] Semantic cache hit (lesson_id: {lesson_id or 'all'})")
+    
+    return {"cached_answer": cached_answer or ""}
+
+
+async def retrieve_node(state: AgentState) -> dict:
+    """
+    Node truy vấn ngữ cảnh từ ChromaDB với Smart Retrieval (async)
     """
     query = state.get("current_query", "")
     intent = state.get("intent", "normal")
     lesson_id = state.get("lesson_id", None)  # Lấy lesson_id từ state
     
     # PHASE 1: Smart Retrieval với query expansion
-    # Normal: 7 chunks với expansion
-    # Deep: 10 chunks với expansion
+    # Normal: tối đa 7 chunks, Deep: tối đa 10 chunks, cắt theo ngân sách token
     k = 10 if intent == "deep" else 7
+    budget = EXPLAIN_BUDGET if intent == "deep" else ANSWER_BUDGET
     
     # Dùng smart retrieval thay vì get_context thông thường
-    context = get_context_smart(query, k=k, lesson_id=lesson_id)
+    context = await aget_context_smart(query, k=k, lesson_id=lesson_id, budget=budget)
     
     return {"context": context}
 
 
-def answer_node(state: AgentState) -> dict:
+async def _timed(timings: Dict[str, float], name: str, coro):
+    """Await coro, ghi thời gian chạy (ms) vào timings[name]"""
+    start = time.perf_counter()
+    result = await coro
+    timings[name] = (time.perf_counter() - start) * 1000
+    return result
+
+
+async def _classify_and_retrieve(query: str, timings: Dict[str, float]) -> Tuple[dict, Optional[str]]:
+    """
+    Nhánh fallback khi confidence thấp: classify intent, classifier chắc chắn câu hỏi
+    IN-SCOPE thì re-retrieve ngay theo lesson_id của classifier
+
+    Returns:
+        (kết quả classifier, context mới hoặc None nếu không re-retrieve)
+    """
+    intent_result = await _timed(timings, "intent", aclassify_intent(query))
+    
+    if intent_result["classification"] == "IN-SCOPE" and intent_result["confidence"] > 0.8:
+        # Re-retrieve với lesson_id cụ thể
+        better_lesson_id = intent_result.get("lesson_id")
+        if better_lesson_id:
+            print(f"[ANSWER NODE] Re-retrieving with lesson_id: {better_lesson_id}")
+            better_context = await _timed(
+                timings, "retrieve",
+                aget_context_smart(query, k=10, lesson_id=better_lesson_id, budget=ANSWER_BUDGET)
+            )
+            return intent_result, better_context
+    
+    return intent_result, None
+
+
+def _discard(task: asyncio.Task):
+    """Hủy nhánh speculative không còn cần (bỏ qua lỗi nếu nhánh đã xong với exception)"""
+    task.cancel()
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+async def answer_node(state: AgentState, config: RunnableConfig) -> dict:
     """
-    Node trả lời ngắn gọn với HYBRID APPROACH (Phase 1-4)
+    Node trả lời ngắn gọn với HYBRID APPROACH (Phase 1-4) (async)
+    
+    config được truyền tới mọi lần gọi LLM: trên Python < 3.11 LangGraph không lấy được
+    config từ contextvars, thiếu nó thì /chat/stream không nhận được token.
+    
+    SPECULATIVE_FALLBACK=1: nhánh classify intent + re-retrieve chạy song song với câu
+    trả lời đầu tiên và bị hủy nếu confidence đủ cao; câu trả lời thứ hai bắt đầu ngay
+    khi vừa biết confidence thấp và context mới đã có.
     """
     query = state.get("current_query", "")
     context = state.get("context", "")
     lesson_id = state.get("lesson_id", None)
     
+    # Semantic cache hit từ cache_node
+    cached_answer = state.get("cached_answer", "")
+    if cached_answer:
+        return {"reply": cached_answer}
+    
+    start_time = time.perf_counter()
+    timings: Dict[str, float] = {}
+    speculative_task = None
+    if SPECULATIVE_FALLBACK:
+        speculative_task = asyncio.create_task(_classify_and_retrieve(query, timings))
+    
     # PHASE 2: Answer với confidence scoring
-    result = answer_with_confidence(query, context)
+    try:
+        result = await _timed(timings, "answer", aanswer_with_confidence(query, context, config))
+    except BaseException:
+        if speculative_task:
+            _discard(speculative_task)
+        raise
     
     confidence = result.get("confidence", 0.8)
     answer = result.get("answer", "")
@@ -102,19 +198,17 @@ def answer_node(state: AgentState) -> dict:
     if should_use_intent_classifier(confidence):
         print(f"[ANSWER NODE] Low confidence ({confidence:.2f}), using intent classifier...")
         
-        intent_result = classify_intent(query)
+        if speculative_task:
+            intent_result, better_context = await speculative_task
+        else:
+            intent_result, better_context = await _classify_and_retrieve(query, timings)
         
-        if intent_result["classification"] == "IN-SCOPE" and intent_result["confidence"] > 0.8:
-            # Re-retrieve với lesson_id cụ thể
-            better_lesson_id = intent_result.get("lesson_id")
-            if better_lesson_id:
-                print(f"[ANSWER NODE] Re-retrieving with lesson_id: {better_lesson_id}")
-                better_context = get_context_smart(query, k=10, lesson_id=better_lesson_id)
-                
-                # Re-answer
-                result = answer_with_confidence(query, better_context)
-                answer = result.get("answer", "")
-                print(f"[ANSWER NODE] Re-answer confidence: {result.get('confidence', 0):.2f}")
+        if better_context is not None:
+            # Re-answer
+            result = await _timed(timings, "re_answer", aanswer_with_confidence(query, better_context, config))
+            answer = result.get("answer", "")
+            confidence = result.get("confidence", 0)
+            print(f"[ANSWER NODE] Re-answer confidence: {confidence:.2f}")
         
         elif intent_result["classification"] == "OUT-OF-SCOPE" and intent_result["confidence"] > 0.85:
             # Truly out-of-scope
@@ -125,27 +219,50 @@ def answer_node(state: AgentState) -> dict:
                 f"Em có muốn hỏi về các chủ đề này không?"
             )
             print(f"[ANSWER NODE] OUT-OF-SCOPE confirmed: {topic}")
+        
+        # Thời gian từng nhánh; "tuần tự" là tổng các nhánh (latency khi chạy lần lượt)
+        total_ms = (time.perf_counter() - start_time) * 1000
+        request_metrics["answer_fallback"].record(total_ms)
+        branches = " ".join(f"{name}={ms:.0f}ms" for name, ms in timings.items())
+        print(f"[ANSWER NODE] Fallback ({'speculative' if speculative_task else 'sequential'}): "
+              f"{branches} total={total_ms:.0f}ms (tuần tự ≈ {sum(timings.values()):.0f}ms)")
     
-    # Cập nhật messages
-    new_message = AIMessage(content=answer)
+    elif speculative_task:
+        # Confidence đủ cao: không cần classifier / context mới
+        _discard(speculative_task)
     
-    return {"messages": [new_message]}
+    # Chỉ cache câu trả lời có confidence cao
+    if not should_use_intent_classifier(confidence):
+        await answer_cache.astore(lesson_id or "", query, answer)
+    
+    return {"reply": answer}
 
 
-def explain_node(state: AgentState) -> dict:
+async def explain_node(state: AgentState, config: RunnableConfig) -> dict:
     """
-    Node giải thích chi tiết (Deep mode)
+    Node giải thích chi tiết (Deep mode) (async), config truyền tới LLM như answer_node
     """
     query = state.get("current_query", "")
     context = state.get("context", "")
     
-    # Gọi tool giải thích
-    explanation = explain_with_context(query, context)
+    # Validate ở background (/chat/stream): trả giải thích ngay, kèm cờ cần validator LLM
+    if state.get("defer_validation"):
+        explanation, needs_validation = await adraft_explanation(query, context, config)
+        return {"reply": explanation, "needs_validation": needs_validation}
     
-    # Cập nhật messages
-    new_message = AIMessage(content=explanation)
+    # Gọi tool giải thích
+    explanation = await aexplain_with_context(query, context, config)
     
-    return {"messages": [new_message]}
+    return {"reply": explanation, "needs_validation": False}
+
+
+def route_cache(state: AgentState) -> Literal["answer", "retrieve"]:
+    """
+    Cache hit → answer (không cần retrieval), miss → retrieve
+    """
+    if state.get("cached_answer"):
+        return "answer"
+    return "retrieve"
 
 
 def route_intent(state: AgentState) -> Literal["answer", "explain"]:
@@ -171,6 +288,7 @@ def create_graph() -> StateGraph:
     
     # Thêm các nodes
     workflow.add_node("intent", intent_node)
+    workflow.add_node("cache", cache_node)
     workflow.add_node("retrieve", retrieve_node)
     workflow.add_node("answer", answer_node)
     workflow.add_node("explain", explain_node)
@@ -179,8 +297,18 @@ def create_graph() -> StateGraph:
     # START -> intent
     workflow.add_edge(START, "intent")
     
-    # intent -> retrieve
-    workflow.add_edge("intent", "retrieve")
+    # intent -> semantic cache
+    workflow.add_edge("intent", "cache")
+    
+    # cache hit -> answer, miss -> retrieve
+    workflow.add_conditional_edges(
+        "cache",
+        route_cache,
+        {
+            "answer": "answer",
+            "retrieve": "retrieve"
+        }
+    )
     
     # retrieve -> conditional routing dựa trên intent
     workflow.add_conditional_edges(
@@ -201,13 +329,70 @@ def create_graph() -> StateGraph:
 
 def get_compiled_graph():
     """
-    Compile graph với MemorySaver checkpointer
+    Compile graph với checkpointer theo PERSISTENCE_BACKEND (SQLite hoặc MemorySaver)
     """
     workflow = create_graph()
-    memory = MemorySaver()
-    compiled_graph = workflow.compile(checkpointer=memory)
+    compiled_graph = workflow.compile(checkpointer=create_checkpointer())
     return compiled_graph
 
 
 # Tạo graph instance toàn cục
 compiled_graph = get_compiled_graph()
+
+
+async def acompact_history(thread_id: str) -> int:
+    """
+    Gộp các messages đã ra khỏi cửa sổ gần nhất vào rolling summary của thread
+    
+    Chỉ các messages vừa bị đẩy ra (chưa có trong tóm tắt) được gửi cho summarizer
+    cùng tóm tắt cũ. Messages vẫn nằm trong SessionMemory cho /session và analyzer.
+    
+    Args:
+        thread_id: ID của thread
+        
+    Returns:
+        Số messages đã gộp vào summary
+    """
+    # Chỉ đọc trạng thái summary và đoạn messages cần gộp, không load cả session
+    state = await session_memory.aget_compaction_state(thread_id)
+    if state is None:
+        return 0
+    pending = state["messages_count"] - state["summarized_count"]
+    if pending <= SUMMARY_TRIGGER_MESSAGES:
+        return 0
+    
+    upto = state["messages_count"] - SUMMARY_KEEP_RECENT
+    aged = await session_memory.aget_records(thread_id, state["summarized_count"], upto)
+    start_time = time.perf_counter()
+    summary = await afold_into_summary(state["summary"], aged)
+    if summary is None:
+        return 0
+    
+    await session_memory.aset_summary(thread_id, summary, upto)
+    print(f"[SUMMARY] Gộp {len(aged)} messages vào tóm tắt của {thread_id} ({time.perf_counter() - start_time:.2f}s)")
+    return len(aged)
+
+
+# Task compaction đang chạy theo thread (giữ reference để task không bị GC)
+_compaction_tasks: Dict[str, asyncio.Task] = {}
+
+
+def schedule_history_compaction(thread_id: str):
+    """
+    Chạy acompact_history ở background sau khi đã trả lời, không nằm trên critical path
+    
+    Mỗi thread chỉ có tối đa một task compaction; nếu đang chạy thì bỏ qua,
+    lượt sau sẽ gộp tiếp.
+    """
+    if thread_id in _compaction_tasks:
+        return
+    
+    async def run():
+        try:
+            await acompact_history(thread_id)
+        except Exception as e:
+            print(f"[SUMMARY] Lỗi khi gộp history của {thread_id}: {e}")
+        finally:
+            _compaction_tasks.pop(thread_id, None)
+    
+    _compaction_tasks[thread_id] = asyncio.create_task(run())
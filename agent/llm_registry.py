@@ -0,0 +1,110 @@
+"""
+Registry chat client theo vai trò (answer, explain, validator, ...)
+
+Mỗi tool từng tự tạo ChatOpenAI của mình, và mỗi ChatOpenAI có HTTP client riêng
+(tùy phiên bản langchain-openai) nên kết nối tới OpenAI không được dùng lại giữa các
+tool. get_llm(role) trả về client đã cấu hình sẵn cho từng vai trò; mọi vai trò dùng
+chung một cặp httpx.Client/httpx.AsyncClient có pool kết nối keep-alive, nên các call
+trên hot path không phải mở lại TCP/TLS.
+
+Model của một vai trò ghi đè bằng LLM_MODEL_<ROLE> (vd LLM_MODEL_ANSWER=gpt-4o-mini).
+"""
+import os
+import threading
+from typing import Dict
+
+import httpx
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI
+
+from .streaming import STREAM_TAG_JSON_ANSWER, STREAM_TAG_TEXT
+
+load_dotenv()
+
+# Pool kết nối dùng chung cho mọi vai trò
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", "60"))
+
+# Timeout mặc định giống OpenAI SDK (600s, connect 5s)
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "600"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+
+_JSON_MODE = {"response_format": {"type": "json_object"}}
+
+# Cấu hình của từng vai trò
+LLM_ROLES: Dict[str, dict] = {
+    # Câu trả lời text thuần cho học sinh (fallback của answer_with_confidence)
+    "answer": {"model": "gpt-3.5-turbo", "tags": [STREAM_TAG_TEXT]},
+    # Câu trả lời + confidence (JSON mode, stream field "answer")
+    "answer_json": {"model": "gpt-3.5-turbo", "json": True, "tags": [STREAM_TAG_JSON_ANSWER]},
+    "explain": {"model": "gpt-4", "tags": [STREAM_TAG_TEXT]},
+    # Phân loại câu hỏi thuộc bài học nào (JSON mode)
+    "json": {"model": "gpt-4", "json": True},
+    "validator": {"model": "gpt-4", "json": True},
+    "summarizer": {"model": "gpt-3.5-turbo"},
+    "analyzer": {"model": "gpt-3.5-turbo"},
+    "mindmap": {"model": "gpt-4o", "json": True},
+}
+
+_limits = httpx.Limits(
+    max_connections=LLM_MAX_CONNECTIONS,
+    max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS,
+)
+_timeout = httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS)
+
+# HTTP client dùng chung (sync cho invoke, async cho ainvoke)
+http_client = httpx.Client(limits=_limits, timeout=_timeout)
+http_async_client = httpx.AsyncClient(limits=_limits, timeout=_timeout)
+
+_llms: Dict[str, ChatOpenAI] = {}
+_lock = threading.Lock()
+
+
+def create_llm(role: str, **kwargs) -> ChatOpenAI:
+    """
+    Tạo ChatOpenAI mới cho một vai trò, dùng pool kết nối chung
+
+    Args:
+        role: Tên vai trò trong LLM_ROLES
+        **kwargs: Tham số ghi đè cấu hình của vai trò (model, temperature, tags...)
+
+    Returns:
+        ChatOpenAI
+    """
+    if role not in LLM_ROLES:
+        raise ValueError(f"Vai trò LLM không hợp lệ: {role} (có: {', '.join(LLM_ROLES)})")
+
+    config = LLM_ROLES[role]
+    params = {
+        "model": os.getenv(f"LLM_MODEL_{role.upper()}", config["model"]),
+        "temperature": 0,
+        "http_client": http_client,
+        "http_async_client": http_async_client,
+    }
+    if config.get("json"):
+        params["model_kwargs"] = dict(_JSON_MODE)
+    if config.get("tags"):
+        params["tags"] = list(config["tags"])
+    params.update(kwargs)
+    return ChatOpenAI(**params)
+
+
+def get_llm(role: str) -> ChatOpenAI:
+    """
+    Chat client của một vai trò (tạo một lần, các lần sau dùng lại)
+
+    Args:
+        role: Tên vai trò trong LLM_ROLES
+
+    Returns:
+        ChatOpenAI dùng chung
+    """
+    llm = _llms.get(role)
+    if llm is None:
+        with _lock:
+            llm = _llms.get(role)
+            if llm is None:
+                llm = _llms[role] = create_llm(role)
+    return llm
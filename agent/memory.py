@@ -1,54 +1,858 @@
 """
 Quản lý memory và checkpointer cho LangGraph
+
+SessionMemory là nơi duy nhất giữ lịch sử hội thoại của từng thread: graph chỉ nhận
+câu hỏi hiện tại (current_query) và trả về reply, không lưu messages trong checkpoint.
+Analyzer, /session, /user/{id}/level và rolling summary đều đọc từ đây.
+- Rolling summary (summary + số message đầu đã được gộp) lưu cùng session
+- Chỉ số level (số câu hỏi, từ khóa học sâu) cập nhật mỗi khi thêm message,
+  GET /user/{id}/level tính level ngay từ đó
+- Giới hạn số session và tổng dung lượng ước tính, evict session ít dùng gần đây nhất (LRU)
+- Session không hoạt động quá TTL tự hết hạn
+- History lưu dạng text đã render, chỉ append (bytearray + offset của từng message):
+  đọc toàn bộ history hay một trang (GET /session?cursor=&limit=&max_bytes=) không
+  phải render lại từ đầu
+
+Với PERSISTENCE_BACKEND=sqlite (mặc định), session lưu trong SQLite dùng chung với
+checkpointer của graph (xem persistence.py): nhiều worker cùng đọc/ghi một thread
+và hội thoại còn nguyên sau khi restart.
+
+Code async (endpoint, task nền) dùng các hàm a* (aadd_message, aget_history_page...):
+với backend SQLite chúng chạy trong thread pool (chờ lock DB, busy_timeout, pool connection)
+thay vì chặn event loop.
 """
-from langgraph.checkpoint.memory import MemorySaver
-from typing import Dict, Any
+import asyncio
+import os
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .persistence import PERSISTENCE_BACKEND, PERSISTENCE_DB_PATH, SQLitePool, get_pool
+from .tools.level_assessment_tool import assess_level, level_signals
+
+# Backend SQLite chỉ chạy dọn session hết hạn/vượt giới hạn tối đa mỗi chừng này giây
+# (ngoài lần tạo session mới), tránh quét bảng sessions ở mỗi message
+_ENFORCE_INTERVAL_SECONDS = 30
+
+
+# Nhãn của từng role trong history dạng text (analyzer, /session)
+ROLE_LABELS = {"user": "Học sinh", "assistant": "Trợ giảng"}
+
+
+def render_message(role: str, content: str) -> str:
+    """Một message dạng "Học sinh: ..." (kết thúc bằng xuống dòng)"""
+    return f"{ROLE_LABELS.get(role, role)}: {content}\n"
+
+
+class MessageRecord:
+    """Một message của session (chỉ tạo khi cần đọc, Session không giữ object này)"""
+
+    __slots__ = ("role", "content", "created_at")
+
+    def __init__(self, role: str, content: str, created_at: Optional[float] = None):
+        self.role = role
+        self.content = content
+        self.created_at = created_at if created_at is not None else time.time()
+
+    def nbytes(self) -> int:
+        """Dung lượng ước tính khi lưu trong session (history đã render + offset, thời điểm, role)"""
+        return len(render_message(self.role, self.content).encode("utf-8")) + _ENTRY_OVERHEAD
+
+
+# Mỗi message ngoài phần text: offset (8 byte) + created_at (8 byte) + con trỏ role trong list
+_ENTRY_OVERHEAD = 24
+
+
+class Session:
+    """
+    Dữ liệu của một thread
+
+    Messages được nối vào history (UTF-8 đã render "Học sinh: ...\n", chỉ append);
+    offsets[i] là vị trí bắt đầu của message i nên một đoạn history hay một message
+    chỉ cần cắt theo offset, không render lại.
+    """
+
+    __slots__ = (
+        "thread_id", "history", "offsets", "roles", "created_at", "latest_level", "level_reason",
+        "summary", "summarized_count", "user_questions", "deep_keywords", "last_access", "nbytes",
+    )
+
+    def __init__(self, thread_id: str):
+        self.thread_id = thread_id
+        self.history = bytearray()
+        self.offsets = array("Q")
+        self.roles: List[str] = []
+        self.created_at = array("d")
+        self.latest_level: Optional[str] = None
+        self.level_reason: Optional[str] = None
+        # Rolling summary của messages[:summarized_count]
+        self.summary = ""
+        self.summarized_count = 0
+        # Chỉ số level: số câu hỏi của học sinh, bitmask từ khóa học sâu đã gặp
+        self.user_questions = 0
+        self.deep_keywords = 0
+        self.last_access = time.monotonic()
+        self.nbytes = _SESSION_OVERHEAD + sys.getsizeof(thread_id)
+
+    @property
+    def message_count(self) -> int:
+        return len(self.offsets)
+
+    def append(self, role: str, content: str, created_at: float) -> int:
+        """Nối message vào history, trả về dung lượng ước tính đã thêm"""
+        data = render_message(role, content).encode("utf-8")
+        start = len(self.history)
+        self.history += data
+        self.roles.append(sys.intern(role))
+        self.created_at.append(created_at)
+        questions, self.deep_keywords = level_signals(role, content, self.deep_keywords)
+        self.user_questions += questions
+        # Ghi offset sau cùng: reader không khóa chỉ thấy message khi dữ liệu đã đủ
+        self.offsets.append(start)
+        return len(data) + _ENTRY_OVERHEAD
+
+    def live_level(self) -> Dict:
+        """Level hiện tại tính từ chỉ số đã cập nhật sẵn (O(1))"""
+        return level_summary(self.message_count, self.user_questions, self.deep_keywords)
+
+    def _end(self, index: int) -> int:
+        """Vị trí kết thúc (sau xuống dòng) của message index"""
+        return self.offsets[index + 1] if index + 1 < len(self.offsets) else len(self.history)
+
+    def records(self, start: int = 0, end: Optional[int] = None) -> List[MessageRecord]:
+        """Messages[start:end] dạng MessageRecord"""
+        records = []
+        for index in range(self.message_count)[start:end]:
+            role = self.roles[index]
+            prefix = len(render_message(role, "").encode("utf-8")) - 1
+            content = self.history[self.offsets[index] + prefix:self._end(index) - 1].decode("utf-8")
+            records.append(MessageRecord(role, content, self.created_at[index]))
+        return records
+
+    @property
+    def messages(self) -> List[MessageRecord]:
+        """Toàn bộ messages (tạo mới mỗi lần gọi, chỉ cần một đoạn thì dùng records)"""
+        return self.records()
+
+    def render(self, start: int = 0, end: Optional[int] = None) -> str:
+        """History dạng text của messages[start:end]"""
+        start, end, _ = slice(start, end).indices(self.message_count)
+        if start >= end:
+            return ""
+        return self.history[self.offsets[start]:self._end(end - 1) - 1].decode("utf-8")
+
+    def page_end(self, cursor: int, limit: Optional[int] = None, max_bytes: Optional[int] = None) -> int:
+        """
+        Chỉ số kết thúc của trang bắt đầu tại cursor: tối đa limit message và
+        max_bytes byte, luôn có ít nhất một message nếu còn
+        """
+        end = self.message_count if not limit else min(self.message_count, cursor + limit)
+        if max_bytes is None or end - cursor <= 1:
+            return end
+        # offsets tăng dần: offsets[j] là vị trí kết thúc của message j - 1
+        limit_offset = self.offsets[cursor] + max_bytes
+        last = bisect_right(self.offsets, limit_offset, cursor + 1, end)
+        if self._end(last - 1) > limit_offset:
+            last -= 1
+        return max(last, cursor + 1)
+
+
+_SESSION_OVERHEAD = (
+    Session.__basicsize__ + sys.getsizeof(bytearray()) + 2 * sys.getsizeof(array("Q"))
+    + sys.getsizeof([]) + sys.getsizeof("")
+)
+
+
+def level_summary(messages_count: int, user_questions: int, deep_keywords: int) -> Dict:
+    """Kết quả của get_live_level"""
+    deep_count = bin(deep_keywords).count("1")
+    return {
+        **assess_level(user_questions, deep_count),
+        "messages_count": messages_count,
+        "user_questions": user_questions,
+        "deep_count": deep_count,
+    }
+
+
+def history_page(history: str, cursor: int, next_cursor: int, messages_count: int) -> Dict:
+    """Kết quả của get_history_page"""
+    return {
+        "conversation_history": history,
+        "cursor": cursor,
+        "next_cursor": next_cursor,
+        "has_more": next_cursor < messages_count,
+        "messages_count": messages_count,
+    }
 
-# Khởi tạo MemorySaver cho việc lưu trữ state
-memory_saver = MemorySaver()
 
 class SessionMemory:
-    """Quản lý memory cho từng session/thread"""
-    
-    def __init__(self):
-        self.sessions: Dict[str, Dict[str, Any]] = {}
-    
-    def get_session(self, thread_id: str) -> Dict[str, Any]:
-        """Lấy thông tin session theo thread_id"""
-        if thread_id not in self.sessions:
-            self.sessions[thread_id] = {
-                "messages": [],
-                "context": "",
-                "metadata": {}
-            }
-        return self.sessions[thread_id]
-    
-    def update_session(self, thread_id: str, data: Dict[str, Any]):
-        """Cập nhật thông tin session"""
-        if thread_id not in self.sessions:
-            self.sessions[thread_id] = {}
-        self.sessions[thread_id].update(data)
-    
+    """Quản lý memory cho từng session/thread (LRU + TTL, giới hạn số session và bộ nhớ)"""
+
+    # Các thao tác có chặn (I/O đĩa, chờ lock DB) không: hàm a* chạy trong thread pool nếu True
+    blocking = False
+
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl_seconds: float = 86400,
+        on_evict: Optional[Callable[[str], None]] = None,
+    ):
+        """
+        Args:
+            max_sessions: Số session tối đa giữ trong RAM
+            max_bytes: Tổng dung lượng ước tính tối đa của các session
+            ttl_seconds: Session không hoạt động lâu hơn sẽ hết hạn
+            on_evict: Callback(thread_id) khi session bị evict/hết hạn hoặc bị xóa bằng
+                clear_session (VD: xóa checkpoint)
+        """
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+
+        # thread_id -> Session, thứ tự LRU (ít dùng gần đây nhất ở đầu)
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._bytes = 0
+
+        self.evictions = 0
+        self.expirations = 0
+
+    def _drop(self, thread_id: str) -> Session:
+        session = self.sessions.pop(thread_id)
+        self._bytes -= session.nbytes
+        return session
+
+    def _notify_evicted(self, thread_ids: List[str]):
+        if not self.on_evict:
+            return
+        for thread_id in thread_ids:
+            try:
+                self.on_evict(thread_id)
+            except Exception as e:
+                print(f"[SESSION] Lỗi khi dọn session {thread_id}: {e}")
+
+    def _enforce_limits(self) -> List[str]:
+        """Xóa session hết hạn rồi evict LRU cho tới khi dưới giới hạn, trả về các thread đã xóa"""
+        removed = []
+        now = time.monotonic()
+
+        # Session ở đầu là session lâu không dùng nhất: dừng ở session đầu tiên chưa hết hạn
+        while self.sessions:
+            oldest = next(iter(self.sessions.values()))
+            if now - oldest.last_access <= self.ttl_seconds:
+                break
+            removed.append(self._drop(oldest.thread_id).thread_id)
+            self.expirations += 1
+
+        # Luôn giữ session vừa dùng (ở cuối) kể cả khi một mình nó vượt max_bytes
+        while len(self.sessions) > 1 and (len(self.sessions) > self.max_sessions or self._bytes > self.max_bytes):
+            removed.append(self._drop(next(iter(self.sessions))).thread_id)
+            self.evictions += 1
+
+        return removed
+
+    def _touch(self, thread_id: str, create: bool) -> Optional[Session]:
+        """Lấy session và đánh dấu vừa dùng (tạo mới nếu create)"""
+        removed = []
+        with self._lock:
+            session = self.sessions.get(thread_id)
+            if session is not None and time.monotonic() - session.last_access > self.ttl_seconds:
+                removed.append(self._drop(thread_id).thread_id)
+                self.expirations += 1
+                session = None
+            if session is None and create:
+                session = Session(thread_id)
+                self.sessions[thread_id] = session
+                self._bytes += session.nbytes
+            elif session is not None:
+                self.sessions.move_to_end(thread_id)
+            if session is not None:
+                session.last_access = time.monotonic()
+                removed.extend(self._enforce_limits())
+        self._notify_evicted(removed)
+        return session
+
+    def get_session(self, thread_id: str) -> Session:
+        """Lấy session theo thread_id (tạo mới nếu chưa có)"""
+        return self._touch(thread_id, create=True)
+
+    def find_session(self, thread_id: str) -> Optional[Session]:
+        """Lấy session nếu đã có, không tạo session rỗng cho thread lạ"""
+        return self._touch(thread_id, create=False)
+
+    def add_message(self, thread_id: str, role: str, content: str) -> MessageRecord:
+        """
+        Thêm message vào session
+
+        Args:
+            thread_id: ID của thread
+            role: "user" hoặc "assistant"
+            content: Nội dung message
+
+        Returns:
+            MessageRecord vừa thêm
+        """
+        record = MessageRecord(role, content)
+        with self._lock:
+            session = self.get_session(thread_id)
+            size = session.append(role, content, record.created_at)
+            session.nbytes += size
+            self._bytes += size
+            removed = self._enforce_limits()
+        self._notify_evicted(removed)
+        return record
+
+    def set_level(self, thread_id: str, level: str, reason: str):
+        """Lưu level đánh giá gần nhất (từ analyzer)"""
+        session = self.get_session(thread_id)
+        session.latest_level = level
+        session.level_reason = reason
+
+    def get_live_level(self, thread_id: str) -> Optional[Dict]:
+        """
+        Level hiện tại của thread từ chỉ số cập nhật theo từng message (không gọi LLM, không quét history)
+
+        Returns:
+            Dict level/reason/messages_count/user_questions/deep_count, None nếu không có session
+        """
+        session = self.find_session(thread_id)
+        return session.live_level() if session else None
+
+    def get_summary(self, thread_id: str) -> str:
+        """Rolling summary của phần đầu hội thoại ("" nếu chưa có)"""
+        session = self.find_session(thread_id)
+        return session.summary if session else ""
+
+    def set_summary(self, thread_id: str, summary: str, summarized_count: int) -> bool:
+        """
+        Lưu rolling summary mới (bỏ qua nếu session đã bị xóa hoặc đã có summary mới hơn)
+
+        Args:
+            thread_id: ID của thread
+            summary: Tóm tắt của messages[:summarized_count]
+            summarized_count: Số message đầu đã được gộp vào tóm tắt
+
+        Returns:
+            True nếu đã lưu
+        """
+        with self._lock:
+            session = self.sessions.get(thread_id)
+            if session is None or summarized_count <= session.summarized_count:
+                return False
+            delta = sys.getsizeof(summary) - sys.getsizeof(session.summary)
+            session.summary = summary
+            session.summarized_count = summarized_count
+            session.nbytes += delta
+            self._bytes += delta
+            return True
+
     def clear_session(self, thread_id: str):
-        """Xóa session"""
-        if thread_id in self.sessions:
-            del self.sessions[thread_id]
-    
+        """Xóa session (kèm checkpoint qua on_evict)"""
+        with self._lock:
+            if thread_id in self.sessions:
+                self._drop(thread_id)
+        self._notify_evicted([thread_id])
+
+    def get_compaction_state(self, thread_id: str) -> Optional[Dict]:
+        """
+        Trạng thái rolling summary của thread (không đọc messages)
+
+        Returns:
+            Dict summary/summarized_count/messages_count, None nếu không có session
+        """
+        with self._lock:
+            session = self.find_session(thread_id)
+            if session is None:
+                return None
+            return {
+                "summary": session.summary,
+                "summarized_count": session.summarized_count,
+                "messages_count": session.message_count,
+            }
+
+    def get_records(self, thread_id: str, start: int = 0, end: Optional[int] = None) -> List[MessageRecord]:
+        """Messages[start:end] của thread ([] nếu không có session)"""
+        session = self.find_session(thread_id)
+        return session.records(start, end) if session else []
+
     def get_conversation_history(self, thread_id: str) -> str:
         """Lấy lịch sử hội thoại dưới dạng text"""
-        session = self.get_session(thread_id)
-        messages = session.get("messages", [])
-        
-        history = []
-        for msg in messages:
-            role = msg.get("role", "unknown")
-            content = msg.get("content", "")
-            if role == "user":
-                history.append(f"Học sinh: {content}")
-            elif role == "assistant":
-                history.append(f"Trợ giảng: {content}")
-        
-        return "\n".join(history)
+        session = self.find_session(thread_id)
+        return session.render() if session else ""
+
+    def get_history_page(
+        self,
+        thread_id: str,
+        cursor: int = 0,
+        limit: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ) -> Optional[Dict]:
+        """
+        Một trang history dạng text (cho GET /session)
+
+        Args:
+            thread_id: ID của thread
+            cursor: Chỉ số message đầu tiên của trang (next_cursor của trang trước)
+            limit: Số message tối đa
+            max_bytes: Dung lượng tối đa (UTF-8) của history trả về, luôn có ít nhất một message
+
+        Returns:
+            Dict conversation_history/cursor/next_cursor/has_more/messages_count,
+            None nếu không có session
+        """
+        with self._lock:
+            session = self.find_session(thread_id)
+            if session is None:
+                return None
+            cursor = min(max(cursor, 0), session.message_count)
+            end = session.page_end(cursor, limit, max_bytes)
+            return history_page(session.render(cursor, end), cursor, end, session.message_count)
+
+    async def _arun(self, method: Callable, *args):
+        """Gọi method từ code async: chạy trong thread pool nếu backend có chặn"""
+        if self.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def aadd_message(self, thread_id: str, role: str, content: str) -> MessageRecord:
+        """Bản async của add_message"""
+        return await self._arun(self.add_message, thread_id, role, content)
+
+    async def aset_level(self, thread_id: str, level: str, reason: str):
+        """Bản async của set_level"""
+        await self._arun(self.set_level, thread_id, level, reason)
+
+    async def aget_live_level(self, thread_id: str) -> Optional[Dict]:
+        """Bản async của get_live_level"""
+        return await self._arun(self.get_live_level, thread_id)
+
+    async def aget_summary(self, thread_id: str) -> str:
+        """Bản async của get_summary"""
+        return await self._arun(self.get_summary, thread_id)
+
+    async def aset_summary(self, thread_id: str, summary: str, summarized_count: int) -> bool:
+        """Bản async của set_summary"""
+        return await self._arun(self.set_summary, thread_id, summary, summarized_count)
+
+    async def aclear_session(self, thread_id: str):
+        """Bản async của clear_session"""
+        await self._arun(self.clear_session, thread_id)
+
+    async def aget_compaction_state(self, thread_id: str) -> Optional[Dict]:
+        """Bản async của get_compaction_state"""
+        return await self._arun(self.get_compaction_state, thread_id)
+
+    async def aget_records(self, thread_id: str, start: int = 0, end: Optional[int] = None) -> List[MessageRecord]:
+        """Bản async của get_records"""
+        return await self._arun(self.get_records, thread_id, start, end)
+
+    async def aget_conversation_history(self, thread_id: str) -> str:
+        """Bản async của get_conversation_history"""
+        return await self._arun(self.get_conversation_history, thread_id)
+
+    async def aget_history_page(
+        self,
+        thread_id: str,
+        cursor: int = 0,
+        limit: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ) -> Optional[Dict]:
+        """Bản async của get_history_page"""
+        return await self._arun(self.get_history_page, thread_id, cursor, limit, max_bytes)
+
+    async def astats(self) -> Dict:
+        """Bản async của stats"""
+        return await self._arun(self.stats)
+
+    def stats(self) -> Dict:
+        """Số session, số message và dung lượng ước tính (cho GET /sessions/stats)"""
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self.sessions),
+                "max_sessions": self.max_sessions,
+                "messages": sum(session.message_count for session in self.sessions.values()),
+                "approx_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+# Cột thêm vào bảng sessions sau phiên bản đầu tiên
+_ADDED_SESSION_COLUMNS = {
+    "summary": "TEXT NOT NULL DEFAULT ''",
+    "summarized_count": "INTEGER NOT NULL DEFAULT 0",
+    "user_questions": "INTEGER NOT NULL DEFAULT 0",
+    "deep_keywords": "INTEGER NOT NULL DEFAULT 0",
+    "history_bytes": "INTEGER NOT NULL DEFAULT 0",
+}
+_ADDED_MESSAGE_COLUMNS = {
+    "byte_start": "INTEGER",
+    "byte_end": "INTEGER",
+}
+
+
+class SQLiteSessionMemory(SessionMemory):
+    """
+    SessionMemory lưu trong SQLite (cùng file với checkpointer)
+
+    Không cache trong RAM: mọi worker đọc thẳng từ DB nên luôn thấy message mới nhất
+    của thread. Giới hạn số session/dung lượng/TTL giống SessionMemory, tính theo
+    last_access (wall clock) lưu trong DB.
+
+    Giống offsets của Session, mỗi message lưu vị trí byte (byte_start, byte_end) của nó
+    trong history đã render: trang của GET /session được cắt bằng một lần tra index
+    (thread_id, byte_end), chỉ đọc các dòng của trang.
+    """
+
+    blocking = True
+
+    def __init__(
+        self,
+        pool: SQLitePool,
+        max_sessions: int = 10000,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl_seconds: float = 86400,
+        on_evict: Optional[Callable[[str], None]] = None,
+    ):
+        super().__init__(max_sessions=max_sessions, max_bytes=max_bytes, ttl_seconds=ttl_seconds, on_evict=on_evict)
+        self.pool = pool
+        self._last_enforced = 0.0
+        with self.pool.connection() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS sessions (
+                    thread_id TEXT PRIMARY KEY,
+                    latest_level TEXT,
+                    level_reason TEXT,
+                    last_access REAL NOT NULL,
+                    nbytes INTEGER NOT NULL,
+                    message_count INTEGER NOT NULL DEFAULT 0,
+                    summary TEXT NOT NULL DEFAULT '',
+                    summarized_count INTEGER NOT NULL DEFAULT 0,
+                    user_questions INTEGER NOT NULL DEFAULT 0,
+                    deep_keywords INTEGER NOT NULL DEFAULT 0,
+                    history_bytes INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions(last_access);
+                CREATE TABLE IF NOT EXISTS session_messages (
+                    thread_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    byte_start INTEGER,
+                    byte_end INTEGER,
+                    PRIMARY KEY (thread_id, seq)
+                );
+                """
+            )
+            # DB tạo trước khi có các cột này (chỉ số level của session cũ bắt đầu từ 0)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+            for column, definition in _ADDED_SESSION_COLUMNS.items():
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE sessions ADD COLUMN {column} {definition}")
+            if "user_questions" not in columns:
+                self._backfill_level_signals(conn)
+            message_columns = {row[1] for row in conn.execute("PRAGMA table_info(session_messages)")}
+            for column, definition in _ADDED_MESSAGE_COLUMNS.items():
+                if column not in message_columns:
+                    conn.execute(f"ALTER TABLE session_messages ADD COLUMN {column} {definition}")
+            if "byte_start" not in message_columns:
+                self._backfill_offsets(conn)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_session_messages_byte_end ON session_messages(thread_id, byte_end)"
+            )
+
+    @staticmethod
+    def _backfill_level_signals(conn):
+        """Tính chỉ số level cho các session đã có message (chạy một lần khi thêm cột)"""
+        signals: Dict[str, List[int]] = {}
+        for thread_id, role, content in conn.execute("SELECT thread_id, role, content FROM session_messages"):
+            counters = signals.setdefault(thread_id, [0, 0])
+            questions, counters[1] = level_signals(role, content, counters[1])
+            counters[0] += questions
+        conn.executemany(
+            "UPDATE sessions SET user_questions = ?, deep_keywords = ? WHERE thread_id = ?",
+            [(questions, keywords, thread_id) for thread_id, (questions, keywords) in signals.items()],
+        )
+
+    @staticmethod
+    def _backfill_offsets(conn):
+        """Tính vị trí byte trong history đã render cho các message đã có (chạy một lần khi thêm cột)"""
+        offsets = []
+        history_bytes: Dict[str, int] = {}
+        for thread_id, seq, role, content in conn.execute(
+            "SELECT thread_id, seq, role, content FROM session_messages ORDER BY thread_id, seq"
+        ):
+            start = history_bytes.get(thread_id, 0)
+            history_bytes[thread_id] = start + len(render_message(role, content).encode("utf-8"))
+            offsets.append((start, history_bytes[thread_id], thread_id, seq))
+        conn.executemany(
+            "UPDATE session_messages SET byte_start = ?, byte_end = ? WHERE thread_id = ? AND seq = ?", offsets
+        )
+        conn.executemany(
+            "UPDATE sessions SET history_bytes = ? WHERE thread_id = ?",
+            [(size, thread_id) for thread_id, size in history_bytes.items()],
+        )
+
+    @staticmethod
+    def _delete(conn, thread_ids: List[str]):
+        conn.executemany("DELETE FROM session_messages WHERE thread_id = ?", [(t,) for t in thread_ids])
+        conn.executemany("DELETE FROM sessions WHERE thread_id = ?", [(t,) for t in thread_ids])
+
+    def _ensure_row(self, conn, thread_id: str, now: float) -> Tuple[int, List[str]]:
+        """Tạo/cập nhật last_access của session trong transaction, trả về (message_count, thread đã xóa)"""
+        removed = []
+        row = conn.execute("SELECT last_access, message_count FROM sessions WHERE thread_id = ?", (thread_id,)).fetchone()
+        if row is not None and now - row[0] > self.ttl_seconds:
+            self._delete(conn, [thread_id])
+            removed.append(thread_id)
+            self.expirations += 1
+            row = None
+        if row is None:
+            conn.execute(
+                "INSERT INTO sessions (thread_id, last_access, nbytes) VALUES (?, ?, ?)",
+                (thread_id, now, _SESSION_OVERHEAD + sys.getsizeof(thread_id)),
+            )
+            return 0, removed
+        conn.execute("UPDATE sessions SET last_access = ? WHERE thread_id = ?", (now, thread_id))
+        return row[1], removed
+
+    def _enforce_limits_db(self, conn, keep: str, now: float) -> List[str]:
+        """Xóa session hết hạn rồi evict LRU cho tới khi dưới giới hạn (luôn giữ thread keep)"""
+        self._last_enforced = time.monotonic()
+        expired = [row[0] for row in conn.execute(
+            "SELECT thread_id FROM sessions WHERE last_access < ? AND thread_id != ?",
+            (now - self.ttl_seconds, keep),
+        )]
+        self._delete(conn, expired)
+        self.expirations += len(expired)
+
+        count, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM sessions").fetchone()
+        evicted = []
+        if count > self.max_sessions or total_bytes > self.max_bytes:
+            for thread_id, nbytes in conn.execute(
+                "SELECT thread_id, nbytes FROM sessions WHERE thread_id != ? ORDER BY last_access", (keep,)
+            ).fetchall():
+                if count <= self.max_sessions and total_bytes <= self.max_bytes:
+                    break
+                evicted.append(thread_id)
+                count -= 1
+                total_bytes -= nbytes
+            self._delete(conn, evicted)
+            self.evictions += len(evicted)
+        return expired + evicted
+
+    def _write(self, thread_id: str, apply: Callable):
+        """Chạy một thao tác ghi lên session trong transaction, dọn giới hạn và báo evict"""
+        now = time.time()
+        with self.pool.transaction() as conn:
+            message_count, removed = self._ensure_row(conn, thread_id, now)
+            apply(conn, message_count)
+            if message_count == 0 or time.monotonic() - self._last_enforced > _ENFORCE_INTERVAL_SECONDS:
+                removed.extend(self._enforce_limits_db(conn, thread_id, now))
+        self._notify_evicted(removed)
+
+    def _load(self, thread_id: str, start: int = 0, end: Optional[int] = None) -> Optional[Tuple[tuple, list]]:
+        """
+        Metadata của session và các dòng messages[start:end] (chỉ đọc đoạn cần dùng)
+
+        Returns:
+            (dòng sessions, list (role, content, created_at)), None nếu không có session
+        """
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT latest_level, level_reason, summary, summarized_count, last_access, nbytes, "
+                "user_questions, deep_keywords, message_count FROM sessions WHERE thread_id = ?",
+                (thread_id,),
+            ).fetchone()
+            if row is None or time.time() - row[4] > self.ttl_seconds:
+                return None
+            start, end, _ = slice(start, end).indices(row[8])
+            messages = conn.execute(
+                "SELECT role, content, created_at FROM session_messages "
+                "WHERE thread_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (thread_id, start, end),
+            ).fetchall() if start < end else []
+        return row, messages
+
+    def _touch(self, thread_id: str, create: bool) -> Optional[Session]:
+        if create:
+            self._write(thread_id, lambda conn, message_count: None)
+        return self.find_session(thread_id)
+
+    def find_session(self, thread_id: str) -> Optional[Session]:
+        """
+        Đọc cả session (mọi message của thread, không ghi DB, không làm mới last_access)
+
+        Đường xử lý request không dùng hàm này: get_compaction_state, get_records,
+        get_history_page, get_live_level chỉ đọc metadata và đoạn messages cần thiết.
+        """
+        loaded = self._load(thread_id)
+        if loaded is None:
+            return None
+        row, messages = loaded
+        session = Session(thread_id)
+        for role, content, created_at in messages:
+            session.append(role, content, created_at)
+        (session.latest_level, session.level_reason, session.summary, session.summarized_count,
+         session.last_access, session.nbytes, session.user_questions, session.deep_keywords) = row[:8]
+        return session
+
+    def get_compaction_state(self, thread_id: str) -> Optional[Dict]:
+        loaded = self._load(thread_id, 0, 0)
+        if loaded is None:
+            return None
+        row = loaded[0]
+        return {"summary": row[2], "summarized_count": row[3], "messages_count": row[8]}
+
+    def get_records(self, thread_id: str, start: int = 0, end: Optional[int] = None) -> List[MessageRecord]:
+        loaded = self._load(thread_id, start, end)
+        if loaded is None:
+            return []
+        return [MessageRecord(role, content, created_at) for role, content, created_at in loaded[1]]
+
+    def add_message(self, thread_id: str, role: str, content: str) -> MessageRecord:
+        record = MessageRecord(role, content)
+
+        questions, keywords = level_signals(role, content)
+        rendered_bytes = len(render_message(role, content).encode("utf-8"))
+
+        def apply(conn, message_count):
+            # Message nối vào cuối history đã render: [history_bytes, history_bytes + rendered_bytes)
+            conn.execute(
+                "INSERT INTO session_messages (thread_id, seq, role, content, created_at, byte_start, byte_end) "
+                "SELECT ?, ?, ?, ?, ?, history_bytes, history_bytes + ? FROM sessions WHERE thread_id = ?",
+                (thread_id, message_count, role, content, record.created_at, rendered_bytes, thread_id),
+            )
+            conn.execute(
+                "UPDATE sessions SET nbytes = nbytes + ?, message_count = message_count + 1, "
+                "user_questions = user_questions + ?, deep_keywords = deep_keywords | ?, "
+                "history_bytes = history_bytes + ? WHERE thread_id = ?",
+                (record.nbytes(), questions, keywords, rendered_bytes, thread_id),
+            )
+
+        self._write(thread_id, apply)
+        return record
+
+    def set_level(self, thread_id: str, level: str, reason: str):
+        self._write(thread_id, lambda conn, message_count: conn.execute(
+            "UPDATE sessions SET latest_level = ?, level_reason = ? WHERE thread_id = ?", (level, reason, thread_id)
+        ))
+
+    def _message_count(self, conn, thread_id: str) -> Optional[int]:
+        row = conn.execute("SELECT last_access, message_count FROM sessions WHERE thread_id = ?", (thread_id,)).fetchone()
+        if row is None or time.time() - row[0] > self.ttl_seconds:
+            return None
+        return row[1]
+
+    def get_conversation_history(self, thread_id: str) -> str:
+        page = self.get_history_page(thread_id)
+        return page["conversation_history"] if page else ""
+
+    def get_history_page(
+        self,
+        thread_id: str,
+        cursor: int = 0,
+        limit: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ) -> Optional[Dict]:
+        # Cắt trang theo vị trí byte đã lưu (như Session.page_end), chỉ đọc các dòng của trang
+        with self.pool.connection() as conn:
+            messages_count = self._message_count(conn, thread_id)
+            if messages_count is None:
+                return None
+            cursor = min(max(cursor, 0), messages_count)
+            end = messages_count if not limit else min(messages_count, cursor + limit)
+            if max_bytes is not None and end - cursor > 1:
+                # Message đầu tiên kết thúc sau start + max_bytes (luôn giữ ít nhất message cursor)
+                row = conn.execute(
+                    "SELECT seq FROM session_messages WHERE thread_id = ? AND byte_end > "
+                    "(SELECT byte_start FROM session_messages WHERE thread_id = ? AND seq = ?) + ? "
+                    "ORDER BY byte_end LIMIT 1",
+                    (thread_id, thread_id, cursor, max_bytes),
+                ).fetchone()
+                if row is not None:
+                    end = min(end, max(row[0], cursor + 1))
+            rows = conn.execute(
+                "SELECT role, content FROM session_messages WHERE thread_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (thread_id, cursor, end),
+            ).fetchall()
+        history = "".join(render_message(role, content) for role, content in rows)[:-1]
+        return history_page(history, cursor, end, messages_count)
+
+    def get_live_level(self, thread_id: str) -> Optional[Dict]:
+        # Chỉ đọc một dòng của bảng sessions
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT last_access, message_count, user_questions, deep_keywords FROM sessions WHERE thread_id = ?",
+                (thread_id,),
+            ).fetchone()
+        if row is None or time.time() - row[0] > self.ttl_seconds:
+            return None
+        return level_summary(*row[1:])
+
+    def get_summary(self, thread_id: str) -> str:
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT summary FROM sessions WHERE thread_id = ?", (thread_id,)).fetchone()
+        return row[0] if row else ""
+
+    def set_summary(self, thread_id: str, summary: str, summarized_count: int) -> bool:
+        with self.pool.transaction() as conn:
+            row = conn.execute("SELECT summary FROM sessions WHERE thread_id = ?", (thread_id,)).fetchone()
+            if row is None:
+                return False
+            return conn.execute(
+                "UPDATE sessions SET summary = ?, summarized_count = ?, nbytes = nbytes + ? "
+                "WHERE thread_id = ? AND summarized_count < ?",
+                (summary, summarized_count, sys.getsizeof(summary) - sys.getsizeof(row[0]),
+                 thread_id, summarized_count),
+            ).rowcount > 0
+
+    def clear_session(self, thread_id: str):
+        with self.pool.transaction() as conn:
+            self._delete(conn, [thread_id])
+        self._notify_evicted([thread_id])
+
+    def stats(self) -> Dict:
+        with self.pool.connection() as conn:
+            sessions, messages, total_bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(message_count), 0), COALESCE(SUM(nbytes), 0) FROM sessions"
+            ).fetchone()
+        return {
+            "backend": "sqlite",
+            "sessions": sessions,
+            "max_sessions": self.max_sessions,
+            "messages": messages,
+            "approx_bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            # Số evict/hết hạn do worker này thực hiện
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def create_session_memory() -> SessionMemory:
+    """SessionMemory theo PERSISTENCE_BACKEND (giới hạn cấu hình qua biến môi trường)"""
+    limits = dict(
+        max_sessions=int(os.getenv("SESSION_MAX_COUNT", "10000")),
+        max_bytes=int(float(os.getenv("SESSION_MAX_MB", "256")) * 1024 * 1024),
+        ttl_seconds=float(os.getenv("SESSION_TTL_SECONDS", "86400")),
+    )
+    if PERSISTENCE_BACKEND == "sqlite":
+        return SQLiteSessionMemory(get_pool(PERSISTENCE_DB_PATH), **limits)
+    return SessionMemory(**limits)
+
 
 # Global session memory instance
-session_memory = SessionMemory()
+session_memory = create_session_memory()
@@ -0,0 +1,64 @@
+"""
+Thu thập latency metrics theo từng request (in-process)
+
+Mỗi endpoint có một RequestMetrics giữ N mẫu gần nhất, dùng cho GET /metrics.
+"""
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+
+def _percentile(sorted_values: list, percent: float) -> float:
+    """Percentile theo nearest-rank trên list đã sort"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class RequestMetrics:
+    """Lưu total time và time-to-first-token (ms) của các request gần nhất"""
+
+    def __init__(self, max_samples: int = 1000):
+        self._total_ms = deque(maxlen=max_samples)
+        self._ttft_ms = deque(maxlen=max_samples)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def record(self, total_ms: float, ttft_ms: Optional[float] = None):
+        """Ghi nhận một request"""
+        with self._lock:
+            self._count += 1
+            self._total_ms.append(total_ms)
+            if ttft_ms is not None:
+                self._ttft_ms.append(ttft_ms)
+
+    def summary(self) -> Dict:
+        """Thống kê count/avg/p50/p95 trên các mẫu gần nhất"""
+        with self._lock:
+            total = sorted(self._total_ms)
+            ttft = sorted(self._ttft_ms)
+            count = self._count
+
+        def describe(values: list) -> Dict:
+            return {
+                "samples": len(values),
+                "avg_ms": round(sum(values) / len(values), 1) if values else 0.0,
+                "p50_ms": round(_percentile(values, 50), 1),
+                "p95_ms": round(_percentile(values, 95), 1),
+            }
+
+        return {
+            "requests": count,
+            "total_time": describe(total),
+            "time_to_first_token": describe(ttft),
+        }
+
+
+# Metrics toàn cục theo endpoint
+request_metrics: Dict[str, RequestMetrics] = {
+    "chat": RequestMetrics(),
+    "chat_stream": RequestMetrics(),
+    # answer_node khi confidence thấp (classify intent + re-retrieve + re-answer)
+    "answer_fallback": RequestMetrics(),
+}
@@ -0,0 +1,166 @@
+"""
+Mindmap store: lưu mindmap đã tạo trên đĩa (SQLite)
+
+Mindmap của một (lesson_id, topic) chỉ thay đổi khi transcript của bài thay
+đổi, nên không cần gọi gpt-4o mỗi request. Key gồm:
+- lesson_id
+- topic đã chuẩn hóa ("" = mindmap mặc định của cả bài)
+- lesson_version: hash nội dung bài (từ lesson digest), đổi khi bài được sửa
+
+Mindmap mặc định của mọi bài có thể được tạo sẵn sau khi build:
+    python vector_store/build_chroma.py --warm-mindmaps
+"""
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from .tools.retriever_tool import (
+    BASE_DIR,
+    DEFAULT_MINDMAP_QUERY,
+    get_lesson_context,
+    get_lesson_version,
+    list_digest_lessons,
+)
+
+
+def normalize_topic(topic: Optional[str]) -> str:
+    """Chuẩn hóa topic để làm key: NFC, chữ thường, bỏ dấu câu và khoảng trắng thừa"""
+    if not topic:
+        return ""
+    topic = unicodedata.normalize("NFC", topic).lower()
+    topic = re.sub(r"[^\w\s/]", " ", topic)
+    return " ".join(topic.split())
+
+
+class MindmapStore:
+    """Lưu mindmap theo (lesson_id, topic chuẩn hóa, lesson_version)"""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS mindmaps (
+                lesson_id TEXT NOT NULL,
+                topic_key TEXT NOT NULL,
+                lesson_version TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at INTEGER NOT NULL,
+                PRIMARY KEY (lesson_id, topic_key, lesson_version)
+            )
+            """
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, lesson_id: str, topic: Optional[str], lesson_version: str) -> Optional[Dict]:
+        """
+        Lấy mindmap đã lưu
+
+        Args:
+            lesson_id: ID bài giảng
+            topic: Topic của request ("" / None = mindmap mặc định)
+            lesson_version: Version nội dung hiện tại của bài
+
+        Returns:
+            Dict mindmap, hoặc None nếu chưa có
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM mindmaps WHERE lesson_id = ? AND topic_key = ? AND lesson_version = ?",
+                (lesson_id, normalize_topic(topic), lesson_version),
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, lesson_id: str, topic: Optional[str], lesson_version: str, data: Dict):
+        """Lưu mindmap, xóa các bản của version cũ của bài"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM mindmaps WHERE lesson_id = ? AND lesson_version != ?",
+                (lesson_id, lesson_version),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO mindmaps (lesson_id, topic_key, lesson_version, data, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (lesson_id, normalize_topic(topic), lesson_version,
+                 json.dumps(data, ensure_ascii=False), int(time.time())),
+            )
+            self._conn.commit()
+
+    async def aget(self, lesson_id: str, topic: Optional[str], lesson_version: str) -> Optional[Dict]:
+        """Bản async của get (I/O SQLite chạy trong thread pool, không block event loop)"""
+        return await asyncio.to_thread(self.get, lesson_id, topic, lesson_version)
+
+    async def aput(self, lesson_id: str, topic: Optional[str], lesson_version: str, data: Dict):
+        """Bản async của put (DELETE + INSERT + commit chạy trong thread pool)"""
+        await asyncio.to_thread(self.put, lesson_id, topic, lesson_version, data)
+
+    def stats(self) -> Dict:
+        """Thống kê hit/miss, dùng cho GET /metrics"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM mindmaps").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+    async def astats(self) -> Dict:
+        """Bản async của stats"""
+        return await asyncio.to_thread(self.stats)
+
+
+# Store toàn cục (nằm ngoài chroma_db để giữ lại qua các lần build)
+mindmap_store = MindmapStore(
+    os.getenv("MINDMAP_STORE_PATH", os.path.join(BASE_DIR, "data", "cache", "mindmaps.sqlite"))
+)
+
+
+def warm_default_mindmaps(lesson_ids: Optional[List[str]] = None) -> Dict:
+    """
+    Tạo sẵn mindmap mặc định (không topic) cho các bài chưa có trong store
+
+    Args:
+        lesson_ids: Các bài cần warmup (mặc định: mọi bài có lesson digest)
+
+    Returns:
+        Dict thống kê: generated, cached, failed
+    """
+    from .tools.mindmap_tool import MINDMAP_BUDGET, generate_mindmap_data_with_context
+
+    stats = {"generated": 0, "cached": 0, "failed": 0}
+    for lesson_id in lesson_ids or list_digest_lessons():
+        lesson_version = get_lesson_version(lesson_id)
+        if not lesson_version:
+            continue
+        if mindmap_store.get(lesson_id, "", lesson_version) is not None:
+            stats["cached"] += 1
+            continue
+
+        start = time.perf_counter()
+        data = generate_mindmap_data_with_context(DEFAULT_MINDMAP_QUERY, get_lesson_context(lesson_id, budget=MINDMAP_BUDGET))
+        if "error" in data:
+            stats["failed"] += 1
+            print(f"[MINDMAP] Không tạo được mindmap cho {lesson_id}")
+            continue
+        mindmap_store.put(lesson_id, "", lesson_version, data)
+        stats["generated"] += 1
+        print(f"[MINDMAP] Đã tạo mindmap cho {lesson_id} ({time.perf_counter() - start:.1f}s)")
+    return stats
@@ -0,0 +1,412 @@
+"""
+Lưu trữ bền vững bằng SQLite (WAL) cho checkpoint LangGraph và SessionMemory
+
+MemorySaver và SessionMemory trong RAM chỉ chạy được với một worker, restart là
+mất toàn bộ hội thoại. Với PERSISTENCE_BACKEND=sqlite, checkpointer của graph và
+session store dùng chung một file SQLite:
+- WAL mode: nhiều reader đọc song song với một writer, nhiều uvicorn worker trên
+  cùng máy dùng chung file và phục vụ được cùng một thread_id
+- Pool connection dùng chung trong process, mỗi lần ghi là một transaction
+  BEGIN IMMEDIATE (chờ busy_timeout nếu worker khác đang ghi)
+- Checkpoint lưu giá trị channel theo version (chỉ ghi channel thay đổi), chỉ giữ
+  MAX_CHECKPOINTS_PER_THREAD checkpoint gần nhất mỗi thread
+"""
+import asyncio
+import os
+import queue
+import random
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+
+# memory: MemorySaver + SessionMemory trong RAM | sqlite: dùng chung file SQLite
+PERSISTENCE_BACKEND = os.getenv("PERSISTENCE_BACKEND", "sqlite").lower()
+PERSISTENCE_DB_PATH = os.getenv("PERSISTENCE_DB_PATH", os.path.join(BASE_DIR, "data", "state", "agent_state.sqlite"))
+PERSISTENCE_POOL_SIZE = int(os.getenv("PERSISTENCE_POOL_SIZE", "4"))
+MAX_CHECKPOINTS_PER_THREAD = int(os.getenv("MAX_CHECKPOINTS_PER_THREAD", "20"))
+
+
+class SQLitePool:
+    """Pool connection SQLite (WAL, autocommit), an toàn khi dùng từ nhiều thread"""
+
+    def __init__(self, path: Union[str, Path], size: int = 4, busy_timeout: float = 10.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.size = size
+        self.busy_timeout = busy_timeout
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: tự quản lý transaction bằng BEGIN IMMEDIATE
+        conn = sqlite3.connect(str(self.path), timeout=self.busy_timeout, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Mượn một connection (tạo thêm nếu pool chưa đủ size, ngược lại chờ)"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            conn = self._connect() if create else self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Transaction ghi: BEGIN IMMEDIATE lấy write lock ngay, rollback nếu lỗi"""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+
+_pools: Dict[str, SQLitePool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path: Union[str, Path] = PERSISTENCE_DB_PATH) -> SQLitePool:
+    """Pool dùng chung cho một file SQLite trong process (checkpointer + session store)"""
+    key = str(Path(path).resolve())
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = SQLitePool(path, size=PERSISTENCE_POOL_SIZE)
+        return _pools[key]
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver[str]):
+    """
+    Checkpointer LangGraph lưu trong SQLite
+
+    Cấu trúc giống MemorySaver: checkpoint (không kèm giá trị channel), giá trị channel
+    theo (channel, version) và pending writes theo checkpoint.
+    """
+
+    def __init__(self, pool: SQLitePool, max_checkpoints: int = MAX_CHECKPOINTS_PER_THREAD, serde=None):
+        super().__init__(serde=serde)
+        self.pool = pool
+        self.max_checkpoints = max_checkpoints
+        with self.pool.connection() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL,
+                    checkpoint_id TEXT NOT NULL,
+                    parent_checkpoint_id TEXT,
+                    type TEXT NOT NULL,
+                    checkpoint BLOB NOT NULL,
+                    metadata_type TEXT NOT NULL,
+                    metadata BLOB NOT NULL,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+                );
+                CREATE TABLE IF NOT EXISTS checkpoint_blobs (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL,
+                    channel TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    value BLOB,
+                    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+                );
+                CREATE TABLE IF NOT EXISTS checkpoint_writes (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL,
+                    checkpoint_id TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    channel TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    value BLOB,
+                    task_path TEXT NOT NULL DEFAULT '',
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                );
+                """
+            )
+
+    # ---- đọc ----
+
+    def _load_blobs(self, conn: sqlite3.Connection, thread_id: str, checkpoint_ns: str,
+                    versions: ChannelVersions) -> Dict[str, Any]:
+        values = {}
+        for channel, version in versions.items():
+            row = conn.execute(
+                "SELECT type, value FROM checkpoint_blobs "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version)),
+            ).fetchone()
+            if row is None or row[0] == "empty":
+                continue
+            values[channel] = self.serde.loads_typed((row[0], row[1]))
+        return values
+
+    def _load_writes(self, conn: sqlite3.Connection, thread_id: str, checkpoint_ns: str,
+                     checkpoint_id: str) -> List[Tuple[str, str, Any]]:
+        rows = conn.execute(
+            "SELECT task_id, channel, type, value FROM checkpoint_writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_path, task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return [(task_id, channel, self.serde.loads_typed((type_, value))) for task_id, channel, type_, value in rows]
+
+    def _to_tuple(self, conn: sqlite3.Connection, thread_id: str, checkpoint_ns: str, row) -> CheckpointTuple:
+        checkpoint_id, parent_checkpoint_id, type_, checkpoint_blob, metadata_type, metadata_blob = row
+        checkpoint: Checkpoint = self.serde.loads_typed((type_, checkpoint_blob))
+        return CheckpointTuple(
+            config={"configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint_id,
+            }},
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._load_blobs(conn, thread_id, checkpoint_ns, checkpoint["channel_versions"]),
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata_blob)),
+            parent_config=(
+                {"configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": parent_checkpoint_id,
+                }}
+                if parent_checkpoint_id else None
+            ),
+            pending_writes=self._load_writes(conn, thread_id, checkpoint_ns, checkpoint_id),
+        )
+
+    _COLUMNS = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Checkpoint theo checkpoint_id trong config, hoặc checkpoint mới nhất của thread"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        with self.pool.connection() as conn:
+            if checkpoint_id:
+                row = conn.execute(
+                    f"SELECT {self._COLUMNS} FROM checkpoints "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = conn.execute(
+                    f"SELECT {self._COLUMNS} FROM checkpoints "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+            return self._to_tuple(conn, thread_id, checkpoint_ns, row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        """Liệt kê checkpoint (mới nhất trước), lọc theo thread/namespace/metadata"""
+        where, params = [], []
+        if config:
+            where.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            checkpoint_ns = config["configurable"].get("checkpoint_ns")
+            if checkpoint_ns is not None:
+                where.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id < ?")
+            params.append(before_id)
+        sql = f"SELECT thread_id, checkpoint_ns, {self._COLUMNS} FROM checkpoints"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY checkpoint_id DESC"
+
+        with self.pool.connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+            results = []
+            for thread_id, checkpoint_ns, *row in rows:
+                if limit is not None and len(results) >= limit:
+                    break
+                if filter:
+                    metadata = self.serde.loads_typed((row[4], row[5]))
+                    if not all(metadata.get(key) == value for key, value in filter.items()):
+                        continue
+                results.append(self._to_tuple(conn, thread_id, checkpoint_ns, row))
+        yield from results
+
+    # ---- ghi ----
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Lưu checkpoint + giá trị các channel có version mới"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        checkpoint = checkpoint.copy()
+        values = checkpoint.pop("channel_values")
+
+        blobs = []
+        for channel, version in new_versions.items():
+            type_, value = self.serde.dumps_typed(values[channel]) if channel in values else ("empty", None)
+            blobs.append((thread_id, checkpoint_ns, channel, str(version), type_, value))
+        type_, checkpoint_blob = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        with self.pool.transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO checkpoint_blobs VALUES (?, ?, ?, ?, ?, ?)", blobs)
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 type_, checkpoint_blob, metadata_type, metadata_blob),
+            )
+            self._prune(conn, thread_id, checkpoint_ns)
+
+        return {"configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint["id"],
+        }}
+
+    def _prune(self, conn: sqlite3.Connection, thread_id: str, checkpoint_ns: str):
+        """Chỉ giữ max_checkpoints checkpoint gần nhất, xóa writes/blobs không còn dùng"""
+        row = conn.execute(
+            "SELECT checkpoint_id, type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?",
+            (thread_id, checkpoint_ns, self.max_checkpoints - 1),
+        ).fetchone()
+        if row is None:
+            return
+        oldest_id, type_, checkpoint_blob = row
+        deleted = conn.execute(
+            "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+            (thread_id, checkpoint_ns, oldest_id),
+        ).rowcount
+        if not deleted:
+            return
+        conn.execute(
+            "DELETE FROM checkpoint_writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+            (thread_id, checkpoint_ns, oldest_id),
+        )
+        # Version của mỗi channel tăng dần: blob cũ hơn version mà checkpoint giữ lại
+        # cũ nhất đang dùng thì không checkpoint nào còn tham chiếu
+        versions = self.serde.loads_typed((type_, checkpoint_blob))["channel_versions"]
+        conn.executemany(
+            "DELETE FROM checkpoint_blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version < ?",
+            [(thread_id, checkpoint_ns, channel, str(version)) for channel, version in versions.items()],
+        )
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """Lưu pending writes của một task"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                         channel, type_, blob, task_path))
+        # Write đặc biệt (idx < 0, VD: lỗi/interrupt) được ghi đè, write thường giữ bản đầu tiên
+        replace = all(row[4] < 0 for row in rows)
+        with self.pool.transaction() as conn:
+            conn.executemany(
+                f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO checkpoint_writes "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Xóa toàn bộ checkpoint của thread"""
+        with self.pool.transaction() as conn:
+            for table in ("checkpoints", "checkpoint_blobs", "checkpoint_writes"):
+                conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    def get_next_version(self, current: Optional[str], channel: None = None) -> str:
+        # Giống MemorySaver: "<số thứ tự 32 chữ số>.<ngẫu nhiên>", so sánh được dạng chuỗi
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # ---- async: chạy bản sync trong thread pool, không block event loop ----
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def create_checkpointer() -> BaseCheckpointSaver:
+    """Checkpointer cho graph theo PERSISTENCE_BACKEND"""
+    if PERSISTENCE_BACKEND == "sqlite":
+        print(f"[PERSISTENCE] Checkpoint lưu trong SQLite: {PERSISTENCE_DB_PATH}")
+        return SQLiteCheckpointSaver(get_pool(PERSISTENCE_DB_PATH))
+    from langgraph.checkpoint.memory import MemorySaver
+    return MemorySaver()
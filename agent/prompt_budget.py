@@ -0,0 +1,193 @@
+"""
+Ghép prompt theo ngân sách token (context + tóm tắt + history)
+
+Kích thước context từng cố định theo số chunk (k=7, k=10, ...) bất kể chunk dài
+hay ngắn. Mỗi call site giờ khai báo ngân sách token của mình bằng declare_budget,
+các phần của prompt được đếm token bằng tiktoken và xếp vào ngân sách:
+- Chunk đã retrieve giữ thứ tự relevance; chunk không vừa được cắt gọn tại ranh
+  giới câu/dòng nếu phần ngân sách còn lại đủ lớn, ngược lại bị bỏ
+- History ưu tiên lượt mới nhất; khi lượt cũ bị bỏ thì thêm rolling summary
+  để giữ ý chính của phần đã bỏ
+
+Thống kê token đã dùng/bỏ của từng call site có trong GET /metrics.
+"""
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from vector_store.tokens import count_tokens, truncate_to_tokens
+
+# Chỉ cắt gọn một chunk/lượt hội thoại khi còn ít nhất chừng này token
+MIN_TRUNCATED_TOKENS = 80
+
+# Tóm tắt chiếm tối đa 1/3 ngân sách history
+_SUMMARY_SHARE = 3
+
+
+def _source_header(index: int, source: str) -> str:
+    # Giống format_results của retriever_tool
+    return f"[Nguồn {index}: {source}]\n"
+
+
+def pack_chunks(chunks: List[Dict], max_tokens: int) -> Tuple[List[Dict], int, int]:
+    """
+    Chọn các chunk (đã xếp theo relevance) vừa với ngân sách token
+
+    Args:
+        chunks: List dict content/source/lesson_id, chunk liên quan nhất đứng đầu
+        max_tokens: Ngân sách token cho toàn bộ context (tính cả dòng nguồn)
+
+    Returns:
+        (chunks đã chọn, số token đã dùng, số token bị bỏ)
+    """
+    packed = []
+    used = 0
+    dropped = 0
+
+    for result in chunks:
+        content = result.get("content", "")
+        header_tokens = count_tokens(_source_header(len(packed) + 1, result.get("source", "unknown"))) + 1
+        content_tokens = count_tokens(content)
+        remaining = max_tokens - used - header_tokens
+
+        if content_tokens > remaining:
+            # Chunk liên quan nhất luôn được giữ; các chunk sau chỉ được cắt gọn
+            # khi phần ngân sách còn lại đủ dùng
+            if packed and remaining < MIN_TRUNCATED_TOKENS:
+                dropped += content_tokens
+                continue
+            content = truncate_to_tokens(content, max(remaining, MIN_TRUNCATED_TOKENS))
+            kept = count_tokens(content)
+            dropped += content_tokens - kept
+            content_tokens = kept
+            result = {**result, "content": content}
+
+        packed.append(result)
+        used += header_tokens + content_tokens
+
+    return packed, used, dropped
+
+
+def pack_history(summary: str, turns: List[str], max_tokens: int) -> Tuple[str, int, int]:
+    """
+    Xếp các lượt hội thoại gần nhất (và tóm tắt nếu cần) vào ngân sách token
+
+    Args:
+        summary: Rolling summary của phần hội thoại cũ ("" nếu chưa có)
+        turns: Các lượt hội thoại theo thứ tự thời gian ("Học sinh: ...", "Trợ giảng: ...")
+        max_tokens: Ngân sách token cho history
+
+    Returns:
+        (history dạng text, số token đã dùng, số token bị bỏ)
+    """
+    turn_tokens = [count_tokens(turn) + 1 for turn in turns]
+    total = sum(turn_tokens)
+    if total <= max_tokens:
+        return "\n".join(turns), total, 0
+
+    # Không vừa hết: dành một phần ngân sách cho tóm tắt phần bị bỏ
+    summary_text = f"Tóm tắt phần trước: {summary}" if summary else ""
+    summary_budget = min(count_tokens(summary_text), max_tokens // _SUMMARY_SHARE)
+    remaining = max_tokens - summary_budget
+
+    selected = []
+    for turn, tokens in zip(reversed(turns), reversed(turn_tokens)):
+        if tokens > remaining:
+            if not selected and remaining >= MIN_TRUNCATED_TOKENS:
+                # Lượt mới nhất quá dài: giữ phần đầu
+                selected.append(truncate_to_tokens(turn, remaining - 1))
+            break
+        selected.append(turn)
+        remaining -= tokens
+    selected.reverse()
+
+    if summary_text:
+        selected.insert(0, truncate_to_tokens(summary_text, summary_budget + remaining))
+
+    text = "\n".join(selected)
+    used = count_tokens(text)
+    return text, used, max(0, total - used)
+
+
+class PromptBudget:
+    """Ngân sách token của một call site, kèm thống kê token đã dùng/bỏ"""
+
+    def __init__(self, name: str, context_tokens: int, history_tokens: Optional[int] = None):
+        self.name = name
+        self.context_tokens = context_tokens
+        self.history_tokens = history_tokens
+        self._lock = threading.Lock()
+        # section -> [số lần, token đã dùng, token bị bỏ]
+        self._sections: Dict[str, List[int]] = {}
+
+    def _record(self, section: str, used: int, dropped: int):
+        with self._lock:
+            counters = self._sections.setdefault(section, [0, 0, 0])
+            counters[0] += 1
+            counters[1] += used
+            counters[2] += dropped
+
+    def pack_chunks(self, chunks: List[Dict], max_tokens: Optional[int] = None) -> List[Dict]:
+        """Chọn chunk vừa ngân sách context (xem pack_chunks)"""
+        packed, used, dropped = pack_chunks(chunks, max_tokens or self.context_tokens)
+        self._record("context", used, dropped)
+        return packed
+
+    def pack_history(self, summary: str, turns: List[str]) -> str:
+        """Xếp history vừa ngân sách history (xem pack_history)"""
+        if self.history_tokens is None:
+            raise ValueError(f"Call site {self.name} không khai báo ngân sách history")
+        text, used, dropped = pack_history(summary, turns, self.history_tokens)
+        self._record("history", used, dropped)
+        return text
+
+    def stats(self) -> Dict:
+        """Token trung bình đã dùng/bỏ cho mỗi phần của prompt"""
+        with self._lock:
+            sections = {
+                section: {
+                    "calls": calls,
+                    "avg_tokens": round(used / calls, 1),
+                    "avg_dropped_tokens": round(dropped / calls, 1),
+                }
+                for section, (calls, used, dropped) in self._sections.items()
+            }
+        budget = {"context_tokens": self.context_tokens}
+        if self.history_tokens is not None:
+            budget["history_tokens"] = self.history_tokens
+        return {**budget, **sections}
+
+
+_budgets: Dict[str, PromptBudget] = {}
+
+
+def declare_budget(name: str, context_tokens: int, history_tokens: Optional[int] = None) -> PromptBudget:
+    """
+    Khai báo ngân sách token cho một call site
+
+    Ghi đè bằng biến môi trường PROMPT_BUDGET_<NAME>_CONTEXT / PROMPT_BUDGET_<NAME>_HISTORY.
+
+    Args:
+        name: Tên call site ("answer", "analyzer", ...)
+        context_tokens: Ngân sách cho context bài học
+        history_tokens: Ngân sách cho tóm tắt + lịch sử hội thoại, None nếu prompt
+            của call site không có history
+
+    Returns:
+        PromptBudget dùng chung cho call site
+    """
+    if name not in _budgets:
+        prefix = f"PROMPT_BUDGET_{name.upper()}"
+        if history_tokens is not None:
+            history_tokens = int(os.getenv(f"{prefix}_HISTORY", str(history_tokens)))
+        _budgets[name] = PromptBudget(
+            name,
+            context_tokens=int(os.getenv(f"{prefix}_CONTEXT", str(context_tokens))),
+            history_tokens=history_tokens,
+        )
+    return _budgets[name]
+
+
+def prompt_budget_stats() -> Dict:
+    """Thống kê của mọi call site (cho GET /metrics)"""
+    return {name: budget.stats() for name, budget in _budgets.items()}
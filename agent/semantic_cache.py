@@ -0,0 +1,257 @@
+"""
+Semantic answer cache cho answer_node
+
+Nhiều học sinh cùng một bài hay hỏi lại cùng một câu ("Phân số là gì?").
+Cache lưu câu trả lời theo (lesson_id, embedding của câu hỏi): câu hỏi mới có
+cosine similarity >= threshold với câu đã trả lời thì dùng lại câu trả lời,
+bỏ qua cả retrieval lẫn LLM call.
+
+- LRU + TTL, giới hạn số entry
+- Tự xóa toàn bộ khi vector store được build lại (INDEX_VERSION thay đổi)
+- Thống kê hit/miss và thời gian LLM ước tính đã tiết kiệm
+- Không embed được (RETRIEVER_MODE=lexical, chưa có embedding model): chỉ so khớp
+  chính xác câu hỏi đã chuẩn hóa, không gọi embedding API
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from vector_store.index_version import IndexVersionWatcher
+from .tools.retriever_tool import CHROMA_DB_PATH, aembed_query, can_embed_queries
+
+
+class _CacheEntry:
+    """Một câu trả lời đã cache"""
+
+    __slots__ = ("lesson_id", "query", "vector", "answer", "created_at", "cost_seconds")
+
+    def __init__(self, lesson_id: str, query: str, vector: Optional[np.ndarray], answer: str, cost_seconds: float):
+        self.lesson_id = lesson_id
+        self.query = query
+        self.vector = vector
+        self.answer = answer
+        self.created_at = time.monotonic()
+        self.cost_seconds = cost_seconds
+
+
+def _normalize_query(query: str) -> str:
+    """Chuẩn hóa để so khớp chính xác (bỏ hoa/thường, khoảng trắng thừa)"""
+    return " ".join(query.lower().split())
+
+
+class SemanticAnswerCache:
+    """Cache câu trả lời theo lesson_id + embedding của câu hỏi"""
+
+    def __init__(
+        self,
+        embed_query: Callable[[str], Awaitable[List[float]]],
+        can_embed: Callable[[], bool] = lambda: True,
+        db_path: str = CHROMA_DB_PATH,
+        threshold: float = 0.95,
+        max_entries: int = 1000,
+        ttl_seconds: float = 3600,
+        enabled: bool = True,
+    ):
+        self.embed_query = embed_query
+        self.can_embed = can_embed
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+
+        # key -> entry, thứ tự LRU (cũ nhất ở đầu)
+        self._entries: "OrderedDict[int, _CacheEntry]" = OrderedDict()
+        self._by_lesson: Dict[str, List[int]] = {}
+        self._exact: Dict[tuple, int] = {}
+        self._matrices: Dict[str, Tuple[List[int], np.ndarray]] = {}
+        self._next_key = 0
+
+        # Embedding/thời điểm miss của câu hỏi gần đây, để astore không phải embed lại
+        self._pending: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+        self._version_watcher = IndexVersionWatcher(db_path)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+
+    def _check_index_version(self):
+        """Xóa cache nếu vector store đã được build lại"""
+        if self._version_watcher.changed():
+            if self._entries:
+                print(f"[SEMANTIC CACHE] Index version mới ({self._version_watcher.version}), xóa {len(self._entries)} entries")
+            self.clear()
+            self.invalidations += 1
+
+    def _remove(self, key: int):
+        entry = self._entries.pop(key)
+        self._by_lesson[entry.lesson_id].remove(key)
+        self._exact.pop((entry.lesson_id, _normalize_query(entry.query)), None)
+        self._matrices.pop(entry.lesson_id, None)
+
+    def _is_expired(self, entry: _CacheEntry, now: float) -> bool:
+        return now - entry.created_at > self.ttl_seconds
+
+    def _purge_expired(self, lesson_id: str):
+        now = time.monotonic()
+        for key in list(self._by_lesson.get(lesson_id, [])):
+            if self._is_expired(self._entries[key], now):
+                self._remove(key)
+                self.expirations += 1
+
+    def _lesson_matrix(self, lesson_id: str) -> Tuple[List[int], np.ndarray]:
+        """Ma trận embedding (đã normalize) của các entry có embedding trong lesson, kèm key của từng dòng"""
+        cached = self._matrices.get(lesson_id)
+        if cached is None:
+            keys = [key for key in self._by_lesson.get(lesson_id, []) if self._entries[key].vector is not None]
+            matrix = np.stack([self._entries[key].vector for key in keys]) if keys else np.empty((0, 0), dtype=np.float32)
+            cached = self._matrices[lesson_id] = (keys, matrix)
+        return cached
+
+    def _hit(self, key: int) -> str:
+        entry = self._entries[key]
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.saved_seconds += entry.cost_seconds
+        return entry.answer
+
+    async def alookup(self, lesson_id: str, query: str) -> Optional[str]:
+        """
+        Tìm câu trả lời đã cache cho câu hỏi tương tự
+
+        Args:
+            lesson_id: ID bài giảng ("" nếu không có)
+            query: Câu hỏi của học sinh
+
+        Returns:
+            Câu trả lời đã cache, hoặc None nếu miss
+        """
+        if not self.enabled or not query:
+            return None
+
+        self._check_index_version()
+        lesson_id = lesson_id or ""
+        self._purge_expired(lesson_id)
+
+        # Trùng khớp chính xác: không cần embed
+        key = self._exact.get((lesson_id, _normalize_query(query)))
+        if key is not None:
+            return self._hit(key)
+
+        # Không embed được (mode lexical): chỉ dùng trùng khớp chính xác
+        vector = None
+        if self.can_embed():
+            try:
+                vector = np.asarray(await self.embed_query(query), dtype=np.float32)
+            except Exception as e:
+                print(f"[SEMANTIC CACHE] Lỗi khi embed query: {e}")
+                self.misses += 1
+                return None
+
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                vector = vector / norm
+
+            keys, matrix = self._lesson_matrix(lesson_id)
+            if matrix.shape[0]:
+                similarities = matrix @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    return self._hit(keys[best])
+
+        self.misses += 1
+        self._pending[(lesson_id, query)] = (vector, time.perf_counter())
+        while len(self._pending) > 256:
+            self._pending.popitem(last=False)
+        return None
+
+    async def astore(self, lesson_id: str, query: str, answer: str):
+        """
+        Lưu câu trả lời vào cache (gọi sau khi answer_node trả lời xong)
+
+        Args:
+            lesson_id: ID bài giảng ("" nếu không có)
+            query: Câu hỏi của học sinh
+            answer: Câu trả lời
+        """
+        if not self.enabled or not query or not answer:
+            return
+
+        lesson_id = lesson_id or ""
+        pending = self._pending.pop((lesson_id, query), None)
+        if pending is not None:
+            vector, missed_at = pending
+            cost_seconds = time.perf_counter() - missed_at
+        elif not self.can_embed():
+            vector, cost_seconds = None, 0.0
+        else:
+            try:
+                vector = np.asarray(await self.embed_query(query), dtype=np.float32)
+            except Exception as e:
+                print(f"[SEMANTIC CACHE] Lỗi khi embed query: {e}")
+                return
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                vector = vector / norm
+            cost_seconds = 0.0
+
+        exact_key = (lesson_id, _normalize_query(query))
+        if exact_key in self._exact:
+            self._remove(self._exact[exact_key])
+
+        key = self._next_key
+        self._next_key += 1
+        self._entries[key] = _CacheEntry(lesson_id, query, vector, answer, cost_seconds)
+        self._by_lesson.setdefault(lesson_id, []).append(key)
+        self._exact[exact_key] = key
+        self._matrices.pop(lesson_id, None)
+
+        # LRU eviction
+        while len(self._entries) > self.max_entries:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def clear(self):
+        """Xóa toàn bộ cache"""
+        self._entries.clear()
+        self._by_lesson.clear()
+        self._exact.clear()
+        self._matrices.clear()
+        self._pending.clear()
+
+    def stats(self) -> Dict:
+        """Thống kê hit/miss, dùng cho GET /metrics"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "saved_seconds": round(self.saved_seconds, 2),
+            "index_version": self._version_watcher.version,
+        }
+
+
+# Cache toàn cục cho answer_node (cấu hình qua biến môi trường)
+answer_cache = SemanticAnswerCache(
+    embed_query=aembed_query,
+    can_embed=can_embed_queries,
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000")),
+    ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600")),
+    enabled=os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1",
+)
@@ -0,0 +1,93 @@
+"""
+Hỗ trợ streaming token-level cho /chat/stream
+
+- Tag gắn vào các LLM sinh câu trả lời cho học sinh, để endpoint chỉ stream
+  token của các LLM này (bỏ qua token của classifier, validator...)
+- JsonFieldStreamer: tách dần giá trị của một field trong JSON đang được stream
+  (answer_with_confidence dùng JSON mode nên token là JSON thô)
+"""
+import re
+
+# LLM trả về text thuần cho học sinh (explain, answer fallback)
+STREAM_TAG_TEXT = "stream:text"
+
+# LLM JSON mode, câu trả lời nằm trong field "answer"
+STREAM_TAG_JSON_ANSWER = "stream:json_answer"
+
+_JSON_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+class JsonFieldStreamer:
+    """
+    Giải mã dần giá trị string của một field trong JSON đang được stream
+
+    Ví dụ: feed('{"answer": "Phân') -> "Phân", feed(' số"...') -> " số"
+    """
+
+    def __init__(self, field: str = "answer"):
+        self._key_pattern = re.compile(r'"' + re.escape(field) + r'"\s*:\s*"')
+        self._buffer = ""
+        self._pos = None  # Vị trí ký tự tiếp theo cần đọc trong giá trị
+        self._done = False
+
+    def feed(self, text: str) -> str:
+        """
+        Nhận thêm một đoạn JSON, trả về phần text mới giải mã được của field
+
+        Args:
+            text: Đoạn JSON mới nhận từ LLM
+
+        Returns:
+            Phần giá trị mới (có thể rỗng nếu chưa đủ dữ liệu)
+        """
+        if self._done:
+            return ""
+
+        self._buffer += text
+
+        if self._pos is None:
+            match = self._key_pattern.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        buffer = self._buffer
+        i = self._pos
+        out = []
+        while i < len(buffer):
+            ch = buffer[i]
+            if ch == "\\":
+                # Chờ đủ escape sequence rồi mới giải mã
+                if i + 1 >= len(buffer):
+                    break
+                esc = buffer[i + 1]
+                if esc == "u":
+                    if i + 6 > len(buffer):
+                        break
+                    try:
+                        out.append(chr(int(buffer[i + 2:i + 6], 16)))
+                    except ValueError:
+                        pass
+                    i += 6
+                    continue
+                out.append(_JSON_ESCAPES.get(esc, esc))
+                i += 2
+                continue
+            if ch == '"':
+                self._done = True
+                i += 1
+                break
+            out.append(ch)
+            i += 1
+
+        self._pos = i
+        return "".join(out)
@@ -2,10 +2,13 @@
 Analyzer tool - Phân tích buổi học
 """
 import os
+import re
+from typing import Optional
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_core.tools import tool
+from ..llm_registry import get_llm
+from ..prompt_budget import declare_budget
 from ..prompts import ANALYZER_PROMPT
 from .retriever_tool import get_context
 from .level_assessment_tool import assess_student_level_from_conversation
@@ -14,7 +17,13 @@ from .level_assessment_tool import assess_student_level_from_conversation
 load_dotenv()
 
 # Tối ưu: Dùng GPT-3.5-turbo cho analyzer (rẻ hơn, vẫn đủ tốt)
-llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
+llm = get_llm("analyzer")
+
+# Ngân sách token: transcript bài học + (tóm tắt + các lượt hội thoại gần nhất)
+ANALYZER_BUDGET = declare_budget("analyzer", context_tokens=2500, history_tokens=1500)
+
+# Mỗi lượt hội thoại bắt đầu bằng "Học sinh: " hoặc "Trợ giảng: " (nội dung có thể nhiều dòng)
+_TURN_SPLIT_RE = re.compile(r"\n(?=(?:Học sinh|Trợ giảng): )")
 
 @tool
 def analyze_session(conversation_history: str, topic: str = "") -> str:
@@ -30,54 +39,80 @@ def analyze_session(conversation_history: str, topic: str = "") -> str:
     """
     # Lấy transcript tổng quan (hoặc theo topic nếu có)
     query = topic if topic else "Toán lớp 4"
-    transcript = get_context(query, k=10)
+    transcript = get_context(query, k=10, budget=ANALYZER_BUDGET)
     
-    # Tạo prompt
+    # Gọi LLM
+    response = llm.invoke(_build_analyzer_messages(conversation_history, transcript))
+    return response.content
+
+def _build_analyzer_messages(conversation_history: str, transcript: str, summary: str = "") -> list:
+    """Tạo messages cho phân tích buổi học (history được cắt theo ngân sách token)"""
+    turns = _TURN_SPLIT_RE.split(conversation_history) if conversation_history else []
     prompt = ANALYZER_PROMPT.format(
         transcript=transcript,
-        conversation_history=conversation_history
+        conversation_history=ANALYZER_BUDGET.pack_history(summary, turns)
     )
     
-    # Gọi LLM
-    messages = [
+    return [
         SystemMessage(content="Bạn là cô giáo Toán lớp 4 thân thiện, đang viết nhận xét cho em học sinh sau buổi học. Giọng điệu nhẹ nhàng, động viên, đầy tình cảm."),
         HumanMessage(content=prompt)
     ]
+
+
+def _build_analysis_result(conversation_history: str, analysis: str, level: Optional[dict] = None) -> dict:
+    """Gộp phân tích với đánh giá level (rule-based, không gọi LLM)"""
+    if level is not None:
+        level_result = level
+    else:
+        messages_count = conversation_history.count("\n") // 2  # Ước lượng số cặp Q&A
+        level_result = assess_student_level_from_conversation(conversation_history, messages_count)
     
-    response = llm.invoke(messages)
-    return response.content
+    return {
+        "analysis": analysis,
+        "level": level_result.get("level", "Beginner"),
+        "level_reason": level_result.get("reason", "")
+    }
+
 
-def analyze_with_data(conversation_history: str, transcript: str) -> dict:
+def analyze_with_data(
+    conversation_history: str,
+    transcript: str,
+    summary: str = "",
+    level: Optional[dict] = None,
+) -> dict:
     """
     Phân tích với dữ liệu đã được cung cấp sẵn, bao gồm đánh giá level
     
     Args:
-        conversation_history: Lịch sử hội thoại
+        conversation_history: Lịch sử hội thoại (dùng đầy đủ cho đánh giá level)
         transcript: Nội dung bài giảng
+        summary: Rolling summary của thread, thay cho các lượt cũ không vừa ngân sách
+        level: Level đã tính sẵn (SessionMemory.get_live_level), None thì tính từ conversation_history
         
     Returns:
         dict: {"analysis": str, "level": str, "level_reason": str}
     """
-    # Phân tích buổi học
-    prompt = ANALYZER_PROMPT.format(
-        transcript=transcript,
-        conversation_history=conversation_history
-    )
-    
-    messages = [
-        SystemMessage(content="Bạn là cô giáo Toán lớp 4 thân thiện, đang viết nhận xét cho em học sinh sau buổi học. Giọng điệu nhẹ nhàng, động viên, đầy tình cảm."),
-        HumanMessage(content=prompt)
-    ]
-    
-    response = llm.invoke(messages)
-    analysis = response.content
-    
-    # Đánh giá level dựa trên conversation (rule-based, không gọi LLM)
-    messages_count = conversation_history.count("\n") // 2  # Ước lượng số cặp Q&A
-    level_result = assess_student_level_from_conversation(conversation_history, messages_count)
+    response = llm.invoke(_build_analyzer_messages(conversation_history, transcript, summary))
+    return _build_analysis_result(conversation_history, response.content, level)
+
+
+async def aanalyze_with_data(
+    conversation_history: str,
+    transcript: str,
+    summary: str = "",
+    level: Optional[dict] = None,
+) -> dict:
+    """
+    Bản async của analyze_with_data (không block event loop)
     
-    return {
-        "analysis": analysis,
-        "level": level_result.get("level", "Beginner"),
-        "level_reason": level_result.get("reason", "")
-    }
+    Args:
+        conversation_history: Lịch sử hội thoại (dùng đầy đủ cho đánh giá level)
+        transcript: Nội dung bài giảng
+        summary: Rolling summary của thread, thay cho các lượt cũ không vừa ngân sách
+        level: Level đã tính sẵn (SessionMemory.get_live_level), None thì tính từ conversation_history
+        
+    Returns:
+        dict: {"analysis": str, "level": str, "level_reason": str}
+    """
+    response = await llm.ainvoke(_build_analyzer_messages(conversation_history, transcript, summary))
+    return _build_analysis_result(conversation_history, response.content, level)
@@ -1,19 +1,25 @@
 """
 Answer tool - Trả lời câu hỏi ngắn gọn
 """
+import json
 import os
+from typing import Optional
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
+from ..llm_registry import get_llm
 from ..prompts import SYSTEM_PROMPT, NORMAL_ANSWER_PROMPT
 from .retriever_tool import get_context
 
 # Load environment variables
 load_dotenv()
 
-# Tối ưu: Dùng GPT-3.5-turbo cho normal mode (rẻ hơn 10 lần GPT-4)
-llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
+# Tag để /chat/stream stream token của câu trả lời
+llm = get_llm("answer")
+
+# LLM JSON mode cho confidence scoring (dùng chung cho bản sync và async)
+llm_json = get_llm("answer_json")
 
 @tool
 def answer_question(query: str) -> str:
@@ -41,42 +47,39 @@ def answer_question(query: str) -> str:
     response = llm.invoke(messages)
     return response.content
 
-def answer_with_context(query: str, context: str) -> str:
-    """
-    Trả lời câu hỏi với ngữ cảnh đã được cung cấp sẵn
-    
-    Args:
-        query: Câu hỏi của học sinh
-        context: Ngữ cảnh từ bài giảng
-        
-    Returns:
-        Câu trả lời ngắn gọn
-    """
+def _build_answer_messages(query: str, context: str) -> list:
+    """Tạo messages cho chế độ trả lời ngắn gọn"""
     prompt = NORMAL_ANSWER_PROMPT.format(context=context, question=query)
     
-    messages = [
+    return [
         SystemMessage(content=SYSTEM_PROMPT),
         HumanMessage(content=prompt)
     ]
-    
-    response = llm.invoke(messages)
-    return response.content
 
 
-def answer_with_confidence(query: str, context: str) -> dict:
+def answer_with_context(query: str, context: str) -> str:
     """
-    Trả lời câu hỏi với confidence scoring (PHASE 2)
+    Trả lời câu hỏi với ngữ cảnh đã được cung cấp sẵn
     
     Args:
         query: Câu hỏi của học sinh
         context: Ngữ cảnh từ bài giảng
         
     Returns:
-        dict với answer, confidence, reasoning
+        Câu trả lời ngắn gọn
     """
-    import json
-    from langchain_openai import ChatOpenAI
-    
+    response = llm.invoke(_build_answer_messages(query, context))
+    return response.content
+
+
+async def aanswer_with_context(query: str, context: str, config: Optional[RunnableConfig] = None) -> str:
+    """Bản async của answer_with_context (config: RunnableConfig của node gọi tới, để stream token)"""
+    response = await llm.ainvoke(_build_answer_messages(query, context), config=config)
+    return response.content
+
+
+def _build_confidence_messages(query: str, context: str) -> list:
+    """Tạo messages cho confidence scoring (PHASE 2)"""
     # Enhanced prompt với confidence scoring
     enhanced_prompt = f"""{NORMAL_ANSWER_PROMPT.format(context=context, question=query)}
 
@@ -97,31 +100,41 @@ Trả về JSON:
 
 CHỈ trả về JSON, không thêm text:"""
     
-    # Dùng JSON mode
-    llm_json = ChatOpenAI(
-        model="gpt-3.5-turbo",
-        temperature=0,
-        model_kwargs={"response_format": {"type": "json_object"}}
-    )
-    
-    messages = [
+    return [
         SystemMessage(content=SYSTEM_PROMPT),
         HumanMessage(content=enhanced_prompt)
     ]
+
+
+def _parse_confidence_response(content: str) -> dict:
+    """Parse JSON trả về từ LLM và bổ sung các key còn thiếu"""
+    result = json.loads(content)
     
-    try:
-        response = llm_json.invoke(messages)
-        result = json.loads(response.content)
+    # Validate keys
+    if "answer" not in result:
+        result["answer"] = content
+    if "confidence" not in result:
+        result["confidence"] = 0.8  # Default high
+    if "reasoning" not in result:
+        result["reasoning"] = "No reasoning provided"
+    
+    return result
+
+
+def answer_with_confidence(query: str, context: str) -> dict:
+    """
+    Trả lời câu hỏi với confidence scoring (PHASE 2)
+    
+    Args:
+        query: Câu hỏi của học sinh
+        context: Ngữ cảnh từ bài giảng
         
-        # Validate keys
-        if "answer" not in result:
-            result["answer"] = response.content
-        if "confidence" not in result:
-            result["confidence"] = 0.8  # Default high
-        if "reasoning" not in result:
-            result["reasoning"] = "No reasoning provided"
-            
-        return result
+    Returns:
+        dict với answer, confidence, reasoning
+    """
+    try:
+        response = llm_json.invoke(_build_confidence_messages(query, context))
+        return _parse_confidence_response(response.content)
     except Exception as e:
         print(f"[ERROR] Confidence scoring failed: {e}")
         # Fallback: return normal answer
@@ -130,3 +143,28 @@ CHỈ trả về JSON, không thêm text:"""
             "confidence": 0.8,
             "reasoning": "Fallback to normal mode"
         }
+
+
+async def aanswer_with_confidence(query: str, context: str, config: Optional[RunnableConfig] = None) -> dict:
+    """
+    Bản async của answer_with_confidence (không block event loop)
+    
+    Args:
+        query: Câu hỏi của học sinh
+        context: Ngữ cảnh từ bài giảng
+        config: RunnableConfig của node gọi tới. Python < 3.11 không tự truyền config
+            qua contextvars, thiếu config thì stream_mode="messages" không nhận được token
+        
+    Returns:
+        dict với answer, confidence, reasoning
+    """
+    try:
+        response = await llm_json.ainvoke(_build_confidence_messages(query, context), config=config)
+        return _parse_confidence_response(response.content)
+    except Exception as e:
+        print(f"[ERROR] Confidence scoring failed: {e}")
+        return {
+            "answer": await aanswer_with_context(query, context, config),
+            "confidence": 0.8,
+            "reasoning": "Fallback to normal mode"
+        }
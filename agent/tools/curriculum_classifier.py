@@ -0,0 +1,218 @@
+"""
+Curriculum classifier - phân loại câu hỏi thuộc bài học nào ngay trong process
+
+Giai đoạn 1 của intent classifier, không gọi LLM:
+- Keyword của từng bài trong curriculum (và các khái niệm ngoài chương trình) được
+  biên dịch một lần thành automaton Aho-Corasick, tìm mọi keyword với một lần quét câu hỏi
+- Điểm BM25 của câu hỏi trên các chunk của từng bài (lexical index build cùng ChromaDB)
+  xác nhận bài mà keyword chỉ tới
+
+Chỉ khi kết quả không chắc chắn (keyword của nhiều bài, không có keyword, BM25 chỉ sang
+bài khác...) thì classify_intent mới gọi GPT-4.
+
+lesson_id trả về luôn là id đang có trong ChromaDB (tên file transcript, do build_chroma.py
+ghi): mỗi bài của curriculum được gán với lesson_id có tên khớp nhất (resolve_lesson_ids).
+"""
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from vector_store.keyword_automaton import KeywordAutomaton, normalize_phrase
+from vector_store.lexical_index import BM25Index, strip_diacritics
+
+# Từ không mang thông tin khi so khớp tên bài với lesson_id
+_TITLE_STOPWORDS = {"bai", "ve"}
+
+# Tỉ lệ (theo trọng số độ hiếm của từ) tên bài phải khớp với lesson_id
+MIN_TITLE_MATCH = 0.6
+
+# Confidence tối đa của kết quả local (ngưỡng chuyển cho LLM nằm ở intent_classifier_tool)
+MAX_LOCAL_CONFIDENCE = 0.95
+OUT_OF_SCOPE_CONFIDENCE = 0.9
+# Tỉ trọng của keyword khi BM25 không đồng ý với bài mà keyword chỉ tới
+_KEYWORD_WEIGHT = 0.7
+
+
+def _title_terms(text: str) -> List[str]:
+    """Các từ (không dấu) của tên bài / lesson_id, "_" cũng là dấu phân cách"""
+    return re.findall(r"[a-z]+|\d+", strip_diacritics(text.lower()))
+
+
+def resolve_lesson_ids(titles: Dict[str, str], stored_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+    """
+    Gán mỗi bài của curriculum với lesson_id đã lưu trong ChromaDB
+
+    lesson_id đã lưu trùng với id khai báo trong curriculum thì dùng luôn; ngược lại chọn
+    lesson_id chứa nhiều từ của tên bài nhất, mỗi từ có trọng số theo độ hiếm của nó
+    trong các lesson_id (từ có ở mọi tên file như "bai", "toan" gần như không tính).
+
+    Args:
+        titles: Tên bài -> lesson_id khai báo trong curriculum
+        stored_ids: Các lesson_id có trong ChromaDB
+
+    Returns:
+        dict tên bài -> lesson_id đã lưu, None nếu không có bài nào khớp đủ
+    """
+    stored_ids = list(stored_ids)
+    id_terms = {lesson_id: set(_title_terms(lesson_id)) for lesson_id in stored_ids}
+    document_frequency = Counter(term for terms in id_terms.values() for term in terms)
+
+    def weight(term: str) -> float:
+        return math.log((len(stored_ids) + 1) / (document_frequency[term] + 0.5))
+
+    resolved = {}
+    for title, declared_id in titles.items():
+        if declared_id in id_terms:
+            resolved[title] = declared_id
+            continue
+
+        terms = set(_title_terms(title)) - _TITLE_STOPWORDS
+        total = sum(weight(term) for term in terms)
+        best_id, best_score = None, 0.0
+        for lesson_id, lesson_terms in id_terms.items():
+            score = sum(weight(term) for term in terms & lesson_terms) / total if total else 0.0
+            if score > best_score:
+                best_id, best_score = lesson_id, score
+        resolved[title] = best_id if best_score >= MIN_TITLE_MATCH else None
+    return resolved
+
+
+class CurriculumClassifier:
+    """Phân loại câu hỏi theo curriculum bằng keyword automaton + BM25 theo bài"""
+
+    def __init__(
+        self,
+        curriculum: Dict[str, Dict],
+        out_of_scope_keywords: Iterable[str] = (),
+        lexical_index: Optional[BM25Index] = None,
+    ):
+        """
+        Args:
+            curriculum: Tên bài -> {"lesson_id": ..., "keywords": [...]} (CURRICULUM_MAP)
+            out_of_scope_keywords: Khái niệm ngoài chương trình lớp 4
+            lexical_index: BM25 index của các chunk đã lưu (None nếu chưa build vector store)
+        """
+        self.lexical_index = lexical_index
+        stored_ids = lexical_index.lessons() if lexical_index is not None else []
+        self.lesson_ids = resolve_lesson_ids(
+            {title: info["lesson_id"] for title, info in curriculum.items()}, stored_ids
+        )
+        # lesson_id khai báo trong curriculum (id cũ) -> lesson_id đã lưu
+        self._declared_ids = {info["lesson_id"]: self.lesson_ids[title] for title, info in curriculum.items()}
+        self._stored_ids = set(stored_ids)
+        self.curriculum_text = self._format_curriculum(curriculum)
+
+        # Mỗi keyword được thêm cả dạng có dấu và không dấu (học sinh gõ không dấu);
+        # giá trị: (tên bài hoặc None nếu ngoài chương trình, keyword gốc)
+        patterns = {}
+        for title, info in curriculum.items():
+            for keyword in info["keywords"]:
+                for plain in (False, True):
+                    patterns.setdefault(normalize_phrase(keyword, plain), (title, keyword))
+        for keyword in out_of_scope_keywords:
+            for plain in (False, True):
+                patterns.setdefault(normalize_phrase(keyword, plain), (None, keyword))
+        self.automaton = KeywordAutomaton((pattern, value) for pattern, value in patterns.items())
+
+    def resolve(self, lesson_id: Optional[str]) -> Optional[str]:
+        """
+        lesson_id đã lưu ứng với một lesson_id bất kỳ (VD: id cũ do LLM trả về)
+
+        Returns:
+            lesson_id có trong ChromaDB, None nếu không xác định được
+        """
+        if not lesson_id:
+            return None
+        if lesson_id in self._stored_ids:
+            return lesson_id
+        return self._declared_ids.get(lesson_id)
+
+    def _keyword_matches(self, query: str) -> List[Tuple[Optional[str], str]]:
+        """Keyword khớp trong câu hỏi, bỏ keyword nằm trong một keyword dài hơn ("tích" trong "diện tích")"""
+        matches = self.automaton.find(normalize_phrase(query))
+        kept = {}
+        for start, end, value in matches:
+            if any(s <= start and end <= e and (s, e) != (start, end) for s, e, _ in matches):
+                continue
+            kept[(start, end)] = value
+        return list(kept.values())
+
+    def classify(self, query: str) -> Dict:
+        """
+        Phân loại câu hỏi
+
+        Args:
+            query: Câu hỏi của học sinh
+
+        Returns:
+            dict giống kết quả LLM: topic, lesson_id (id đã lưu hoặc None), classification,
+            confidence, reasoning
+        """
+        matches = self._keyword_matches(query)
+        keyword_scores: Dict[str, float] = {}
+        out_of_scope = []
+        for title, keyword in matches:
+            if title is None:
+                out_of_scope.append(keyword)
+            else:
+                # Keyword nhiều từ cụ thể hơn keyword một từ
+                keyword_scores[title] = keyword_scores.get(title, 0.0) + len(keyword.split())
+        keywords = [keyword for _, keyword in matches]
+
+        if not keyword_scores:
+            if out_of_scope:
+                return {
+                    "topic": out_of_scope[0],
+                    "lesson_id": None,
+                    "classification": "OUT-OF-SCOPE",
+                    "confidence": OUT_OF_SCOPE_CONFIDENCE,
+                    "reasoning": f"Local: khái niệm ngoài chương trình ({', '.join(out_of_scope)})",
+                }
+            return {
+                "topic": None,
+                "lesson_id": None,
+                "classification": "IN-SCOPE",
+                "confidence": 0.0,
+                "reasoning": "Local: không có keyword của curriculum",
+            }
+
+        title = max(keyword_scores, key=keyword_scores.get)
+        lesson_id = self.lesson_ids[title]
+        keyword_share = keyword_scores[title] / sum(keyword_scores.values())
+
+        # BM25 theo bài: bài của keyword có phải bài khớp nhất không
+        agreement = 0.5
+        lexical_top = None
+        if lesson_id and self.lexical_index is not None:
+            lesson_scores = self.lexical_index.lesson_scores(query)
+            if lesson_scores:
+                lexical_top = max(lesson_scores, key=lesson_scores.get)
+                agreement = lesson_scores.get(lesson_id, 0.0) / lesson_scores[lexical_top]
+
+        confidence = keyword_share * (_KEYWORD_WEIGHT + (1 - _KEYWORD_WEIGHT) * agreement)
+        if out_of_scope:
+            # Vừa có khái niệm trong vừa có khái niệm ngoài chương trình: để LLM quyết định
+            confidence *= 0.5
+        confidence = round(min(MAX_LOCAL_CONFIDENCE, confidence), 2)
+
+        reasoning = f"Local: keywords {', '.join(keywords)}"
+        if lexical_top:
+            reasoning += f"; BM25 khớp nhất: {lexical_top}"
+        return {
+            "topic": title,
+            "lesson_id": lesson_id,
+            "classification": "IN-SCOPE",
+            "confidence": confidence,
+            "reasoning": reasoning,
+        }
+
+    def _format_curriculum(self, curriculum: Dict[str, Dict]) -> str:
+        """Curriculum cho prompt của LLM, với lesson_id đã lưu (tính một lần)"""
+        lines = []
+        for title, info in curriculum.items():
+            keywords_str = ", ".join(info["keywords"][:10])  # Lấy 10 keywords đầu
+            lesson_id = self.lesson_ids[title]
+            lines.append(f"- {title} (ID: {lesson_id})" if lesson_id else f"- {title} (chưa có transcript, ID: null)")
+            lines.append(f"  Keywords: {keywords_str}...")
+        return "\n".join(lines)
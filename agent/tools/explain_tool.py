@@ -2,18 +2,21 @@
 Explain tool - Giải thích chi tiết
 """
 import os
+from typing import Optional, Tuple
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
+from ..llm_registry import get_llm
 from ..prompts import SYSTEM_PROMPT, DEEP_EXPLAIN_PROMPT
+from .grounding_tool import check_grounding
 from .retriever_tool import get_context
 
 # Load environment variables
 load_dotenv()
 
-# Khởi tạo LLM
-llm = ChatOpenAI(model="gpt-4", temperature=0)
+# Khởi tạo LLM (tag để /chat/stream stream token của phần giải thích)
+llm = get_llm("explain")
 
 @tool
 def explain_question(query: str) -> str:
@@ -41,10 +44,88 @@ def explain_question(query: str) -> str:
     response = llm.invoke(messages)
     return response.content
 
+def _build_explain_messages(query: str, context: str) -> list:
+    """Tạo messages cho chế độ giải thích chi tiết"""
+    prompt = DEEP_EXPLAIN_PROMPT.format(context=context, question=query)
+    
+    return [
+        SystemMessage(content=SYSTEM_PROMPT),
+        HumanMessage(content=prompt)
+    ]
+
+
+def _apply_validation(answer: str, validation: dict) -> str:
+    """Dùng corrected_answer nếu validation phát hiện vấn đề"""
+    # Nếu validation phát hiện vấn đề và confidence < 70
+    if not validation["is_valid"] or validation["confidence"] < 70:
+        # Sử dụng corrected_answer nếu có
+        if validation["corrected_answer"] and validation["corrected_answer"] != answer:
+            print(f"[VALIDATION] Đã sửa câu trả lời. Issues: {validation['issues']}")
+            return validation["corrected_answer"]
+    
+    return answer
+
+
+def _needs_llm_validation(query: str, answer: str, context: str) -> bool:
+    """
+    Grounding check local trước validator LLM: chỉ câu trả lời không qua mới cần GPT-4 validate
+    """
+    from .validator_tool import should_use_validation
+    
+    if not should_use_validation(intent="deep"):
+        return False
+    
+    grounding = check_grounding(answer, context, query)
+    if grounding["grounded"]:
+        print(f"[VALIDATION] Grounding OK (số {grounding['number_coverage']:.0%}, "
+              f"cụm từ {grounding['term_overlap']:.0%}), bỏ qua validator LLM")
+        return False
+    
+    print(f"[VALIDATION] Grounding chưa đạt, cần validator LLM: {grounding['issues']}")
+    return True
+
+
+def revise_explanation(query: str, answer: str, context: str) -> str:
+    """
+    Validate giải thích bằng LLM và sửa nếu cần
+    
+    Args:
+        query: Câu hỏi của học sinh
+        answer: Giải thích cần kiểm tra
+        context: Ngữ cảnh từ bài giảng
+        
+    Returns:
+        Giải thích đã sửa (hoặc giữ nguyên nếu validator không thấy vấn đề)
+    """
+    from .validator_tool import validate_answer
+    
+    validation = validate_answer(query, answer, context)
+    return _apply_validation(answer, validation)
+
+
+async def arevise_explanation(query: str, answer: str, context: str) -> str:
+    """
+    Bản async của revise_explanation (không block event loop)
+    
+    Args:
+        query: Câu hỏi của học sinh
+        answer: Giải thích cần kiểm tra
+        context: Ngữ cảnh từ bài giảng
+        
+    Returns:
+        Giải thích đã sửa (hoặc giữ nguyên nếu validator không thấy vấn đề)
+    """
+    from .validator_tool import avalidate_answer
+    
+    validation = await avalidate_answer(query, answer, context)
+    return _apply_validation(answer, validation)
+
+
 def explain_with_context(query: str, context: str) -> str:
     """
     Giải thích chi tiết với ngữ cảnh đã được cung cấp sẵn.
-    Bao gồm self-critique để đảm bảo độ chính xác.
+    Bao gồm self-critique để đảm bảo độ chính xác: grounding check local,
+    chỉ gọi validator LLM khi không qua.
     
     Args:
         query: Câu hỏi của học sinh
@@ -53,27 +134,51 @@ def explain_with_context(query: str, context: str) -> str:
     Returns:
         Giải thích chi tiết đã được validate
     """
-    from .validator_tool import validate_answer, should_use_validation
+    response = llm.invoke(_build_explain_messages(query, context))
+    answer = response.content
     
-    prompt = DEEP_EXPLAIN_PROMPT.format(context=context, question=query)
+    # Self-critique cho deep mode
+    if _needs_llm_validation(query, answer, context):
+        answer = revise_explanation(query, answer, context)
     
-    messages = [
-        SystemMessage(content=SYSTEM_PROMPT),
-        HumanMessage(content=prompt)
-    ]
+    return answer
+
+
+async def adraft_explanation(
+    query: str, context: str, config: Optional[RunnableConfig] = None
+) -> Tuple[str, bool]:
+    """
+    Giải thích chi tiết chưa qua validator LLM (để stream cho học sinh, validate ở background)
     
-    response = llm.invoke(messages)
+    Args:
+        query: Câu hỏi của học sinh
+        context: Ngữ cảnh từ bài giảng
+        config: RunnableConfig của node gọi tới. Python < 3.11 không tự truyền config
+            qua contextvars, thiếu config thì stream_mode="messages" không nhận được token
+        
+    Returns:
+        (giải thích, True nếu grounding check không qua và cần arevise_explanation)
+    """
+    response = await llm.ainvoke(_build_explain_messages(query, context), config=config)
     answer = response.content
+    return answer, _needs_llm_validation(query, answer, context)
+
+
+async def aexplain_with_context(query: str, context: str, config: Optional[RunnableConfig] = None) -> str:
+    """
+    Bản async của explain_with_context (không block event loop)
     
-    # Self-critique cho deep mode
-    if should_use_validation(intent="deep"):
-        validation = validate_answer(query, answer, context)
+    Args:
+        query: Câu hỏi của học sinh
+        context: Ngữ cảnh từ bài giảng
+        config: RunnableConfig của node gọi tới (xem adraft_explanation)
         
-        # Nếu validation phát hiện vấn đề và confidence < 70
-        if not validation["is_valid"] or validation["confidence"] < 70:
-            # Sử dụng corrected_answer nếu có
-            if validation["corrected_answer"] and validation["corrected_answer"] != answer:
-                answer = validation["corrected_answer"]
-                print(f"[VALIDATION] Đã sửa câu trả lời. Issues: {validation['issues']}")
+    Returns:
+        Giải thích chi tiết đã được validate
+    """
+    answer, needs_validation = await adraft_explanation(query, context, config)
+    
+    if needs_validation:
+        answer = await arevise_explanation(query, answer, context)
     
     return answer
@@ -0,0 +1,210 @@
+"""
+Grounding check - kiểm tra nhanh câu trả lời có bám vào bài học không (không gọi LLM)
+
+Chạy trước validator GPT-4 của deep mode, chỉ câu trả lời không qua được mới phải
+validate bằng LLM:
+- Phép tính trong câu trả lời ("36 547 + 1 000 = 37 547", "12 : 5 = 2 dư 2", "2/3 = 4/6")
+  được tính lại, sai một phép là không qua
+- Số trong câu trả lời phải có trong bài học / câu hỏi (hoặc là kết quả của một phép tính
+  đúng trong câu trả lời); số nhỏ (số thứ tự bước, ví dụ đơn giản) không tính
+- Tỉ lệ cụm từ (bigram âm tiết, cùng cách tách của lexical index) của câu trả lời có trong
+  bài học / câu hỏi
+"""
+import os
+import re
+import unicodedata
+from typing import Dict, List, Optional, Set, Tuple
+
+from vector_store.lexical_index import tokenize
+
+# Ngưỡng để bỏ qua validator LLM
+GROUNDING_MIN_NUMBER_COVERAGE = float(os.getenv("GROUNDING_MIN_NUMBER_COVERAGE", "0.8"))
+GROUNDING_MIN_TERM_OVERLAP = float(os.getenv("GROUNDING_MIN_TERM_OVERLAP", "0.2"))
+
+# Số <= ngưỡng này không cần có trong bài học (Bước 1, 2..., ví dụ 3/5 > 2/5)
+_SMALL_NUMBER = 10
+
+# Số theo cách viết tiếng Việt: nhóm hàng nghìn bằng dấu chấm/khoảng trắng ("36.547", "70 000"),
+# dấu phẩy luôn là dấu thập phân ("2,5", "2,500" = 2,5)
+_THOUSANDS_SEPARATOR = r"[. \u00a0]"
+_NUMBER = rf"\d{{1,3}}(?:{_THOUSANDS_SEPARATOR}\d{{3}})+(?:,\d+)?(?!\d)|\d+(?:,\d+)?"
+_OPERATOR_CHARS = r"[+\-−–×xX*÷/]"
+# ":" chỉ là phép chia khi có khoảng trắng hai bên ("12 : 5"), không phải "Bước 1:" hay "8:30"
+_OPERATOR = rf"(?:\s*{_OPERATOR_CHARS}\s*|\s+:\s+)"
+_EXPRESSION = rf"(?:{_NUMBER})(?:{_OPERATOR}(?:{_NUMBER}))*"
+
+_NUMBER_RE = re.compile(rf"(?<![\d.,])(?:{_NUMBER})")
+_TOKEN_RE = re.compile(rf"({_NUMBER})|({_OPERATOR_CHARS}|:)")
+# Nhãn "Bước 1:", "Bước 2️⃣:", "Ví dụ 1:", "Câu 3:", "Bài 2:" (số của nhãn không thuộc phép tính).
+# Có khoảng trắng trước ":" thì chỉ "Bước/Câu/Bài N :" ở đầu dòng là nhãn: "ví dụ 12 : 2 = 6" là phép chia
+_LABEL_RE = re.compile(
+    r"\b(?:bước|ví dụ|câu|bài)\s*\d+[^\s:]*:|^[\s\-*#>]*(?:bước|câu|bài)\s*\d+[^\s:]*\s+:",
+    re.IGNORECASE | re.MULTILINE,
+)
+# "a op b ... = c ..." kèm số dư tùy chọn ("= 2 dư 2", "= 2 (dư 2)")
+_EQUATION_RE = re.compile(
+    rf"(?<![\w.,/])(?P<left>(?:{_NUMBER})(?:{_OPERATOR}(?:{_NUMBER}))+)"
+    rf"\s*=\s*(?P<right>{_EXPRESSION})(?![\w]|[.,]\d)"
+    rf"(?:\s*\(?\s*(?:dư|du)\s+(?P<remainder>{_NUMBER}))?",
+    re.IGNORECASE,
+)
+
+_OPERATORS = {
+    "+": "+", "-": "-", "−": "-", "–": "-",
+    "×": "*", "x": "*", "X": "*", "*": "*",
+    ":": "/", "÷": "/", "/": "/",
+}
+
+
+def _parse_number(text: str) -> float:
+    """ "36.547" / "70 000" → 36547, "2,5" / "2,500" → 2.5 """
+    return float(re.sub(_THOUSANDS_SEPARATOR, "", text).replace(",", "."))
+
+
+def _number_key(text: str) -> str:
+    """Dạng chuẩn của số để so khớp ("36.547" và "36547" là một số)"""
+    value = _parse_number(text)
+    return str(int(value)) if value.is_integer() else str(value)
+
+
+def _decimals(text: str) -> int:
+    """Số chữ số thập phân đã viết ("3,33" → 2)"""
+    return len(text.split(",")[1]) if "," in text else 0
+
+
+def _evaluate(expression: str) -> Tuple[Optional[float], int]:
+    """
+    Tính giá trị biểu thức (nhân/chia trước, cộng/trừ sau)
+
+    Returns:
+        (giá trị hoặc None nếu chia cho 0, số chữ số thập phân lớn nhất đã viết)
+    """
+    numbers, operators = [], []
+    decimals = 0
+    for number, operator in _TOKEN_RE.findall(expression):
+        if number:
+            numbers.append(_parse_number(number))
+            decimals = max(decimals, _decimals(number))
+        else:
+            operators.append(_OPERATORS[operator])
+
+    # Nhân/chia trước
+    terms, signs = [numbers[0]], []
+    for operator, number in zip(operators, numbers[1:]):
+        if operator == "*":
+            terms[-1] *= number
+        elif operator == "/":
+            if number == 0:
+                return None, decimals
+            terms[-1] /= number
+        else:
+            terms.append(number)
+            signs.append(operator)
+
+    value = terms[0]
+    for sign, term in zip(signs, terms[1:]):
+        value = value + term if sign == "+" else value - term
+    return value, decimals
+
+
+def _check_equation(match: re.Match) -> bool:
+    """Phép tính trong câu trả lời có đúng không"""
+    left, right, remainder = match.group("left"), match.group("right"), match.group("remainder")
+
+    if remainder:
+        # Phép chia có dư: chỉ kiểm tra dạng "a : b = q dư r"
+        numbers = _NUMBER_RE.findall(left)
+        operators = [_OPERATORS[op] for _, op in _TOKEN_RE.findall(left) if op]
+        if len(numbers) != 2 or operators != ["/"]:
+            return True
+        dividend, divisor = (int(_parse_number(n)) for n in numbers)
+        quotient, rest = _parse_number(right), _parse_number(remainder)
+        return divisor != 0 and dividend // divisor == quotient and dividend % divisor == rest
+
+    left_value, left_decimals = _evaluate(left)
+    right_value, right_decimals = _evaluate(right)
+    if left_value is None or right_value is None:
+        return False
+    # Kết quả làm tròn ("10 : 3 = 3,33") được chấp nhận theo số chữ số thập phân đã viết
+    decimals = max(left_decimals, right_decimals)
+    tolerance = 0.5 * 10 ** -decimals if decimals else 1e-9 * max(1.0, abs(right_value))
+    return abs(left_value - right_value) <= tolerance
+
+
+def check_arithmetic(answer: str) -> Tuple[List[str], List[str]]:
+    """
+    Tính lại các phép tính "... = ..." trong câu trả lời
+
+    Args:
+        answer: Câu trả lời cần kiểm tra
+
+    Returns:
+        (các phép tính sai, các phép tính đúng) dạng text như trong câu trả lời
+    """
+    text = _LABEL_RE.sub(" ", unicodedata.normalize("NFC", answer))
+    wrong, correct = [], []
+    for match in _EQUATION_RE.finditer(text):
+        # Bỏ vế trái bị cắt giữa chừng ("a + 2 + 3 = 5": a không phải số)
+        prefix = text[:match.start()].rstrip()
+        if prefix and re.match(_OPERATOR_CHARS, prefix[-1]) and prefix[-1] not in "xX":
+            continue
+        equation = " ".join(match.group(0).split())
+        (correct if _check_equation(match) else wrong).append(equation)
+    return wrong, correct
+
+
+def _numbers(text: str) -> Set[str]:
+    """Các số (dạng chuẩn) trong text"""
+    return {_number_key(number) for number in _NUMBER_RE.findall(unicodedata.normalize("NFC", text))}
+
+
+def _phrases(text: str) -> Set[str]:
+    """Bigram âm tiết ("phân_số") của text"""
+    return {term for term in tokenize(text) if "_" in term}
+
+
+def check_grounding(answer: str, context: str, question: str = "") -> Dict:
+    """
+    Chấm nhanh mức độ bám bài học của câu trả lời (chạy local, vài ms)
+
+    Args:
+        answer: Câu trả lời cần kiểm tra
+        context: Ngữ cảnh từ bài học
+        question: Câu hỏi của học sinh (số/cụm từ trong câu hỏi được coi là có nguồn)
+
+    Returns:
+        dict với grounded (True nếu không cần validator LLM), number_coverage,
+        term_overlap, arithmetic_errors, unsupported_numbers, issues
+    """
+    wrong, correct = check_arithmetic(answer)
+
+    # Số có nguồn: trong bài học, câu hỏi, hoặc nằm trong một phép tính đúng của câu trả lời
+    known_numbers = _numbers(context) | _numbers(question)
+    for equation in correct:
+        known_numbers |= _numbers(equation)
+    answer_numbers = {number for number in _numbers(answer) if float(number) > _SMALL_NUMBER}
+    unsupported = sorted(answer_numbers - known_numbers, key=float)
+    number_coverage = 1 - len(unsupported) / len(answer_numbers) if answer_numbers else 1.0
+
+    answer_phrases = _phrases(answer)
+    source_phrases = _phrases(context) | _phrases(question)
+    term_overlap = len(answer_phrases & source_phrases) / len(answer_phrases) if answer_phrases else 1.0
+
+    issues = []
+    if not context.strip():
+        issues.append("Không có ngữ cảnh bài học")
+    if wrong:
+        issues.append(f"Phép tính sai: {'; '.join(wrong)}")
+    if number_coverage < GROUNDING_MIN_NUMBER_COVERAGE:
+        issues.append(f"Số không có trong bài học: {', '.join(unsupported)}")
+    if term_overlap < GROUNDING_MIN_TERM_OVERLAP:
+        issues.append(f"Ít cụm từ của bài học ({term_overlap:.0%})")
+
+    return {
+        "grounded": not issues,
+        "number_coverage": round(number_coverage, 2),
+        "term_overlap": round(term_overlap, 2),
+        "arithmetic_errors": wrong,
+        "unsupported_numbers": unsupported,
+        "issues": issues,
+    }
@@ -1,17 +1,29 @@
 """
 Intent Classifier Tool - Phân loại câu hỏi thuộc bài học nào
 PHASE 3: Fallback cho low confidence cases
+
+Giai đoạn 1 chạy local (CurriculumClassifier: keyword automaton + BM25 theo bài), chỉ gọi
+GPT-4 khi kết quả local có confidence < LOCAL_INTENT_MIN_CONFIDENCE, hoặc khi chưa có
+BM25 index để xác nhận bài mà keyword chỉ tới. lesson_id trả về
+(local hay LLM) luôn là id đang có trong ChromaDB, hoặc None.
 """
 import json
-from typing import Dict
-from langchain_openai import ChatOpenAI
+import os
+from typing import Dict, Optional
 from langchain_core.messages import SystemMessage, HumanMessage
 from dotenv import load_dotenv
+from vector_store.lexical_index import BM25Index
+from ..llm_registry import get_llm
+from .curriculum_classifier import CurriculumClassifier
+from .retriever_tool import aget_lexical_index, get_lexical_index
 
 load_dotenv()
 
-# LLM cho classification - dùng GPT-4 cho độ chính xác cao
-llm = ChatOpenAI(model="gpt-4", temperature=0)
+# Kết quả local có confidence từ ngưỡng này trở lên thì không gọi LLM
+LOCAL_INTENT_MIN_CONFIDENCE = float(os.getenv("LOCAL_INTENT_MIN_CONFIDENCE", "0.85"))
+
+# LLM JSON mode cho classification - GPT-4 cho độ chính xác cao (dùng chung cho bản sync và async)
+llm_json = get_llm("json")
 
 # Curriculum Map - Mapping bài học với keywords
 CURRICULUM_MAP = {
@@ -56,6 +68,12 @@ CURRICULUM_MAP = {
     }
 }
 
+# Khái niệm ngoài chương trình Toán lớp 4 (local classifier trả về OUT-OF-SCOPE)
+OUT_OF_SCOPE_KEYWORDS = [
+    "căn bậc hai", "căn bậc ba", "phương trình", "bất phương trình", "hàm số",
+    "đạo hàm", "tích phân", "logarit", "lượng giác", "số phức", "ma trận", "vectơ",
+]
+
 INTENT_CLASSIFIER_PROMPT = """Bạn là chuyên gia phân tích câu hỏi Toán lớp 4 của Việt Nam.
 
 CHƯƠNG TRÌNH HỌC (CURRICULUM):
@@ -88,7 +106,7 @@ VÍ DỤ:
 Trả về JSON:
 {{
     "topic": "tên bài học cụ thể",
-    "lesson_id": "bai_x_..." hoặc null nếu OUT-OF-SCOPE,
+    "lesson_id": "ID của bài trong CHƯƠNG TRÌNH HỌC" hoặc null nếu OUT-OF-SCOPE / bài chưa có ID,
     "classification": "IN-SCOPE" hoặc "OUT-OF-SCOPE",
     "confidence": 0.95,
     "reasoning": "giải thích ngắn gọn"
@@ -97,6 +115,89 @@ Trả về JSON:
 CHỈ trả về JSON, không thêm text:"""
 
 
+_curriculum_classifier: Optional[CurriculumClassifier] = None
+
+
+def _classifier_for(lexical_index: Optional[BM25Index]) -> CurriculumClassifier:
+    """
+    Local classifier dùng chung; tạo lại khi lexical index đổi (vector store build lại)
+    để lesson_id luôn khớp với ChromaDB
+    """
+    global _curriculum_classifier
+    if _curriculum_classifier is None or _curriculum_classifier.lexical_index is not lexical_index:
+        _curriculum_classifier = CurriculumClassifier(CURRICULUM_MAP, OUT_OF_SCOPE_KEYWORDS, lexical_index)
+        resolved = sum(lesson_id is not None for lesson_id in _curriculum_classifier.lesson_ids.values())
+        print(f"[INTENT CLASSIFIER] Curriculum: {resolved}/{len(CURRICULUM_MAP)} bài có transcript trong vector store")
+    return _curriculum_classifier
+
+
+def get_curriculum_classifier() -> CurriculumClassifier:
+    """Local classifier ứng với lexical index hiện tại của retriever"""
+    return _classifier_for(get_lexical_index())
+
+
+async def aget_curriculum_classifier() -> CurriculumClassifier:
+    """Bản async của get_curriculum_classifier (load lại lexical index trong thread pool)"""
+    return _classifier_for(await aget_lexical_index())
+
+
+def _classify_local(query: str, classifier: CurriculumClassifier) -> Optional[Dict]:
+    """Kết quả của local classifier nếu đủ chắc chắn, None nếu cần gọi LLM"""
+    result = classifier.classify(query)
+    # Chưa có BM25 index (chưa build vector store): keyword không được kiểm chứng, để LLM quyết định
+    if classifier.lexical_index is None and result["classification"] == "IN-SCOPE":
+        return None
+    if result["confidence"] < LOCAL_INTENT_MIN_CONFIDENCE:
+        return None
+    print(f"[INTENT CLASSIFIER] Local: {result['classification']} ({result['confidence']}) - {result['topic']}")
+    return result
+
+
+def _build_classifier_messages(query: str, classifier: CurriculumClassifier) -> list:
+    """Tạo messages cho intent classification"""
+    # Curriculum (kèm lesson_id đã lưu) được format sẵn một lần
+    prompt = INTENT_CLASSIFIER_PROMPT.format(
+        curriculum=classifier.curriculum_text,
+        question=query
+    )
+    
+    return [
+        SystemMessage(content="Bạn là chuyên gia phân loại câu hỏi toán học Tiểu học."),
+        HumanMessage(content=prompt)
+    ]
+
+
+def _parse_classifier_response(query: str, content: str, classifier: CurriculumClassifier) -> Dict:
+    """Parse JSON classification và bổ sung các key còn thiếu"""
+    result = json.loads(content)
+    
+    # Validate
+    required_keys = ["topic", "lesson_id", "classification", "confidence", "reasoning"]
+    for key in required_keys:
+        if key not in result:
+            result[key] = None if key != "confidence" else 0.5
+    
+    # Chỉ giữ lesson_id có trong ChromaDB (id cũ của curriculum được đổi sang id đã lưu)
+    result["lesson_id"] = classifier.resolve(result["lesson_id"])
+    
+    print(f"[INTENT CLASSIFIER] Query: {query[:50]}...")
+    print(f"[INTENT CLASSIFIER] Result: {result['classification']} ({result['confidence']}) - {result['topic']}")
+    
+    return result
+
+
+def _classifier_fallback(error: Exception) -> Dict:
+    """Fallback: assume IN-SCOPE với low confidence"""
+    print(f"[ERROR] Intent classification failed: {error}")
+    return {
+        "topic": "Unknown",
+        "lesson_id": None,
+        "classification": "IN-SCOPE",
+        "confidence": 0.4,
+        "reasoning": f"Classification error: {str(error)}"
+    }
+
+
 def classify_intent(query: str) -> Dict:
     """
     Phân loại intent của câu hỏi
@@ -107,58 +208,38 @@ def classify_intent(query: str) -> Dict:
     Returns:
         dict với topic, lesson_id, classification, confidence, reasoning
     """
-    # Format curriculum
-    curriculum_lines = []
-    for lesson, info in CURRICULUM_MAP.items():
-        keywords_str = ", ".join(info["keywords"][:10])  # Lấy 10 keywords đầu
-        curriculum_lines.append(f"- {lesson} (ID: {info['lesson_id']})")
-        curriculum_lines.append(f"  Keywords: {keywords_str}...")
-    
-    curriculum_text = "\n".join(curriculum_lines)
-    
-    # Create prompt
-    prompt = INTENT_CLASSIFIER_PROMPT.format(
-        curriculum=curriculum_text,
-        question=query
-    )
+    classifier = get_curriculum_classifier()
+    local_result = _classify_local(query, classifier)
+    if local_result:
+        return local_result
     
-    # Call LLM with JSON mode
-    llm_json = ChatOpenAI(
-        model="gpt-4",
-        temperature=0,
-        model_kwargs={"response_format": {"type": "json_object"}}
-    )
+    try:
+        response = llm_json.invoke(_build_classifier_messages(query, classifier))
+        return _parse_classifier_response(query, response.content, classifier)
+    except Exception as e:
+        return _classifier_fallback(e)
+
+
+async def aclassify_intent(query: str) -> Dict:
+    """
+    Bản async của classify_intent (không block event loop)
     
-    messages = [
-        SystemMessage(content="Bạn là chuyên gia phân loại câu hỏi toán học Tiểu học."),
-        HumanMessage(content=prompt)
-    ]
+    Args:
+        query: Câu hỏi của học sinh
+        
+    Returns:
+        dict với topic, lesson_id, classification, confidence, reasoning
+    """
+    classifier = await aget_curriculum_classifier()
+    local_result = _classify_local(query, classifier)
+    if local_result:
+        return local_result
     
     try:
-        response = llm_json.invoke(messages)
-        result = json.loads(response.content)
-        
-        # Validate
-        required_keys = ["topic", "lesson_id", "classification", "confidence", "reasoning"]
-        for key in required_keys:
-            if key not in result:
-                result[key] = None if key != "confidence" else 0.5
-        
-        print(f"[INTENT CLASSIFIER] Query: {query[:50]}...")
-        print(f"[INTENT CLASSIFIER] Result: {result['classification']} ({result['confidence']}) - {result['topic']}")
-        
-        return result
-        
+        response = await llm_json.ainvoke(_build_classifier_messages(query, classifier))
+        return _parse_classifier_response(query, response.content, classifier)
     except Exception as e:
-        print(f"[ERROR] Intent classification failed: {e}")
-        # Fallback: assume IN-SCOPE với low confidence
-        return {
-            "topic": "Unknown",
-            "lesson_id": None,
-            "classification": "IN-SCOPE",
-            "confidence": 0.4,
-            "reasoning": f"Classification error: {str(e)}"
-        }
+        return _classifier_fallback(e)
 
 
 def should_use_intent_classifier(confidence: float) -> bool:
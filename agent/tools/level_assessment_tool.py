@@ -1,28 +1,46 @@
 """
 Level Assessment Tool - Đánh giá trình độ học sinh
+
+Level tính từ hai chỉ số: số câu hỏi của học sinh và số từ khóa "học sâu" khác nhau
+đã xuất hiện trong hội thoại. SessionMemory cập nhật hai chỉ số này mỗi khi thêm
+message (level_signals) nên GET /user/{id}/level tính level ngay, không quét lại history.
 """
+from typing import Tuple
 
+# Từ khóa chủ động học sâu
+DEEP_KEYWORDS = ("giải thích", "chi tiết", "tại sao", "như thế nào", "ví dụ", "làm sao")
 
-def assess_student_level_from_conversation(conversation_history: str, messages_count: int) -> dict:
+
+def level_signals(role: str, content: str, seen_keywords: int = 0) -> Tuple[int, int]:
     """
-    Đánh giá level học sinh dựa trên conversation history (rule-based)
-    Không gọi LLM - tiết kiệm token
-    
+    Chỉ số level của một message mới (O(độ dài message))
+
     Args:
-        conversation_history: Lịch sử hội thoại (text)
-        messages_count: Số lượng messages trong conversation
-        
+        role: "user" hoặc "assistant"
+        content: Nội dung message
+        seen_keywords: Bitmask các từ khóa đã gặp (bit i ứng với DEEP_KEYWORDS[i])
+
+    Returns:
+        (1 nếu là câu hỏi của học sinh ngược lại 0, bitmask từ khóa sau khi thêm message)
+    """
+    text = content.lower()
+    for bit, keyword in enumerate(DEEP_KEYWORDS):
+        if not seen_keywords & (1 << bit) and keyword in text:
+            seen_keywords |= 1 << bit
+    return int(role == "user"), seen_keywords
+
+
+def assess_level(user_questions: int, deep_count: int) -> dict:
+    """
+    Đánh giá level từ số câu hỏi và số từ khóa học sâu (rule-based, không gọi LLM)
+
+    Args:
+        user_questions: Số câu hỏi của học sinh
+        deep_count: Số từ khóa học sâu khác nhau đã xuất hiện
+
     Returns:
         dict: {"level": "Beginner/Intermediate/Advanced", "reason": "..."}
     """
-    # Đếm số câu hỏi của học sinh (ước lượng)
-    user_questions = conversation_history.count("Học sinh:")
-    
-    # Kiểm tra từ khóa chủ động học sâu
-    deep_keywords = ["giải thích", "chi tiết", "tại sao", "như thế nào", "ví dụ", "làm sao"]
-    deep_count = sum(1 for keyword in deep_keywords if keyword in conversation_history.lower())
-    
-    # Đánh giá theo rules
     if user_questions < 3:
         level = "Beginner"
         reason = f"Học sinh mới hỏi {user_questions} câu, chưa thể hiện sự tích cực học hỏi"
@@ -32,8 +50,26 @@ def assess_student_level_from_conversation(conversation_history: str, messages_c
     else:
         level = "Intermediate"
         reason = f"Học sinh đã hỏi {user_questions} câu, thể hiện sự tích cực học hỏi ở mức trung bình"
-    
+
     return {
         "level": level,
         "reason": reason
     }
+
+
+def assess_student_level_from_conversation(conversation_history: str, messages_count: int) -> dict:
+    """
+    Đánh giá level học sinh dựa trên conversation history (rule-based)
+    Không gọi LLM - tiết kiệm token
+
+    Args:
+        conversation_history: Lịch sử hội thoại (text)
+        messages_count: Số lượng messages trong conversation
+
+    Returns:
+        dict: {"level": "Beginner/Intermediate/Advanced", "reason": "..."}
+    """
+    # Đếm số câu hỏi của học sinh (ước lượng)
+    user_questions = conversation_history.count("Học sinh:")
+    _, seen_keywords = level_signals("", conversation_history)
+    return assess_level(user_questions, bin(seen_keywords).count("1"))
@@ -4,9 +4,10 @@ Mindmap tool - Tạo sơ đồ tư duy dạng JSON cho React Flow
 import json
 import os
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_core.tools import tool
+from ..llm_registry import get_llm
+from ..prompt_budget import declare_budget
 from ..prompts import SYSTEM_PROMPT, MINDMAP_PROMPT
 from .retriever_tool import get_context
 
@@ -14,11 +15,10 @@ from .retriever_tool import get_context
 load_dotenv()
 
 # Khởi tạo LLM với JSON mode
-llm = ChatOpenAI(
-    model="gpt-4o",
-    temperature=0,
-    model_kwargs={"response_format": {"type": "json_object"}}
-)
+llm = get_llm("mindmap")
+
+# Ngân sách token cho context bài học của mindmap
+MINDMAP_BUDGET = declare_budget("mindmap", context_tokens=2500)
 
 @tool
 def generate_mindmap(topic: str) -> str:
@@ -32,7 +32,7 @@ def generate_mindmap(topic: str) -> str:
         JSON string với format React Flow (nodes và edges)
     """
     # Lấy ngữ cảnh từ vector store
-    context = get_context(topic, k=5)
+    context = get_context(topic, k=5, budget=MINDMAP_BUDGET)
     
     # Tạo prompt
     prompt = MINDMAP_PROMPT.format(context=context, topic=topic)
@@ -46,21 +46,34 @@ def generate_mindmap(topic: str) -> str:
     response = llm.invoke(messages)
     
     # Validate JSON
+    return json.dumps(_parse_mindmap(response.content), ensure_ascii=False, indent=2)
+
+def _build_mindmap_messages(topic: str, context: str) -> list:
+    """Tạo messages cho việc tạo mindmap"""
+    prompt = MINDMAP_PROMPT.format(context=context, topic=topic)
+    
+    return [
+        SystemMessage(content="Bạn là cô giáo Toán lớp 4 vui vẻ, đang giúp em học sinh tạo sơ đồ tư duy dễ nhớ. Chỉ trả về JSON thuần, không thêm text."),
+        HumanMessage(content=prompt)
+    ]
+
+
+def _parse_mindmap(content: str) -> dict:
+    """Parse JSON mindmap, đảm bảo có nodes/edges"""
     try:
-        json_data = json.loads(response.content)
+        json_data = json.loads(content)
         # Đảm bảo có cấu trúc cơ bản
         if "nodes" not in json_data:
             json_data["nodes"] = []
         if "edges" not in json_data:
             json_data["edges"] = []
-        return json.dumps(json_data, ensure_ascii=False, indent=2)
+        return json_data
     except json.JSONDecodeError:
         # Fallback nếu LLM không trả về JSON hợp lệ
-        return json.dumps({
-            "error": "Không thể tạo sơ đồ tư duy cho yêu cầu này."
-        }, ensure_ascii=False)
+        return {"error": "Không thể tạo sơ đồ tư duy cho yêu cầu này."}
 
-def generate_mindmap_with_context(topic: str, context: str) -> str:
+
+def generate_mindmap_data_with_context(topic: str, context: str) -> dict:
     """
     Tạo sơ đồ tư duy với ngữ cảnh đã được cung cấp sẵn
     
@@ -69,28 +82,50 @@ def generate_mindmap_with_context(topic: str, context: str) -> str:
         context: Ngữ cảnh từ bài giảng
         
     Returns:
-        JSON string với format React Flow
+        Dict mindmap (nodes/edges cho React Flow, hoặc error)
     """
-    prompt = MINDMAP_PROMPT.format(context=context, topic=topic)
+    response = llm.invoke(_build_mindmap_messages(topic, context))
+    return _parse_mindmap(response.content)
+
+
+async def agenerate_mindmap_data_with_context(topic: str, context: str) -> dict:
+    """
+    Bản async của generate_mindmap_data_with_context (không block event loop)
     
-    messages = [
-        SystemMessage(content="Bạn là cô giáo Toán lớp 4 vui vẻ, đang giúp em học sinh tạo sơ đồ tư duy dễ nhớ. Chỉ trả về JSON thuần, không thêm text."),
-        HumanMessage(content=prompt)
-    ]
+    Args:
+        topic: Chủ đề cần tạo sơ đồ tư duy
+        context: Ngữ cảnh từ bài giảng
+        
+    Returns:
+        Dict mindmap (nodes/edges cho React Flow, hoặc error)
+    """
+    response = await llm.ainvoke(_build_mindmap_messages(topic, context))
+    return _parse_mindmap(response.content)
+
+
+def generate_mindmap_with_context(topic: str, context: str) -> str:
+    """
+    Tạo sơ đồ tư duy với ngữ cảnh đã được cung cấp sẵn
     
-    response = llm.invoke(messages)
+    Args:
+        topic: Chủ đề cần tạo sơ đồ tư duy
+        context: Ngữ cảnh từ bài giảng
+        
+    Returns:
+        JSON string với format React Flow
+    """
+    return json.dumps(generate_mindmap_data_with_context(topic, context), ensure_ascii=False)
+
+
+async def agenerate_mindmap_with_context(topic: str, context: str) -> str:
+    """
+    Bản async của generate_mindmap_with_context (không block event loop)
     
-    # Validate JSON
-    try:
-        json_data = json.loads(response.content)
-        # Đảm bảo có cấu trúc cơ bản
-        if "nodes" not in json_data:
-            json_data["nodes"] = []
-        if "edges" not in json_data:
-            json_data["edges"] = []
-        return json.dumps(json_data, ensure_ascii=False, indent=2)
-    except json.JSONDecodeError:
-        # Fallback nếu LLM không trả về JSON hợp lệ
-        return json.dumps({
-            "error": "Không thể tạo sơ đồ tư duy cho yêu cầu này."
-        }, ensure_ascii=False)
+    Args:
+        topic: Chủ đề cần tạo sơ đồ tư duy
+        context: Ngữ cảnh từ bài giảng
+        
+    Returns:
+        JSON string với format React Flow
+    """
+    return json.dumps(await agenerate_mindmap_data_with_context(topic, context), ensure_ascii=False)
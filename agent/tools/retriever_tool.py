@@ -1,19 +1,57 @@
 """
 Retriever tool - Truy vấn ngữ cảnh từ ChromaDB với Smart Query Expansion
 """
+import asyncio
 import os
 import re
-from typing import List, Dict
+import time
+from typing import List, Dict, Optional
 from dotenv import load_dotenv
 from langchain_community.vectorstores import Chroma
 from langchain_openai import OpenAIEmbeddings
 from langchain_core.tools import tool
 
+from vector_store.embedding_cache import CachedEmbeddings, SQLiteEmbeddingCache
+from vector_store.index_version import IndexVersionWatcher
+from vector_store.lesson_digest import LessonDigestStore
+from vector_store.lexical_index import BM25Index, LEXICAL_INDEX_FILE
+from vector_store.numpy_index import NumpyVectorIndex
+from vector_store.snapshot import load_snapshot
+from ..prompt_budget import PromptBudget
+
 # Load environment variables
 load_dotenv()
 
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
 # Đường dẫn đến ChromaDB
-CHROMA_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "chroma_db")
+CHROMA_DB_PATH = os.path.join(BASE_DIR, "chroma_db")
+
+# Cache embedding của query (nằm ngoài chroma_db để giữ lại qua các lần build)
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", os.path.join(BASE_DIR, "data", "cache", "embedding_cache.sqlite")
+)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))
+
+# Chế độ truy vấn:
+# - vector: chỉ dùng ChromaDB (mặc định)
+# - hybrid: gộp BM25 (lexical) với vector search bằng RRF
+# - lexical: chỉ dùng BM25, không gọi mạng
+RETRIEVER_MODE = os.getenv("RETRIEVER_MODE", "vector")
+
+# Backend cho vector search:
+# - chroma: truy vấn qua Chroma collection (SQLite + HNSW)
+# - numpy: load toàn bộ embedding vào một ma trận NumPy, top-k bằng nhân ma trận
+# - snapshot: như numpy nhưng mmap file snapshot do build_chroma.py export
+#   (các uvicorn worker dùng chung bộ nhớ, load gần như tức thì)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+
+# Timeout khi gọi embedding API, quá hạn thì fallback sang lexical
+EMBEDDING_TIMEOUT_SECONDS = float(os.getenv("EMBEDDING_TIMEOUT_SECONDS", "10"))
+
+# Query cố định cho các endpoint lấy toàn bộ bài học
+DEFAULT_ANALYZER_QUERY = "Toán lớp 4"
+DEFAULT_MINDMAP_QUERY = "toàn bộ bài học"
 
 # Topic Expansion Map - Mapping keywords to related concepts
 TOPIC_EXPANSIONS = {
@@ -26,25 +64,98 @@ TOPIC_EXPANSIONS = {
 }
 
 class RetrieverTool:
-    """Class quản lý việc truy vấn vector store"""
+    """Class quản lý việc truy vấn vector store (kèm BM25 index cho hybrid/lexical)"""
     
-    def __init__(self, db_path: str = CHROMA_DB_PATH):
+    def __init__(self, db_path: str = CHROMA_DB_PATH, mode: str = RETRIEVER_MODE, backend: str = VECTOR_BACKEND):
         self.db_path = db_path
+        self.mode = mode
+        self.backend = backend
+        self.embeddings = None
         self.vectorstore = None
+        self.lexical_index = None
+        self.vector_index = None
+        self._version_watcher = IndexVersionWatcher(db_path)
         self._initialize_vectorstore()
+        self._load_indexes()
     
     def _initialize_vectorstore(self):
         """Khởi tạo vector store từ ChromaDB"""
         try:
-            embeddings = OpenAIEmbeddings()
+            self.embeddings = CachedEmbeddings(
+                OpenAIEmbeddings(request_timeout=EMBEDDING_TIMEOUT_SECONDS, max_retries=1),
+                SQLiteEmbeddingCache(EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+            )
             self.vectorstore = Chroma(
                 persist_directory=self.db_path,
-                embedding_function=embeddings
+                embedding_function=self.embeddings
             )
         except Exception as e:
             print(f"Lỗi khi khởi tạo vectorstore: {e}")
             self.vectorstore = None
     
+    def _load_lexical_index(self):
+        """Đọc BM25 index được build cùng ChromaDB (nếu có)"""
+        path = os.path.join(self.db_path, LEXICAL_INDEX_FILE)
+        if not os.path.exists(path):
+            self.lexical_index = None
+            return
+        try:
+            self.lexical_index = BM25Index.load(path)
+            print(f"[RETRIEVER] Đã load lexical index: {len(self.lexical_index)} chunks (mode: {self.mode})")
+        except Exception as e:
+            print(f"Lỗi khi load lexical index: {e}")
+            self.lexical_index = None
+    
+    def _load_vector_index(self):
+        """Load NumPy index (VECTOR_BACKEND=numpy) hoặc mmap snapshot (VECTOR_BACKEND=snapshot)"""
+        self.vector_index = None
+        if self.backend not in ("numpy", "snapshot") or self.vectorstore is None or self.mode == "lexical":
+            return
+        try:
+            start = time.perf_counter()
+            if self.backend == "snapshot":
+                snapshot = load_snapshot(self.db_path, self._version_watcher.version or None)
+                if snapshot is None:
+                    print("[RETRIEVER] Chưa có snapshot hợp lệ (chạy lại build_chroma.py), dùng Chroma")
+                    return
+                self.vector_index = snapshot.to_index()
+            else:
+                self.vector_index = NumpyVectorIndex.from_collection(self.vectorstore._collection)
+            print(f"[RETRIEVER] Đã load {self.backend} index: {len(self.vector_index)} chunks "
+                  f"trong {(time.perf_counter() - start) * 1000:.0f}ms")
+        except Exception as e:
+            print(f"Lỗi khi load {self.backend} index, dùng Chroma: {e}")
+            self.vector_index = None
+    
+    def _load_indexes(self):
+        self._load_lexical_index()
+        self._load_vector_index()
+    
+    def _refresh_indexes(self):
+        """Load lại BM25/NumPy index khi vector store được build lại"""
+        if self._version_watcher.changed():
+            self._load_indexes()
+    
+    def can_embed(self) -> bool:
+        """Có dùng embedding API không (mode lexical không gọi mạng)"""
+        return self.embeddings is not None and self.mode != "lexical"
+    
+    async def aembed_query(self, query: str) -> List[float]:
+        """Embed câu hỏi bằng cùng embedding model với vector store"""
+        if self.embeddings is None:
+            raise RuntimeError("Embedding model chưa được khởi tạo")
+        return await self.embeddings.aembed_query(query)
+    
+    def warmup(self, queries: List[str]):
+        """Embed trước các query cố định (chỉ gọi API cho query chưa có trong cache)"""
+        if self.embeddings is None or self.mode == "lexical":
+            return
+        try:
+            self.embeddings.embed_queries(queries)
+            print(f"[RETRIEVER] Đã warmup embedding cache: {self.embeddings.stats()}")
+        except Exception as e:
+            print(f"[RETRIEVER] Lỗi khi warmup embedding cache: {e}")
+    
     def retrieve(self, query: str, k: int = 3, lesson_id: str = None) -> List[Dict]:
         """
         Truy vấn các đoạn nội dung liên quan từ vector store với metadata
@@ -57,32 +168,137 @@ class RetrieverTool:
         Returns:
             List các dict chứa content và metadata (source, lesson_id)
         """
-        if self.vectorstore is None:
-            return [{"content": "Chưa có dữ liệu bài giảng trong hệ thống.", "source": "system"}]
+        return self.retrieve_many([query], k=k, lesson_id=lesson_id)[0]
+    
+    async def aretrieve(self, query: str, k: int = 3, lesson_id: str = None) -> List[Dict]:
+        """
+        Bản async của retrieve (không block event loop)
         
-        try:
-            # Nếu có lesson_id, filter theo metadata
-            if lesson_id:
-                docs = self.vectorstore.similarity_search(
-                    query, 
-                    k=k,
-                    filter={"lesson_id": lesson_id}
-                )
-            else:
-                docs = self.vectorstore.similarity_search(query, k=k)
+        Args:
+            query: Câu hỏi/truy vấn
+            k: Số lượng kết quả trả về
+            lesson_id: ID của bài giảng (filter theo metadata)
             
-            # Trả về content + metadata
+        Returns:
+            List các dict chứa content và metadata (source, lesson_id)
+        """
+        return (await self.aretrieve_many([query], k=k, lesson_id=lesson_id))[0]
+    
+    def _query_collection(self, vectors: List[List[float]], k: int, lesson_id: str = None) -> List[List[Dict]]:
+        """Gửi nhiều query embedding trong MỘT lần gọi collection.query của Chroma"""
+        response = self.vectorstore._collection.query(
+            query_embeddings=vectors,
+            n_results=k,
+            where={"lesson_id": lesson_id} if lesson_id else None,
+            include=["documents", "metadatas"]
+        )
+        
+        results_per_query = []
+        for documents, metadatas in zip(response["documents"], response["metadatas"]):
             results = []
-            for doc in docs:
+            for content, metadata in zip(documents, metadatas):
+                metadata = metadata or {}
                 results.append({
-                    "content": doc.page_content,
-                    "source": doc.metadata.get("source", "unknown"),
-                    "lesson_id": doc.metadata.get("lesson_id", "")
+                    "content": content,
+                    "source": metadata.get("source", "unknown"),
+                    "lesson_id": metadata.get("lesson_id", "")
                 })
-            return results
+            results_per_query.append(results)
+        return results_per_query
+    
+    def _query_vectors(self, vectors: List[List[float]], k: int, lesson_id: str = None) -> List[List[Dict]]:
+        """Vector search theo backend đã cấu hình"""
+        if self.vector_index is not None:
+            return self.vector_index.search_many(vectors, k=k, lesson_id=lesson_id)
+        return self._query_collection(vectors, k, lesson_id)
+    
+    def _lexical_many(self, queries: List[str], k: int, lesson_id: str = None) -> List[List[Dict]]:
+        """Truy vấn BM25 cho từng query (không gọi mạng)"""
+        return [self.lexical_index.search(query, k=k, lesson_id=lesson_id) for query in queries]
+    
+    def _combine(self, queries: List[str], vector_results: List[List[Dict]], k: int, lesson_id: str = None) -> List[List[Dict]]:
+        """Hybrid: gộp kết quả vector và BM25 của từng query bằng RRF"""
+        if self.mode != "hybrid" or self.lexical_index is None:
+            return vector_results
+        lexical_results = self._lexical_many(queries, k, lesson_id)
+        return [
+            reciprocal_rank_fusion([vector, lexical])[:k]
+            for vector, lexical in zip(vector_results, lexical_results)
+        ]
+    
+    def _search(self, queries: List[str], vectors: List[List[float]], k: int, lesson_id: str = None) -> List[List[Dict]]:
+        """Vector search rồi gộp với BM25 (hybrid), vector search lỗi thì fallback"""
+        try:
+            vector_results = self._query_vectors(vectors, k, lesson_id)
+        except Exception as e:
+            return self._fallback(queries, k, lesson_id, e)
+        return self._combine(queries, vector_results, k, lesson_id)
+    
+    def _fallback(self, queries: List[str], k: int, lesson_id: str, error: Exception) -> List[List[Dict]]:
+        """Vector search lỗi (embedding API chậm/lỗi) → dùng BM25 nếu có"""
+        print(f"Lỗi khi truy vấn: {error}")
+        if self.lexical_index is not None:
+            print("[RETRIEVER] Fallback sang lexical retrieval")
+            return self._lexical_many(queries, k, lesson_id)
+        return [[{"content": "Không thể truy vấn dữ liệu bài giảng.", "source": "error"}] for _ in queries]
+    
+    def _lexical_only(self, queries: List[str], k: int, lesson_id: str = None):
+        """Kết quả khi chỉ dùng lexical (mode lexical hoặc chưa có vector store), None nếu cần vector"""
+        self._refresh_indexes()
+        if self.mode == "lexical" or self.vectorstore is None:
+            if self.lexical_index is not None:
+                return self._lexical_many(queries, k, lesson_id)
+            if self.vectorstore is None:
+                return [[{"content": "Chưa có dữ liệu bài giảng trong hệ thống.", "source": "system"}] for _ in queries]
+        return None
+    
+    def retrieve_many(self, queries: List[str], k: int = 3, lesson_id: str = None) -> List[List[Dict]]:
+        """
+        Truy vấn nhiều query cùng lúc: embed theo batch (1 request cho các query
+        chưa cache) và query Chroma 1 lần với nhiều embedding
+        
+        Args:
+            queries: Danh sách câu truy vấn
+            k: Số lượng kết quả cho mỗi query
+            lesson_id: ID của bài giảng (filter theo metadata)
+            
+        Returns:
+            List kết quả, mỗi phần tử ứng với một query
+        """
+        lexical_results = self._lexical_only(queries, k, lesson_id)
+        if lexical_results is not None:
+            return lexical_results
+        
+        try:
+            vectors = self.embeddings.embed_queries(queries)
+        except Exception as e:
+            return self._fallback(queries, k, lesson_id, e)
+        
+        return self._search(queries, vectors, k, lesson_id)
+    
+    async def aretrieve_many(self, queries: List[str], k: int = 3, lesson_id: str = None) -> List[List[Dict]]:
+        """
+        Bản async của retrieve_many (không block event loop)
+        
+        Args:
+            queries: Danh sách câu truy vấn
+            k: Số lượng kết quả cho mỗi query
+            lesson_id: ID của bài giảng (filter theo metadata)
+            
+        Returns:
+            List kết quả, mỗi phần tử ứng với một query
+        """
+        # Load lại index, BM25 và vector search đều chạy trong thread pool
+        lexical_results = await asyncio.to_thread(self._lexical_only, queries, k, lesson_id)
+        if lexical_results is not None:
+            return lexical_results
+        
+        try:
+            vectors = await self.embeddings.aembed_queries(queries)
         except Exception as e:
-            print(f"Lỗi khi truy vấn: {e}")
-            return [{"content": "Không thể truy vấn dữ liệu bài giảng.", "source": "error"}]
+            return await asyncio.to_thread(self._fallback, queries, k, lesson_id, e)
+        
+        return await asyncio.to_thread(self._search, queries, vectors, k, lesson_id)
 
 def expand_query(query: str) -> List[str]:
     """
@@ -107,39 +323,68 @@ def expand_query(query: str) -> List[str]:
     return expanded
 
 
-def deduplicate_results(results: List[Dict]) -> List[Dict]:
+def reciprocal_rank_fusion(results_per_query: List[List[Dict]], rrf_k: int = 60) -> List[Dict]:
     """
-    Loại bỏ duplicate results dựa trên content
+    Gộp kết quả của nhiều query bằng Reciprocal Rank Fusion (RRF)
+    
+    Mỗi đoạn được cộng điểm 1 / (rrf_k + rank) ở mỗi danh sách nó xuất hiện,
+    nên đoạn xếp hạng cao ở nhiều query được ưu tiên (thay vì "thấy trước thắng").
     
     Args:
-        results: List các results
+        results_per_query: List kết quả đã xếp hạng của từng query
+        rrf_k: Hằng số làm mượt của RRF
         
     Returns:
-        List đã deduplicate
+        List đã deduplicate, sắp xếp theo điểm RRF giảm dần
     """
-    seen_contents = set()
-    unique_results = []
+    scores = {}
+    fused = {}
     
-    for result in results:
-        content = result.get("content", "")
-        # Dùng 100 ký tự đầu để check duplicate
-        content_hash = content[:100]
+    for results in results_per_query:
+        for rank, result in enumerate(results, 1):
+            # Dùng 100 ký tự đầu để check duplicate
+            content_hash = result.get("content", "")[:100]
+            scores[content_hash] = scores.get(content_hash, 0.0) + 1.0 / (rrf_k + rank)
+            fused.setdefault(content_hash, result)
+    
+    # sorted ổn định: cùng điểm thì giữ thứ tự xuất hiện đầu tiên
+    ranked = sorted(fused, key=lambda content_hash: scores[content_hash], reverse=True)
+    return [fused[content_hash] for content_hash in ranked]
+
+
+def _fit_budget(results: List[Dict], budget: Optional[PromptBudget]) -> List[Dict]:
+    """Giữ các results vừa ngân sách token (không có budget thì giữ nguyên)"""
+    return budget.pack_chunks(results) if budget else results
+
+
+def format_results(results: List[Dict]) -> str:
+    """
+    Format danh sách results thành context kèm trích dẫn nguồn
+    
+    Args:
+        results: List các dict chứa content và source
         
-        if content_hash not in seen_contents:
-            seen_contents.add(content_hash)
-            unique_results.append(result)
+    Returns:
+        Context dạng "[Nguồn i: source]\ncontent"
+    """
+    formatted_results = []
+    for i, result in enumerate(results, 1):
+        source = result.get("source", "unknown")
+        content = result.get("content", "")
+        formatted_results.append(f"[Nguồn {i}: {source}]\n{content}")
     
-    return unique_results
+    return "\n\n".join(formatted_results)
 
 
-def get_context_smart(query: str, k: int = 10, lesson_id: str = None) -> str:
+def get_context_smart(query: str, k: int = 10, lesson_id: str = None, budget: Optional[PromptBudget] = None) -> str:
     """
     Retrieve thông minh với query expansion
     
     Args:
         query: Câu hỏi gốc
-        k: Số lượng results mong muốn
+        k: Số lượng results tối đa
         lesson_id: ID của bài giảng (optional)
+        budget: Ngân sách token của call site (optional), chỉ giữ các chunk vừa ngân sách
         
     Returns:
         Context đã format với trích dẫn
@@ -147,34 +392,110 @@ def get_context_smart(query: str, k: int = 10, lesson_id: str = None) -> str:
     # Expand query
     expanded_queries = expand_query(query)
     
-    all_results = []
-    
-    # Retrieve với mỗi expanded query
-    k_per_query = max(k // len(expanded_queries), 3)
-    
-    for q in expanded_queries:
-        results = _retriever.retrieve(q, k=k_per_query, lesson_id=lesson_id)
-        all_results.extend(results)
+    # Query gốc + expansion: 1 lần embed (batch) + 1 lần query Chroma
+    results_per_query = _retriever.retrieve_many(expanded_queries, k=k, lesson_id=lesson_id)
     
-    # Deduplicate
-    unique_results = deduplicate_results(all_results)
-    
-    # Lấy top k results
-    top_results = unique_results[:k]
-    
-    # Format với trích dẫn nguồn
-    formatted_results = []
-    for i, result in enumerate(top_results, 1):
-        source = result.get("source", "unknown")
-        content = result.get("content", "")
-        formatted_results.append(f"[Nguồn {i}: {source}]\n{content}")
+    # Gộp bằng RRF, lấy top k results + format với trích dẫn nguồn
+    fused_results = reciprocal_rank_fusion(results_per_query)
+    return format_results(_fit_budget(fused_results[:k], budget))
+
+
+async def aget_context_smart(query: str, k: int = 10, lesson_id: str = None, budget: Optional[PromptBudget] = None) -> str:
+    """
+    Bản async của get_context_smart (không block event loop)
     
-    return "\n\n".join(formatted_results)
+    Args:
+        query: Câu hỏi gốc
+        k: Số lượng results tối đa
+        lesson_id: ID của bài giảng (optional)
+        budget: Ngân sách token của call site (optional)
+        
+    Returns:
+        Context đã format với trích dẫn
+    """
+    expanded_queries = expand_query(query)
+    results_per_query = await _retriever.aretrieve_many(expanded_queries, k=k, lesson_id=lesson_id)
+    fused_results = reciprocal_rank_fusion(results_per_query)
+    return format_results(_fit_budget(fused_results[:k], budget))
 
 
 # Khởi tạo retriever toàn cục
 _retriever = RetrieverTool()
 
+
+# Lesson digest tính sẵn lúc build (cho các endpoint lấy toàn bộ bài học)
+_lesson_digests = LessonDigestStore(CHROMA_DB_PATH)
+
+
+def get_lesson_context(lesson_id: str, budget: Optional[PromptBudget] = None) -> Optional[str]:
+    """
+    Context toàn bộ bài học từ lesson digest (không embed, không vector search)
+    
+    Args:
+        lesson_id: ID của bài giảng
+        budget: Ngân sách token của call site (optional)
+        
+    Returns:
+        Context đã format, hoặc None nếu chưa có digest cho bài này
+    """
+    digest = _lesson_digests.get(lesson_id)
+    if not digest:
+        return None
+    return format_results(_fit_budget(digest["chunks"], budget))
+
+
+def get_lesson_version(lesson_id: str) -> Optional[str]:
+    """Version nội dung của bài giảng (đổi khi transcript của bài thay đổi), None nếu chưa có"""
+    digest = _lesson_digests.get(lesson_id)
+    return digest.get("lesson_version") if digest else None
+
+
+def get_lexical_index() -> Optional[BM25Index]:
+    """BM25 index của retriever toàn cục (load lại nếu vector store vừa được build lại), None nếu chưa có"""
+    _retriever._refresh_indexes()
+    return _retriever.lexical_index
+
+
+async def aget_lexical_index() -> Optional[BM25Index]:
+    """Bản async của get_lexical_index: kiểm tra/load lại index trong thread pool, không block event loop"""
+    return await asyncio.to_thread(get_lexical_index)
+
+
+def list_digest_lessons() -> List[str]:
+    """Các bài giảng đã có lesson digest"""
+    return _lesson_digests.lesson_ids()
+
+
+def warm_embedding_cache():
+    """
+    Warmup embedding cache với các chuỗi cố định: TOPIC_EXPANSIONS và query
+    mặc định của /analyzer, /mindmap. Gọi lúc server khởi động.
+    """
+    queries = list(TOPIC_EXPANSIONS.values()) + [DEFAULT_ANALYZER_QUERY, DEFAULT_MINDMAP_QUERY]
+    _retriever.warmup(queries)
+
+
+def embedding_cache_stats() -> Dict:
+    """Thống kê embedding cache của retriever toàn cục (cho GET /metrics)"""
+    embeddings = getattr(_retriever, "embeddings", None)
+    if isinstance(embeddings, CachedEmbeddings):
+        return embeddings.stats()
+    return {}
+
+
+def can_embed_queries() -> bool:
+    """Retriever toàn cục có embed query được không (False với RETRIEVER_MODE=lexical)"""
+    return _retriever.can_embed()
+
+
+async def aembed_query(query: str) -> List[float]:
+    """
+    Embed câu hỏi bằng embedding model của retriever toàn cục
+    (dùng cho semantic answer cache)
+    """
+    return await _retriever.aembed_query(query)
+
+
 @tool
 def retrieve_context(query: str, lesson_id: str = None) -> str:
     """
@@ -198,14 +519,15 @@ def retrieve_context(query: str, lesson_id: str = None) -> str:
     
     return "\n\n".join(formatted_results)
 
-def get_context(query: str, k: int = 3, lesson_id: str = None) -> str:
+def get_context(query: str, k: int = 3, lesson_id: str = None, budget: Optional[PromptBudget] = None) -> str:
     """
     Hàm helper để lấy ngữ cảnh với trích dẫn nguồn
     
     Args:
         query: Câu hỏi hoặc chủ đề cần tìm thông tin
-        k: Số lượng kết quả
+        k: Số lượng kết quả tối đa
         lesson_id: ID của bài giảng (tùy chọn)
+        budget: Ngân sách token của call site (tùy chọn)
         
     Returns:
         Nội dung liên quan từ bài giảng kèm nguồn trích dẫn
@@ -213,10 +535,21 @@ def get_context(query: str, k: int = 3, lesson_id: str = None) -> str:
     results = _retriever.retrieve(query, k=k, lesson_id=lesson_id)
     
     # Format với trích dẫn nguồn
-    formatted_results = []
-    for i, result in enumerate(results, 1):
-        source = result.get("source", "unknown")
-        content = result.get("content", "")
-        formatted_results.append(f"[Nguồn {i}: {source}]\n{content}")
+    return format_results(_fit_budget(results, budget))
+
+
+async def aget_context(query: str, k: int = 3, lesson_id: str = None, budget: Optional[PromptBudget] = None) -> str:
+    """
+    Bản async của get_context (không block event loop)
     
-    return "\n\n".join(formatted_results)
+    Args:
+        query: Câu hỏi hoặc chủ đề cần tìm thông tin
+        k: Số lượng kết quả tối đa
+        lesson_id: ID của bài giảng (tùy chọn)
+        budget: Ngân sách token của call site (tùy chọn)
+        
+    Returns:
+        Nội dung liên quan từ bài giảng kèm nguồn trích dẫn
+    """
+    results = await _retriever.aretrieve(query, k=k, lesson_id=lesson_id)
+    return format_results(_fit_budget(results, budget))
@@ -1,15 +1,15 @@
 """
 Tool để summarize conversation history nhằm giảm tokens
 """
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from typing import List
+from typing import List, Optional
 from dotenv import load_dotenv
+from ..llm_registry import get_llm
 
 load_dotenv()
 
 # LLM rẻ hơn cho summarization
-summarizer_llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
+summarizer_llm = get_llm("summarizer")
 
 SUMMARIZE_PROMPT = """Bạn là trợ lý tóm tắt cuộc hội thoại. Hãy tóm tắt cuộc hội thoại sau thành 2-3 câu ngắn gọn, giữ lại các thông tin quan trọng:
 
@@ -17,6 +17,35 @@ SUMMARIZE_PROMPT = """Bạn là trợ lý tóm tắt cuộc hội thoại. Hãy
 
 Tóm tắt (ngắn gọn, súc tích):"""
 
+ROLLING_SUMMARIZE_PROMPT = """Bạn là trợ lý tóm tắt cuộc hội thoại. Dưới đây là tóm tắt hiện có và các tin nhắn tiếp theo của cuộc hội thoại. Hãy cập nhật tóm tắt thành 2-3 câu ngắn gọn, giữ lại các thông tin quan trọng:
+
+Tóm tắt hiện có:
+{summary}
+
+Tin nhắn tiếp theo:
+{conversation}
+
+Tóm tắt cập nhật (ngắn gọn, súc tích):"""
+
+
+def _render_messages(messages: List) -> str:
+    """Render messages (LangChain message hoặc MessageRecord của session) thành text hội thoại"""
+    conversation_text = ""
+    for msg in messages:
+        role = getattr(msg, "role", None)
+        if isinstance(msg, HumanMessage) or role == "user":
+            conversation_text += f"Học sinh: {msg.content}\n"
+        elif isinstance(msg, AIMessage) or role == "assistant":
+            conversation_text += f"Trợ giảng: {msg.content}\n"
+    return conversation_text
+
+
+def _split_and_render(messages: List, keep_recent: int):
+    """Chia messages thành old/recent và render old messages thành text"""
+    old_messages = messages[:-keep_recent]
+    recent_messages = messages[-keep_recent:]
+    return _render_messages(old_messages), recent_messages
+
 
 def summarize_old_messages(messages: List, keep_recent: int = 4) -> List:
     """
@@ -33,17 +62,7 @@ def summarize_old_messages(messages: List, keep_recent: int = 4) -> List:
     if len(messages) <= keep_recent:
         return messages
     
-    # Chia messages thành old và recent
-    old_messages = messages[:-keep_recent]
-    recent_messages = messages[-keep_recent:]
-    
-    # Tạo text từ old messages
-    conversation_text = ""
-    for msg in old_messages:
-        if isinstance(msg, HumanMessage):
-            conversation_text += f"Học sinh: {msg.content}\n"
-        elif isinstance(msg, AIMessage):
-            conversation_text += f"Trợ giảng: {msg.content}\n"
+    conversation_text, recent_messages = _split_and_render(messages, keep_recent)
     
     # Summarize
     try:
@@ -62,3 +81,65 @@ def summarize_old_messages(messages: List, keep_recent: int = 4) -> List:
         print(f"Lỗi khi summarize: {e}")
         # Fallback: chỉ giữ recent messages
         return recent_messages
+
+
+async def asummarize_old_messages(messages: List, keep_recent: int = 4) -> List:
+    """
+    Bản async của summarize_old_messages (không block event loop)
+    
+    Args:
+        messages: List of messages (HumanMessage, AIMessage)
+        keep_recent: Số messages gần nhất cần giữ nguyên
+        
+    Returns:
+        List mới với: [SystemMessage(summary), ...recent_messages]
+    """
+    if len(messages) <= keep_recent:
+        return messages
+    
+    conversation_text, recent_messages = _split_and_render(messages, keep_recent)
+    
+    try:
+        prompt = SUMMARIZE_PROMPT.format(conversation=conversation_text)
+        summary = await summarizer_llm.ainvoke([HumanMessage(content=prompt)])
+        
+        summary_message = SystemMessage(
+            content=f"Tóm tắt cuộc hội thoại trước: {summary.content}"
+        )
+        
+        return [summary_message] + recent_messages
+        
+    except Exception as e:
+        print(f"Lỗi khi summarize: {e}")
+        return recent_messages
+
+
+async def afold_into_summary(summary: str, messages: List) -> Optional[str]:
+    """
+    Gộp các messages vừa bị đẩy ra khỏi cửa sổ gần nhất vào tóm tắt hiện có
+    
+    Chỉ gửi tóm tắt cũ + messages mới cho LLM (không gửi lại toàn bộ lịch sử),
+    nên chi phí mỗi lần gộp không tăng theo độ dài cuộc hội thoại.
+    
+    Args:
+        summary: Tóm tắt hiện có ("" nếu chưa có)
+        messages: Các messages cần gộp vào tóm tắt
+        
+    Returns:
+        Tóm tắt mới, hoặc None nếu lỗi (giữ nguyên tóm tắt và messages cũ)
+    """
+    conversation_text = _render_messages(messages)
+    if not conversation_text:
+        return summary
+    
+    try:
+        if summary:
+            prompt = ROLLING_SUMMARIZE_PROMPT.format(summary=summary, conversation=conversation_text)
+        else:
+            prompt = SUMMARIZE_PROMPT.format(conversation=conversation_text)
+        result = await summarizer_llm.ainvoke([HumanMessage(content=prompt)])
+        return result.content
+    
+    except Exception as e:
+        print(f"Lỗi khi summarize: {e}")
+        return None
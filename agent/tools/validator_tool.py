@@ -1,14 +1,15 @@
 """
 Validator tool - Tự kiểm tra câu trả lời để giảm hallucination
 """
-from langchain_openai import ChatOpenAI
+import json
 from langchain_core.messages import SystemMessage, HumanMessage
 from dotenv import load_dotenv
+from ..llm_registry import get_llm
 
 load_dotenv()
 
-# LLM cho validation (dùng GPT-4 để chính xác hơn)
-validator_llm = ChatOpenAI(model="gpt-4", temperature=0)
+# Validator với JSON mode, GPT-4 để chính xác hơn (dùng chung cho bản sync và async)
+validator_llm_json = get_llm("validator")
 
 VALIDATION_PROMPT = """Bạn là chuyên gia kiểm tra độ chính xác của câu trả lời giáo dục.
 
@@ -45,6 +46,50 @@ Trả về JSON với format:
 Chỉ trả về JSON, không thêm text:"""
 
 
+def _build_validation_messages(question: str, answer: str, context: str) -> list:
+    """Tạo messages cho validation"""
+    prompt = VALIDATION_PROMPT.format(
+        context=context,
+        question=question,
+        answer=answer
+    )
+    
+    return [
+        SystemMessage(content="Bạn là chuyên gia validation, luôn trả về JSON hợp lệ."),
+        HumanMessage(content=prompt)
+    ]
+
+
+def _parse_validation_response(content: str, answer: str) -> dict:
+    """Parse JSON validation và đảm bảo có đủ fields"""
+    result = json.loads(content)
+    
+    if "is_valid" not in result:
+        result["is_valid"] = True
+    if "confidence" not in result:
+        result["confidence"] = 70
+    if "issues" not in result:
+        result["issues"] = []
+    if "suggestions" not in result:
+        result["suggestions"] = ""
+    if "corrected_answer" not in result:
+        result["corrected_answer"] = answer
+    
+    return result
+
+
+def _validation_fallback(answer: str, error: Exception) -> dict:
+    """Fallback khi không validate được: chấp nhận câu trả lời"""
+    print(f"Lỗi validation: {error}")
+    return {
+        "is_valid": True,
+        "confidence": 50,
+        "issues": [f"Không thể validate: {str(error)}"],
+        "suggestions": "",
+        "corrected_answer": answer
+    }
+
+
 def validate_answer(question: str, answer: str, context: str) -> dict:
     """
     Tự động kiểm tra câu trả lời để phát hiện hallucination
@@ -58,54 +103,29 @@ def validate_answer(question: str, answer: str, context: str) -> dict:
         dict với is_valid, confidence, issues, suggestions, corrected_answer
     """
     try:
-        prompt = VALIDATION_PROMPT.format(
-            context=context,
-            question=question,
-            answer=answer
-        )
-        
-        messages = [
-            SystemMessage(content="Bạn là chuyên gia validation, luôn trả về JSON hợp lệ."),
-            HumanMessage(content=prompt)
-        ]
-        
-        # Gọi LLM với JSON mode
-        llm_json = ChatOpenAI(
-            model="gpt-4",
-            temperature=0,
-            model_kwargs={"response_format": {"type": "json_object"}}
-        )
-        
-        response = llm_json.invoke(messages)
-        
-        # Parse JSON
-        import json
-        result = json.loads(response.content)
-        
-        # Đảm bảo có đủ fields
-        if "is_valid" not in result:
-            result["is_valid"] = True
-        if "confidence" not in result:
-            result["confidence"] = 70
-        if "issues" not in result:
-            result["issues"] = []
-        if "suggestions" not in result:
-            result["suggestions"] = ""
-        if "corrected_answer" not in result:
-            result["corrected_answer"] = answer
-            
-        return result
+        response = validator_llm_json.invoke(_build_validation_messages(question, answer, context))
+        return _parse_validation_response(response.content, answer)
+    except Exception as e:
+        return _validation_fallback(answer, e)
+
+
+async def avalidate_answer(question: str, answer: str, context: str) -> dict:
+    """
+    Bản async của validate_answer (không block event loop)
+    
+    Args:
+        question: Câu hỏi gốc
+        answer: Câu trả lời cần kiểm tra
+        context: Ngữ cảnh từ bài học
         
+    Returns:
+        dict với is_valid, confidence, issues, suggestions, corrected_answer
+    """
+    try:
+        response = await validator_llm_json.ainvoke(_build_validation_messages(question, answer, context))
+        return _parse_validation_response(response.content, answer)
     except Exception as e:
-        print(f"Lỗi validation: {e}")
-        # Fallback: chấp nhận câu trả lời
-        return {
-            "is_valid": True,
-            "confidence": 50,
-            "issues": [f"Không thể validate: {str(e)}"],
-            "suggestions": "",
-            "corrected_answer": answer
-        }
+        return _validation_fallback(answer, e)
 
 
 def should_use_validation(intent: str = "normal") -> bool:
@@ -2,7 +2,7 @@
 FastAPI Backend cho hệ thống Agentic RAG
 """
 import json
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
@@ -11,14 +11,28 @@ from dotenv import load_dotenv
 import os
 from pathlib import Path
 import asyncio
-from langchain_core.messages import HumanMessage
+import time
+from langchain_core.messages import AIMessageChunk
 
-from agent.graph import compiled_graph
+from agent.graph import compiled_graph, schedule_history_compaction
 from agent.memory import session_memory
-from agent.tools.analyzer_tool import analyze_with_data
-from agent.tools.mindmap_tool import generate_mindmap_with_context
-from agent.tools.retriever_tool import get_context
-from agent.tools.summarizer_tool import summarize_old_messages
+from agent.metrics import request_metrics
+from agent.mindmap_store import mindmap_store
+from agent.semantic_cache import answer_cache
+from agent.streaming import STREAM_TAG_TEXT, STREAM_TAG_JSON_ANSWER, JsonFieldStreamer
+from agent.prompt_budget import prompt_budget_stats
+from agent.tools.analyzer_tool import ANALYZER_BUDGET, aanalyze_with_data
+from agent.tools.explain_tool import arevise_explanation
+from agent.tools.mindmap_tool import MINDMAP_BUDGET, agenerate_mindmap_data_with_context
+from agent.tools.retriever_tool import (
+    aget_context,
+    get_lesson_context,
+    get_lesson_version,
+    embedding_cache_stats,
+    warm_embedding_cache,
+    DEFAULT_ANALYZER_QUERY,
+    DEFAULT_MINDMAP_QUERY,
+)
 
 # Load environment variables
 load_dotenv()
@@ -34,6 +48,20 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Số học sinh được phân tích cùng lúc trong POST /analyzer/batch
+ANALYZER_BATCH_CONCURRENCY = int(os.getenv("ANALYZER_BATCH_CONCURRENCY", "5"))
+
+# /chat/stream deep mode: stream giải thích xong là xong câu trả lời, validator LLM chạy ở
+# background và gửi event correction nếu phải sửa (1 = bật)
+BACKGROUND_VALIDATION = os.getenv("BACKGROUND_VALIDATION", "0") == "1"
+
+# Kích thước mặc định của một trang GET /session
+SESSION_PAGE_LIMIT = int(os.getenv("SESSION_PAGE_LIMIT", "100"))
+SESSION_PAGE_MAX_BYTES = int(os.getenv("SESSION_PAGE_MAX_BYTES", "65536"))
+
+# Session bị evict/hết hạn hoặc bị xóa (DELETE /session) thì xóa luôn checkpoint của thread trong graph
+session_memory.on_evict = compiled_graph.checkpointer.delete_thread
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -44,6 +72,12 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def warmup_caches():
+    """Warmup embedding cache ở background, không chặn server khởi động"""
+    asyncio.create_task(asyncio.to_thread(warm_embedding_cache))
+
+
 # Request/Response models
 class ChatRequest(BaseModel):
     thread_id: str
@@ -63,6 +97,12 @@ class AnalyzerRequest(BaseModel):
     topic: Optional[str] = ""
 
 
+class AnalyzerBatchRequest(BaseModel):
+    thread_ids: List[str]  # Các học sinh của cùng một bài học
+    lesson_id: Optional[str] = None
+    topic: Optional[str] = ""
+
+
 class AnalyzerResponse(BaseModel):
     analysis: str
     thread_id: str
@@ -94,12 +134,19 @@ class LessonsResponse(BaseModel):
     lessons: List[LessonInfo]
 
 
+def _sse(data: Dict[str, Any]) -> str:
+    """Format một Server-Sent Event"""
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 class UserLevelResponse(BaseModel):
     thread_id: str
     level: str  # Beginner/Intermediate/Advanced
     level_reason: str
     messages_count: int
     has_conversation: bool
+    user_questions: int = 0  # Số câu hỏi của học sinh
+    deep_count: int = 0  # Số từ khóa học sâu khác nhau đã xuất hiện
 
 
 @app.get("/", response_model=HealthResponse)
@@ -151,62 +198,37 @@ async def chat_endpoint(request: ChatRequest):
     Returns:
         ChatResponse với câu trả lời từ agent
     """
+    start_time = time.perf_counter()
     try:
-        # Lấy session hiện tại để lưu vào SessionMemory (cho analyzer)
-        session = session_memory.get_session(request.thread_id)
+        # Lưu user message vào SessionMemory (lịch sử hội thoại duy nhất của thread)
+        await session_memory.aadd_message(request.thread_id, "user", request.user_message)
         
-        # Lưu user message vào session
-        session["messages"].append({
-            "role": "user",
-            "content": request.user_message
-        })
-        
-        # Tạo input state với message mới
-        # LangGraph sẽ tự động merge với messages cũ từ checkpoint
+        # Graph chỉ nhận câu hỏi hiện tại, không giữ messages trong checkpoint
         input_state = {
-            "messages": [HumanMessage(content=request.user_message)],
-            "lesson_id": request.lesson_id or ""
+            "current_query": request.user_message,
+            "lesson_id": request.lesson_id or "",
+            "reply": "",
+            "defer_validation": False,
         }
         
-        # Config để load history
         config = {"configurable": {"thread_id": request.thread_id}}
         
-        # Tối ưu: Lấy state hiện tại để summarize messages nếu cần
-        try:
-            current_state = compiled_graph.get_state(config)
-            if current_state and current_state.values.get("messages"):
-                all_messages = current_state.values["messages"] + [HumanMessage(content=request.user_message)]
-                
-                # Summarize nếu có >6 messages (giữ 4 messages gần nhất + summary)
-                if len(all_messages) > 6:
-                    summarized = summarize_old_messages(all_messages, keep_recent=4)
-                    input_state["messages"] = summarized
-        except:
-            # Nếu không lấy được state, tiếp tục với message mới
-            pass
-        
-        # Invoke graph - LangGraph tự load history từ MemorySaver
-        result = compiled_graph.invoke(input_state, config)
+        # Invoke graph (async)
+        result = await compiled_graph.ainvoke(input_state, config)
         
         # Lấy câu trả lời cuối cùng
-        messages = result.get("messages", [])
-        if messages:
-            last_message = messages[-1]
-            reply = last_message.content if hasattr(last_message, 'content') else str(last_message)
-        else:
-            reply = "Xin lỗi, em không thể trả lời câu hỏi này."
+        reply = result.get("reply") or "Xin lỗi, em không thể trả lời câu hỏi này."
         
         # Lưu response vào session
-        session["messages"].append({
-            "role": "assistant",
-            "content": reply
-        })
+        await session_memory.aadd_message(request.thread_id, "assistant", reply)
         
         # Lấy intent nếu có
         intent = result.get("intent", "normal")
         
-        # Update session
-        session_memory.update_session(request.thread_id, session)
+        # Gộp messages cũ vào rolling summary ở background (sau khi đã có câu trả lời)
+        schedule_history_compaction(request.thread_id)
+        
+        request_metrics["chat"].record((time.perf_counter() - start_time) * 1000)
         
         return ChatResponse(
             reply=reply,
@@ -224,68 +246,193 @@ async def chat_endpoint(request: ChatRequest):
 @app.post("/chat/stream")
 async def chat_stream_endpoint(request: ChatRequest):
     """
-    Streaming version của chat endpoint để giảm latency cảm nhận
+    Streaming version của chat endpoint: stream từng token của câu trả lời
+    
+    Event types:
+        retrieval: tiến trình phát hiện intent / truy vấn ngữ cảnh
+        token: token mới của câu trả lời (field chunk)
+        reset: LLM sinh lại câu trả lời (fallback), client xóa text đã nhận
+        replace: câu trả lời cuối khác text đã stream (VD: validator đã sửa)
+        validating: (BACKGROUND_VALIDATION) câu trả lời đã đủ, validator LLM đang kiểm tra
+        correction: (BACKGROUND_VALIDATION) câu trả lời đã được validator sửa (field chunk)
+        done: kết thúc, kèm metrics ttft_ms / total_ms / validation_ms
     
     Returns:
         Server-Sent Events stream với chunks của response
     """
     async def generate():
+        start_time = time.perf_counter()
+        first_token_time = None
+        validation_task = None
         try:
-            # Get/create session
-            session = session_memory.get_session(request.thread_id)
-            
             # Save user message
-            session["messages"].append({
-                "role": "user",
-                "content": request.user_message
-            })
+            await session_memory.aadd_message(request.thread_id, "user", request.user_message)
             
             # Prepare state
             input_state = {
-                "messages": [HumanMessage(content=request.user_message)],
-                "lesson_id": request.lesson_id or ""
+                "current_query": request.user_message,
+                "lesson_id": request.lesson_id or "",
+                "reply": "",
+                "defer_validation": BACKGROUND_VALIDATION,
             }
             
             config = {"configurable": {"thread_id": request.thread_id}}
             
-            # Summarize if needed
-            try:
-                current_state = compiled_graph.get_state(config)
-                if current_state and current_state.values.get("messages"):
-                    all_messages = current_state.values["messages"] + [HumanMessage(content=request.user_message)]
-                    if len(all_messages) > 6:
-                        summarized = summarize_old_messages(all_messages, keep_recent=4)
-                        input_state["messages"] = summarized
-            except:
-                pass
-            
-            # Stream graph execution
+            # Stream graph execution: "updates" cho tiến trình node, "messages" cho token LLM
+            streamed_text = ""
             full_response = ""
-            async for event in compiled_graph.astream(input_state, config):
-                # Tìm AI message trong event
-                if "messages" in event:
-                    for msg in event["messages"]:
-                        if hasattr(msg, 'content') and msg.content:
-                            chunk = msg.content
-                            full_response = chunk
-                            yield f"data: {json.dumps({'chunk': chunk, 'done': False})}\n\n"
+            context = ""
+            active_run_id = None
+            json_streamer = None
+            
+            async for mode, payload in compiled_graph.astream(
+                input_state, config, stream_mode=["updates", "messages"]
+            ):
+                if mode == "messages":
+                    chunk, metadata = payload
+                    tags = metadata.get("tags") or []
+                    
+                    # Chỉ stream token của LLM sinh câu trả lời cho học sinh
+                    if not isinstance(chunk, AIMessageChunk):
+                        continue
+                    if STREAM_TAG_JSON_ANSWER in tags:
+                        is_json = True
+                    elif STREAM_TAG_TEXT in tags:
+                        is_json = False
+                    else:
+                        continue
+                    
+                    # LLM run mới (VD: re-answer sau low confidence)
+                    if chunk.id != active_run_id:
+                        active_run_id = chunk.id
+                        json_streamer = JsonFieldStreamer("answer") if is_json else None
+                        if streamed_text:
+                            streamed_text = ""
+                            yield _sse({"type": "reset", "chunk": "", "done": False})
+                    
+                    text = chunk.content if isinstance(chunk.content, str) else ""
+                    token = json_streamer.feed(text) if json_streamer else text
+                    if token:
+                        if first_token_time is None:
+                            first_token_time = time.perf_counter()
+                        streamed_text += token
+                        yield _sse({"type": "token", "chunk": token, "done": False})
+                
+                elif mode == "updates":
+                    for node, update in payload.items():
+                        if not update:
+                            continue
+                        if node == "intent":
+                            yield _sse({"type": "retrieval", "stage": "started", "intent": update.get("intent", "normal"), "done": False})
+                        elif node == "cache" and update.get("cached_answer"):
+                            yield _sse({"type": "retrieval", "stage": "cache_hit", "done": False})
+                        elif node == "retrieve":
+                            context = update.get("context", "")
+                            sources = context.count("[Nguồn ")
+                            yield _sse({"type": "retrieval", "stage": "done", "sources": sources, "done": False})
+                        elif node in ("answer", "explain") and update.get("reply"):
+                            full_response = update["reply"]
+                            if update.get("needs_validation"):
+                                # Validator LLM bắt đầu ngay, song song với phần còn lại của stream
+                                validation_task = asyncio.create_task(
+                                    arevise_explanation(request.user_message, full_response, context)
+                                )
+            
+            # Câu trả lời cuối khác với text đã stream (fallback/validator/out-of-scope)
+            if full_response and full_response != streamed_text:
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                yield _sse({"type": "replace", "chunk": full_response, "done": False})
+            
+            # Grounding check local không qua: học sinh đã có giải thích, gửi bản sửa (nếu có) sau
+            validation_ms = None
+            if validation_task:
+                answer_time = time.perf_counter()
+                yield _sse({"type": "validating", "done": False})
+                corrected = await validation_task
+                validation_ms = (time.perf_counter() - answer_time) * 1000
+                if corrected != full_response:
+                    full_response = corrected
+                    yield _sse({"type": "correction", "chunk": corrected, "done": False})
             
             # Save assistant message
-            session["messages"].append({
-                "role": "assistant",
-                "content": full_response
-            })
-            session_memory.update_session(request.thread_id, session)
+            await session_memory.aadd_message(request.thread_id, "assistant", full_response)
+            
+            # Metrics: time-to-first-token và total time
+            end_time = time.perf_counter()
+            total_ms = (end_time - start_time) * 1000
+            ttft_ms = (first_token_time - start_time) * 1000 if first_token_time else None
+            request_metrics["chat_stream"].record(total_ms, ttft_ms)
+            print(f"[STREAM] thread={request.thread_id} ttft={ttft_ms or 0:.0f}ms total={total_ms:.0f}ms")
             
             # Send final event
-            yield f"data: {json.dumps({'chunk': '', 'done': True, 'thread_id': request.thread_id})}\n\n"
+            yield _sse({
+                "type": "done",
+                "chunk": "",
+                "done": True,
+                "thread_id": request.thread_id,
+                "metrics": {
+                    "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+                    "total_ms": round(total_ms, 1),
+                    "validation_ms": round(validation_ms, 1) if validation_ms is not None else None,
+                }
+            })
+            
+            # Gộp messages cũ vào rolling summary sau khi client đã nhận done
+            schedule_history_compaction(request.thread_id)
             
         except Exception as e:
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            yield _sse({"type": "error", "error": str(e)})
+        finally:
+            # Client ngắt kết nối / lỗi giữa chừng: không để validator chạy tiếp
+            if validation_task and not validation_task.done():
+                validation_task.cancel()
     
     return StreamingResponse(generate(), media_type="text/event-stream")
 
 
+async def _analyzer_transcript(lesson_id: Optional[str], topic: Optional[str]) -> str:
+    """
+    Transcript bài học cho analyzer: không có topic thì dùng lesson digest tính sẵn
+    (tối đa 5 chunks, cắt theo ngân sách token của analyzer)
+    """
+    transcript = None if topic else get_lesson_context(lesson_id, budget=ANALYZER_BUDGET)
+    if transcript is None:
+        transcript = await aget_context(topic or DEFAULT_ANALYZER_QUERY, k=5, lesson_id=lesson_id, budget=ANALYZER_BUDGET)
+    return transcript
+
+
+async def _analyze_thread(thread_id: str, transcript: str) -> AnalyzerResponse:
+    """Phân tích hội thoại của một thread với transcript đã lấy sẵn, lưu level vào session"""
+    # Lấy conversation history từ session
+    conversation_history = await session_memory.aget_conversation_history(thread_id)
+    
+    if not conversation_history:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Không tìm thấy lịch sử hội thoại cho thread_id: {thread_id}"
+        )
+    
+    # Rolling summary của thread thay cho các lượt cũ không vừa ngân sách history
+    summary = await session_memory.aget_summary(thread_id)
+    
+    # Level tính từ chỉ số cập nhật theo từng message, không quét lại history
+    level = await session_memory.aget_live_level(thread_id)
+    
+    # Phân tích (bao gồm đánh giá level)
+    result = await aanalyze_with_data(conversation_history, transcript, summary, level)
+    
+    # Lưu level vào session
+    await session_memory.aset_level(thread_id, result["level"], result["level_reason"])
+    
+    return AnalyzerResponse(
+        analysis=result["analysis"],
+        thread_id=thread_id,
+        level=result["level"],
+        level_reason=result["level_reason"]
+    )
+
+
 @app.post("/analyzer", response_model=AnalyzerResponse)
 async def analyzer_endpoint(request: AnalyzerRequest):
     """
@@ -298,34 +445,16 @@ async def analyzer_endpoint(request: AnalyzerRequest):
         AnalyzerResponse với kết quả phân tích
     """
     try:
-        # Lấy conversation history từ session
-        conversation_history = session_memory.get_conversation_history(request.thread_id)
-        
-        if not conversation_history:
+        # Kiểm tra trước khi retrieve transcript (chỉ đọc chỉ số của session)
+        live = await session_memory.aget_live_level(request.thread_id)
+        if not live or not live["messages_count"]:
             raise HTTPException(
                 status_code=404,
                 detail=f"Không tìm thấy lịch sử hội thoại cho thread_id: {request.thread_id}"
             )
         
-        # Lấy transcript (Tối ưu: k=10→5 để giảm tokens cho analyzer)
-        topic = request.topic if request.topic else "Toán lớp 4"
-        transcript = get_context(topic, k=5, lesson_id=request.lesson_id)
-        
-        # Phân tích (bao gồm đánh giá level)
-        result = analyze_with_data(conversation_history, transcript)
-        
-        # Lưu level vào session
-        session = session_memory.get_session(request.thread_id)
-        session["latest_level"] = result["level"]
-        session["level_reason"] = result["level_reason"]
-        session_memory.update_session(request.thread_id, session)
-        
-        return AnalyzerResponse(
-            analysis=result["analysis"],
-            thread_id=request.thread_id,
-            level=result["level"],
-            level_reason=result["level_reason"]
-        )
+        transcript = await _analyzer_transcript(request.lesson_id, request.topic)
+        return await _analyze_thread(request.thread_id, transcript)
     
     except HTTPException:
         raise
@@ -336,6 +465,72 @@ async def analyzer_endpoint(request: AnalyzerRequest):
         )
 
 
+@app.post("/analyzer/batch")
+async def analyzer_batch_endpoint(request: AnalyzerBatchRequest):
+    """
+    Phân tích cả lớp cho một bài học: transcript chỉ lấy một lần, các học sinh được
+    phân tích song song (tối đa ANALYZER_BATCH_CONCURRENCY LLM call cùng lúc)
+    
+    Event types:
+        started: tổng số học sinh, mức concurrency
+        result: kết quả của một học sinh (gửi ngay khi xong, không theo thứ tự request)
+        error: lỗi của một học sinh (không ảnh hưởng các học sinh khác)
+        done: kết thúc, kèm số học sinh thành công/lỗi và total_ms
+    
+    Returns:
+        Server-Sent Events stream với kết quả từng học sinh
+    """
+    # Bỏ thread_id trùng, giữ thứ tự
+    thread_ids = list(dict.fromkeys(request.thread_ids))
+    if not thread_ids:
+        raise HTTPException(status_code=400, detail="thread_ids không được rỗng")
+    
+    start_time = time.perf_counter()
+    try:
+        transcript = await _analyzer_transcript(request.lesson_id, request.topic)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Lỗi khi lấy transcript: {str(e)}"
+        )
+    
+    semaphore = asyncio.Semaphore(ANALYZER_BATCH_CONCURRENCY)
+    
+    async def analyze_one(thread_id: str) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                result = await _analyze_thread(thread_id, transcript)
+                return {"type": "result", **result.model_dump(), "done": False}
+            except HTTPException as e:
+                return {"type": "error", "thread_id": thread_id, "status_code": e.status_code, "error": e.detail, "done": False}
+            except Exception as e:
+                print(f"[ANALYZER] Lỗi khi phân tích {thread_id}: {e}")
+                return {"type": "error", "thread_id": thread_id, "status_code": 500, "error": str(e), "done": False}
+    
+    async def generate():
+        tasks = [asyncio.create_task(analyze_one(thread_id)) for thread_id in thread_ids]
+        succeeded = failed = 0
+        try:
+            yield _sse({"type": "started", "total": len(thread_ids), "concurrency": ANALYZER_BATCH_CONCURRENCY, "done": False})
+            for next_result in asyncio.as_completed(tasks):
+                event = await next_result
+                if event["type"] == "result":
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield _sse(event)
+            
+            total_ms = (time.perf_counter() - start_time) * 1000
+            print(f"[ANALYZER] Batch {len(thread_ids)} học sinh: {succeeded} ok, {failed} lỗi ({total_ms:.0f}ms)")
+            yield _sse({"type": "done", "succeeded": succeeded, "failed": failed, "total_ms": round(total_ms, 1), "done": True})
+        finally:
+            # Client ngắt kết nối giữa chừng: hủy các phân tích chưa chạy xong
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
+
 @app.post("/mindmap", response_model=MindmapResponse)
 async def mindmap_endpoint(request: MindmapRequest):
     """
@@ -348,21 +543,25 @@ async def mindmap_endpoint(request: MindmapRequest):
         MindmapResponse với mindmap JSON cho React Flow
     """
     try:
-        # Lấy context từ bài học (Tối ưu: k=10→7 để giảm tokens)
-        topic = request.topic if request.topic else "toàn bộ bài học"
-        context = get_context(topic, k=7, lesson_id=request.lesson_id)
+        # Mindmap đã tạo cho đúng version nội dung của bài → trả về ngay
+        lesson_version = get_lesson_version(request.lesson_id)
+        if lesson_version:
+            mindmap_data = await mindmap_store.aget(request.lesson_id, request.topic, lesson_version)
+            if mindmap_data is not None:
+                print(f"[MINDMAP] Cache hit: {request.lesson_id} (topic: {request.topic or 'mặc định'})")
+                return MindmapResponse(mindmap_data=mindmap_data, lesson_id=request.lesson_id)
         
-        # Tạo mindmap
-        mindmap_json_str = generate_mindmap_with_context(topic, context)
+        # Lấy context từ bài học: không có topic thì dùng lesson digest tính sẵn
+        # (tối đa 7 chunks, cắt theo ngân sách token của mindmap)
+        topic = request.topic if request.topic else DEFAULT_MINDMAP_QUERY
+        context = None if request.topic else get_lesson_context(request.lesson_id, budget=MINDMAP_BUDGET)
+        if context is None:
+            context = await aget_context(topic, k=7, lesson_id=request.lesson_id, budget=MINDMAP_BUDGET)
         
-        # Parse JSON
-        try:
-            mindmap_data = json.loads(mindmap_json_str)
-        except json.JSONDecodeError:
-            # Fallback nếu không parse được
-            mindmap_data = {
-                "error": "Không thể tạo sơ đồ tư duy cho bài học này."
-            }
+        # Tạo mindmap
+        mindmap_data = await agenerate_mindmap_data_with_context(topic, context)
+        if lesson_version and "error" not in mindmap_data:
+            await mindmap_store.aput(request.lesson_id, request.topic, lesson_version, mindmap_data)
         
         return MindmapResponse(
             mindmap_data=mindmap_data,
@@ -385,7 +584,7 @@ async def clear_session(thread_id: str):
         thread_id: ID của thread cần xóa
     """
     try:
-        session_memory.clear_session(thread_id)
+        await session_memory.aclear_session(thread_id)
         return {"message": f"Đã xóa session {thread_id}"}
     except Exception as e:
         raise HTTPException(
@@ -394,21 +593,43 @@ async def clear_session(thread_id: str):
         )
 
 
+@app.get("/sessions/stats")
+async def get_sessions_stats():
+    """
+    Thống kê SessionMemory: số session, số message, dung lượng ước tính, số lần evict/hết hạn
+    """
+    return await session_memory.astats()
+
+
 @app.get("/session/{thread_id}")
-async def get_session(thread_id: str):
+async def get_session(
+    thread_id: str,
+    cursor: int = Query(0, ge=0, description="Chỉ số message bắt đầu (next_cursor của trang trước)"),
+    limit: int = Query(SESSION_PAGE_LIMIT, ge=1, le=1000, description="Số message tối đa"),
+    max_bytes: int = Query(SESSION_PAGE_MAX_BYTES, ge=1, description="Dung lượng tối đa của history (byte)"),
+):
     """
-    Lấy thông tin session
+    Lấy thông tin session, history phân trang theo cursor
+    
+    Polling: gọi lại với cursor=next_cursor để chỉ nhận các message mới.
     
     Args:
         thread_id: ID của thread
+        cursor: Chỉ số message đầu tiên của trang
+        limit: Số message tối đa của trang
+        max_bytes: Dung lượng tối đa của conversation_history (luôn có ít nhất một message)
     """
     try:
-        session = session_memory.get_session(thread_id)
-        return {
-            "thread_id": thread_id,
-            "messages_count": len(session.get("messages", [])),
-            "conversation_history": session_memory.get_conversation_history(thread_id)
-        }
+        page = await session_memory.aget_history_page(thread_id, cursor, limit, max_bytes)
+        if page is None:
+            page = {
+                "conversation_history": "",
+                "cursor": 0,
+                "next_cursor": 0,
+                "has_more": False,
+                "messages_count": 0,
+            }
+        return {"thread_id": thread_id, **page}
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -421,6 +642,9 @@ async def get_user_level(thread_id: str):
     """
     Lấy level của user (cho backend services khác)
     
+    Level tính ngay từ chỉ số cập nhật theo từng message (số câu hỏi, từ khóa học sâu),
+    cùng quy tắc với /analyzer nhưng không gọi LLM và không quét lại history.
+    
     Args:
         thread_id: ID của user/thread
         
@@ -428,11 +652,10 @@ async def get_user_level(thread_id: str):
         UserLevelResponse với level, lý do, và thống kê conversation
     """
     try:
-        session = session_memory.get_session(thread_id)
-        messages = session.get("messages", [])
+        live = await session_memory.aget_live_level(thread_id)
         
         # Kiểm tra có conversation chưa
-        if not messages:
+        if not live or not live["messages_count"]:
             return UserLevelResponse(
                 thread_id=thread_id,
                 level="Beginner",
@@ -441,26 +664,14 @@ async def get_user_level(thread_id: str):
                 has_conversation=False
             )
         
-        # Lấy level đã được lưu (từ analyzer)
-        latest_level = session.get("latest_level")
-        level_reason = session.get("level_reason")
-        
-        # Nếu chưa có level (chưa gọi analyzer), trả về Beginner
-        if not latest_level:
-            return UserLevelResponse(
-                thread_id=thread_id,
-                level="Beginner",
-                level_reason="Chưa được đánh giá. Vui lòng gọi /analyzer trước.",
-                messages_count=len(messages),
-                has_conversation=True
-            )
-        
         return UserLevelResponse(
             thread_id=thread_id,
-            level=latest_level,
-            level_reason=level_reason or "",
-            messages_count=len(messages),
-            has_conversation=True
+            level=live["level"],
+            level_reason=live["reason"],
+            messages_count=live["messages_count"],
+            has_conversation=True,
+            user_questions=live["user_questions"],
+            deep_count=live["deep_count"]
         )
     
     except Exception as e:
@@ -470,6 +681,21 @@ async def get_user_level(thread_id: str):
         )
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Latency metrics của các endpoint chat (total time, time-to-first-token)
+    và thống kê semantic answer cache / embedding cache / mindmap store / prompt budget / session
+    """
+    metrics = {name: recorder.summary() for name, recorder in request_metrics.items()}
+    metrics["semantic_cache"] = answer_cache.stats()
+    metrics["embedding_cache"] = embedding_cache_stats()
+    metrics["mindmap_store"] = await mindmap_store.astats()
+    metrics["prompt_budget"] = prompt_budget_stats()
+    metrics["sessions"] = await session_memory.astats()
+    return metrics
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
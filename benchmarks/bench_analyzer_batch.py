@@ -0,0 +1,82 @@
+"""
+Benchmark: phân tích cả lớp bằng POST /analyzer tuần tự so với POST /analyzer/batch
+
+Dùng fake LLM (có độ trễ giả lập) cho analyzer và fake retriever, tạo sẵn N session học sinh
+(một thread để trống để kiểm tra lỗi của một học sinh không làm hỏng cả lớp), sau đó đo:
+- sequential: gọi analyzer_endpoint lần lượt cho từng học sinh (mỗi lần retrieve transcript)
+- batch: một request /analyzer/batch, đo thời gian tới kết quả đầu tiên và tới event done
+
+Chạy:
+    python benchmarks/bench_analyzer_batch.py --students 30 --concurrency 5 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+# Cho phép chạy trực tiếp từ thư mục gốc của repo
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Session giữ trong RAM
+os.environ.setdefault("PERSISTENCE_BACKEND", "memory")
+
+from fakes import FakeLatencyChatModel, install_fakes, read_stream
+
+
+async def main_async(args):
+    install_fakes(args.latency, args.retrieval_latency)
+    os.environ["ANALYZER_BATCH_CONCURRENCY"] = str(args.concurrency)
+    from agent.tools import analyzer_tool
+    analyzer_tool.llm = FakeLatencyChatModel(latency=args.latency, response="Học sinh nắm được khái niệm phân số.")
+
+    import app
+    from agent.memory import session_memory
+    app.ANALYZER_BATCH_CONCURRENCY = args.concurrency
+
+    thread_ids = [f"student_{i}" for i in range(args.students)]
+    for thread_id in thread_ids:
+        for turn in range(5):
+            session_memory.add_message(thread_id, "user", f"Cô ơi, tại sao phải quy đồng mẫu số? (lượt {turn})")
+            session_memory.add_message(thread_id, "assistant", "Vì hai phân số cần cùng mẫu số mới so sánh được em nhé!")
+    # Học sinh chưa hỏi gì: phải nhận event error, các học sinh khác vẫn có kết quả
+    thread_ids.append("student_missing")
+
+    print("=" * 60)
+    print(f"BENCHMARK: analyzer cả lớp, {args.students} học sinh (+1 thread rỗng)")
+    print("=" * 60)
+    print(f"LLM latency: {args.latency}s | Retrieval latency: {args.retrieval_latency}s | concurrency={args.concurrency}")
+
+    start = time.perf_counter()
+    sequential_ok = 0
+    for thread_id in thread_ids:
+        try:
+            await app.analyzer_endpoint(app.AnalyzerRequest(thread_id=thread_id, topic="phân số"))
+            sequential_ok += 1
+        except app.HTTPException:
+            pass
+    sequential = time.perf_counter() - start
+    print(f"sequential  time={sequential:6.2f}s  thành công={sequential_ok}/{len(thread_ids)}")
+
+    start = time.perf_counter()
+    response = await app.analyzer_batch_endpoint(app.AnalyzerBatchRequest(thread_ids=thread_ids, topic="phân số"))
+    events = await read_stream(response)
+    batch = time.perf_counter() - start
+    first = next(at for at, event in events if event["type"] in ("result", "error")) - start
+    done = events[-1][1]
+    print(f"batch       time={batch:6.2f}s  kết quả đầu tiên sau {first:5.2f}s  "
+          f"thành công={done['succeeded']}/{len(thread_ids)} lỗi={done['failed']}  speedup={sequential / batch:5.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=30, help="Số học sinh trong lớp")
+    parser.add_argument("--concurrency", type=int, default=5, help="ANALYZER_BATCH_CONCURRENCY")
+    parser.add_argument("--latency", type=float, default=0.5, help="Độ trễ mỗi lần gọi LLM (giây)")
+    parser.add_argument("--retrieval-latency", type=float, default=0.05, help="Độ trễ mỗi lần retrieve (giây)")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark: throughput của /chat khi chạy graph async
+
+Dùng fake LLM chạy local (có độ trễ giả lập) thay cho OpenAI và fake retriever,
+sau đó gọi chat_endpoint với mức concurrency 1 và N để so sánh throughput.
+
+Chạy:
+    python benchmarks/bench_async_concurrency.py --requests 20 --concurrency 10 --latency 0.3
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Cho phép chạy trực tiếp từ thư mục gốc của repo
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fakes import install_fakes
+
+
+async def run_batch(chat_endpoint, request_cls, total: int, concurrency: int) -> float:
+    """Gửi `total` request với tối đa `concurrency` request đồng thời, trả về thời gian chạy"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            await chat_endpoint(request_cls(
+                thread_id=f"bench_{concurrency}_{i}",
+                user_message="Phân số là gì?",
+                lesson_id="fake"
+            ))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(total)])
+    return time.perf_counter() - start
+
+
+async def main_async(args):
+    install_fakes(args.latency, args.retrieval_latency)
+    from app import ChatRequest, chat_endpoint
+
+    print("=" * 60)
+    print("BENCHMARK: /chat async concurrency (fake LLM)")
+    print("=" * 60)
+    print(f"Requests: {args.requests} | LLM latency: {args.latency}s | Retrieval latency: {args.retrieval_latency}s")
+
+    baseline = None
+    for concurrency in sorted({1, args.concurrency}):
+        elapsed = await run_batch(chat_endpoint, ChatRequest, args.requests, concurrency)
+        throughput = args.requests / elapsed
+        baseline = baseline or throughput
+        print(f"concurrency={concurrency:<4} time={elapsed:6.2f}s  "
+              f"throughput={throughput:6.2f} req/s  speedup={throughput / baseline:5.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.3, help="Độ trễ mỗi lần gọi LLM (giây)")
+    parser.add_argument("--retrieval-latency", type=float, default=0.05, help="Độ trễ mỗi lần retrieve (giây)")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Benchmark: latency ghi/đọc checkpoint của MemorySaver và SQLiteCheckpointSaver khi có tải song song
+
+Graph nhỏ có cùng dạng với graph của agent (intent -> retrieve -> answer, state gồm
+current_query/reply + context vài KB), không gọi LLM. Mỗi "lượt" là một ainvoke trên một thread
+(ghi checkpoint sau mỗi node), sau đó aget_state đọc lại checkpoint mới nhất.
+Các lượt của nhiều thread chạy song song với tối đa --concurrency lượt cùng lúc.
+
+Trước khi đo, kiểm tra round-trip put/put_writes/get_tuple/list/prune/delete_thread
+của SQLiteCheckpointSaver (cả bản sync và async) trên một DB tạm.
+
+Với --processes P, P process cùng ghi vào một file SQLite (giống P uvicorn worker),
+mỗi process một nhóm thread riêng; sau đó process cha đọc lại mọi thread để kiểm tra
+checkpoint mới nhất (lượt cuối) khi đọc từ process khác.
+
+Chạy:
+    python benchmarks/bench_checkpointer.py --threads 200 --turns 3 --concurrency 32 --processes 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Cho phép chạy trực tiếp từ thư mục gốc của repo
+sys.path.insert(0, str(ROOT))
+
+# Import agent cần API key (benchmark không gọi OpenAI); không tạo DB mặc định của app
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-dummy")
+os.environ.setdefault("PERSISTENCE_BACKEND", "memory")
+
+from typing import TypedDict
+
+from langgraph.graph import END, START, StateGraph
+
+CONTEXT = "[Nguồn 1: bai_12.txt]\nPhân số bằng nhau: nhân cả tử và mẫu với cùng một số khác 0. " * 30
+
+
+class BenchState(TypedDict, total=False):
+    current_query: str
+    reply: str
+    context: str
+    intent: str
+
+
+def build_graph(checkpointer):
+    workflow = StateGraph(BenchState)
+    workflow.add_node("intent", lambda state: {"intent": "normal"})
+    workflow.add_node("retrieve", lambda state: {"context": CONTEXT})
+    workflow.add_node("answer", lambda state: {"reply": "Cô trả lời em nhé! " * 20})
+    workflow.add_edge(START, "intent")
+    workflow.add_edge("intent", "retrieve")
+    workflow.add_edge("retrieve", "answer")
+    workflow.add_edge("answer", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def make_checkpointer(backend: str, db_path: str):
+    if backend == "sqlite":
+        from agent.persistence import SQLiteCheckpointSaver, SQLitePool
+        return SQLiteCheckpointSaver(SQLitePool(db_path, size=4))
+    from langgraph.checkpoint.memory import MemorySaver
+    return MemorySaver()
+
+
+def check_roundtrip(db_path: str):
+    """Ghi 5 checkpoint (giữ tối đa 3) rồi kiểm tra đọc lại, liệt kê, prune và xóa thread"""
+    from langgraph.checkpoint.base import empty_checkpoint
+
+    from agent.persistence import SQLiteCheckpointSaver, SQLitePool
+
+    saver = SQLiteCheckpointSaver(SQLitePool(db_path, size=2), max_checkpoints=3)
+    thread = {"configurable": {"thread_id": "rt", "checkpoint_ns": ""}}
+
+    def count_rows(table: str, thread_id: str) -> int:
+        with saver.pool.connection() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {table} WHERE thread_id = ?", (thread_id,)).fetchone()[0]
+
+    # "context" chỉ ghi ở lượt đầu, "reply" đổi mỗi lượt: blob của context phải sống sót qua prune
+    config, saved, context_version, reply_version = thread, [], None, None
+    for step in range(5):
+        reply_version = saver.get_next_version(reply_version)
+        new_versions = {"reply": reply_version}
+        if context_version is None:
+            context_version = new_versions["context"] = saver.get_next_version(None)
+        checkpoint = empty_checkpoint()
+        checkpoint["channel_values"] = {"reply": f"lượt {step}", "context": CONTEXT}
+        checkpoint["channel_versions"] = {"reply": reply_version, "context": context_version}
+        config = saver.put(config, checkpoint, {"source": "loop", "step": step}, new_versions)
+        saver.put_writes(config, [("reply", f"ghi {step}")], task_id=f"task-{step}")
+        saved.append(config["configurable"]["checkpoint_id"])
+
+    latest = saver.get_tuple(thread)
+    assert latest.checkpoint["id"] == saved[-1]
+    assert latest.checkpoint["channel_values"] == {"reply": "lượt 4", "context": CONTEXT}
+    assert latest.metadata["step"] == 4
+    assert latest.parent_config["configurable"]["checkpoint_id"] == saved[-2]
+    assert latest.pending_writes == [("task-4", "reply", "ghi 4")]
+    previous = saver.get_tuple({"configurable": {**thread["configurable"], "checkpoint_id": saved[-2]}})
+    assert previous.checkpoint["channel_values"]["reply"] == "lượt 3"
+
+    # list: mới nhất trước, limit/before/filter
+    assert [item.checkpoint["id"] for item in saver.list(thread)] == saved[:1:-1]
+    assert [item.checkpoint["id"] for item in saver.list(thread, limit=1)] == [saved[-1]]
+    assert [item.checkpoint["id"] for item in saver.list(thread, before=config)] == [saved[-2], saved[-3]]
+    assert [item.checkpoint["id"] for item in saver.list(thread, filter={"step": 3})] == [saved[-2]]
+
+    # prune: chỉ còn 3 checkpoint, writes của checkpoint bị xóa và blob reply cũ cũng bị xóa
+    assert saver.get_tuple({"configurable": {**thread["configurable"], "checkpoint_id": saved[0]}}) is None
+    assert count_rows("checkpoints", "rt") == 3
+    assert count_rows("checkpoint_writes", "rt") == 3
+    assert count_rows("checkpoint_blobs", "rt") == 3 + 1
+
+    # Bản async cho cùng kết quả
+    async def read_async():
+        items = [item async for item in saver.alist(thread)]
+        return await saver.aget_tuple(thread), items
+
+    async_latest, async_items = asyncio.run(read_async())
+    assert async_latest == latest
+    assert async_items == list(saver.list(thread))
+
+    # delete_thread chỉ xóa thread được chỉ định
+    other = {"configurable": {"thread_id": "other", "checkpoint_ns": ""}}
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"reply": "khác"}
+    checkpoint["channel_versions"] = {"reply": saver.get_next_version(None)}
+    saver.put(other, checkpoint, {"source": "input", "step": -1}, checkpoint["channel_versions"])
+    saver.delete_thread("rt")
+    assert saver.get_tuple(thread) is None
+    assert list(saver.list(thread)) == []
+    assert all(count_rows(table, "rt") == 0 for table in ("checkpoints", "checkpoint_blobs", "checkpoint_writes"))
+    assert saver.get_tuple(other).checkpoint["channel_values"] == {"reply": "khác"}
+
+    print("Round-trip SQLiteCheckpointSaver (put/put_writes/get_tuple/list/prune/delete_thread, sync + async): OK")
+
+
+def question(turn: int) -> str:
+    return f"Câu hỏi {turn} về phân số?"
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run_load(graph, thread_ids, turns: int, concurrency: int) -> dict:
+    """Chạy `turns` lượt trên mỗi thread, trả về latency ghi (ainvoke) và đọc (aget_state)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    writes, reads = [], []
+
+    async def one_thread(thread_id: str):
+        config = {"configurable": {"thread_id": thread_id}}
+        for turn in range(turns):
+            async with semaphore:
+                start = time.perf_counter()
+                await graph.ainvoke({"current_query": question(turn), "reply": ""}, config)
+                writes.append((time.perf_counter() - start) * 1000)
+                start = time.perf_counter()
+                await graph.aget_state(config)
+                reads.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_thread(thread_id) for thread_id in thread_ids))
+    elapsed = time.perf_counter() - start
+    return {"writes": writes, "reads": reads, "elapsed": elapsed}
+
+
+def summarize(label: str, result: dict, turns_total: int):
+    writes, reads = result["writes"], result["reads"]
+    print(f"{label:<22} lượt/s={turns_total / result['elapsed']:7.1f}  "
+          f"ghi p50={statistics.median(writes):6.1f}ms p95={percentile(writes, 0.95):6.1f}ms  "
+          f"đọc p50={statistics.median(reads):6.1f}ms p95={percentile(reads, 0.95):6.1f}ms")
+
+
+def run_worker(db_path: str, worker: int, threads: int, turns: int, concurrency: int):
+    """Process con: chạy tải trên nhóm thread của mình, in kết quả dạng JSON"""
+    graph = build_graph(make_checkpointer("sqlite", db_path))
+    thread_ids = [f"w{worker}-t{i}" for i in range(threads)]
+    print(json.dumps(asyncio.run(run_load(graph, thread_ids, turns, concurrency))), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=200, help="Số thread hội thoại")
+    parser.add_argument("--turns", type=int, default=3, help="Số lượt mỗi thread")
+    parser.add_argument("--concurrency", type=int, default=32, help="Số lượt chạy song song (mỗi process)")
+    parser.add_argument("--processes", type=int, default=0, help="Số process cùng ghi một file SQLite")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        run_worker(args.db, args.worker, args.threads, args.turns, args.concurrency)
+        return
+
+    print("=" * 60)
+    print(f"BENCHMARK: checkpointer, {args.threads} thread x {args.turns} lượt, concurrency={args.concurrency}")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        check_roundtrip(os.path.join(tmp, "roundtrip.sqlite"))
+
+        db_path = os.path.join(tmp, "state.sqlite")
+        thread_ids = [f"t{i}" for i in range(args.threads)]
+        for backend in ("memory", "sqlite"):
+            graph = build_graph(make_checkpointer(backend, db_path))
+            result = asyncio.run(run_load(graph, thread_ids, args.turns, args.concurrency))
+            summarize(backend, result, args.threads * args.turns)
+
+        if args.processes:
+            db_path = os.path.join(tmp, "shared.sqlite")
+            # Tạo schema trước để các process không cùng lúc chạy CREATE TABLE
+            make_checkpointer("sqlite", db_path)
+            processes = [
+                subprocess.Popen(
+                    [sys.executable, __file__, "--worker", str(worker), "--db", db_path,
+                     "--threads", str(args.threads // args.processes), "--turns", str(args.turns),
+                     "--concurrency", str(args.concurrency)],
+                    stdout=subprocess.PIPE, text=True, cwd=ROOT,
+                )
+                for worker in range(args.processes)
+            ]
+            results = [json.loads(process.communicate()[0].strip().splitlines()[-1]) for process in processes]
+            # Không tính thời gian khởi động process: lấy process chạy tải lâu nhất
+            merged = {
+                "writes": [ms for result in results for ms in result["writes"]],
+                "reads": [ms for result in results for ms in result["reads"]],
+                "elapsed": max(result["elapsed"] for result in results),
+            }
+            summarize(f"sqlite x{args.processes} process", merged, len(merged["writes"]))
+
+            # Process cha đọc lại checkpoint do các process con ghi
+            graph = build_graph(make_checkpointer("sqlite", db_path))
+            expected = question(args.turns - 1)
+            complete = sum(
+                graph.get_state({"configurable": {"thread_id": f"w{worker}-t{i}"}}).values.get("current_query") == expected
+                for worker in range(args.processes)
+                for i in range(args.threads // args.processes)
+            )
+            total = args.processes * (args.threads // args.processes)
+            print(f"Thread đọc lại từ process khác thấy lượt cuối: {complete}/{total}")
+
+
+if __name__ == "__main__":
+    main()
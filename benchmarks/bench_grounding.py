@@ -0,0 +1,184 @@
+"""
+Benchmark: deep mode luôn gọi validator GPT-4 so với grounding check local trước validator
+
+Dùng fake LLM (có độ trễ giả lập) cho phần giải thích và validator, retriever trả về chunk
+thật của data/transcripts (BM25, không cần OpenAI / ChromaDB). Với hai loại giải thích:
+- grounded: bám bài học, phép tính đúng → grounding check qua, không gọi validator
+- wrong: có một phép tính sai → grounding check không qua, validator sửa lại
+
+đo latency của:
+- always-llm: /chat, validator LLM chạy sau mọi giải thích (như trước đây)
+- local-gate: /chat, chỉ gọi validator khi grounding check không qua
+- background: /chat/stream với BACKGROUND_VALIDATION, thời gian tới khi học sinh có đủ
+  giải thích (answer) và tới event done (sau correction nếu có)
+
+Trước đó kiểm tra check_arithmetic trên các cách viết dễ nhầm (nhãn "Bước 1:", dấu ":" của
+phép chia, dấu phẩy thập phân...), sai kết quả nào thì dừng.
+
+Chạy:
+    python benchmarks/bench_grounding.py --requests 5 --latency 0.8 --validator-latency 1.0
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Cho phép chạy trực tiếp từ thư mục gốc của repo
+sys.path.insert(0, str(ROOT))
+
+# Session/checkpoint giữ trong RAM
+os.environ.setdefault("PERSISTENCE_BACKEND", "memory")
+
+from fakes import FakeLatencyChatModel, TranscriptRetriever, build_lexical_index, install_fakes, read_stream
+
+QUESTION = "Giải thích chi tiết số chẵn số lẻ là gì ạ?"
+
+GROUNDED_ANSWER = """Tuyệt vời! Cô rất vui khi em muốn tìm hiểu về số chẵn và số lẻ nhé!
+
+Bước 1️⃣: Hiểu khái niệm
+Theo như bài học, các số có chữ số tận cùng là 0, 2, 4, 6, 8 là số chẵn. Các số có chữ số tận cùng là 1, 3, 5, 7, 9 là số lẻ.
+
+Bước 2️⃣: Ví dụ cụ thể
+- Số 12 có chữ số tận cùng là 2 nên 12 là số chẵn.
+- Số 25 có chữ số tận cùng là 5 nên 25 là số lẻ.
+
+Bước 3️⃣: Tại sao?
+Số chẵn là số chia hết cho 2, ví dụ 12 : 2 = 6. Số lẻ là số không chia hết cho 2, ví dụ 25 : 2 = 12 dư 1.
+
+Em đã hiểu chưa? Hãy thử tìm thêm các số chẵn, số lẻ xung quanh mình nhé! 😊"""
+
+WRONG_ANSWER = GROUNDED_ANSWER.replace("12 : 2 = 6", "12 : 2 = 7")
+
+# (dòng trong câu trả lời, số phép tính sai mong đợi, số phép tính đúng mong đợi)
+ARITHMETIC_CASES = [
+    ("Bước 1: 45 - 5 = 40", 0, 1),
+    ("Bước 2️⃣: 45 - 5 = 40", 0, 1),
+    ("Ví dụ 1: 12 : 4 = 3", 0, 1),
+    ("Câu 3 : 7 + 8 = 15", 0, 1),
+    ("Bài 2: 3 x 4 = 12", 0, 1),
+    ("lúc 8:30 = 8 giờ 30", 0, 0),
+    ("2,500 + 1 = 3,5", 0, 1),
+    ("2,500 x 2 = 5000", 1, 0),
+    ("1.000,5 + 1 = 1.001,5", 0, 1),
+    ("36 547 + 1 000 = 37 547", 0, 1),
+    ("36.547 + 1.000 = 37.548", 1, 0),
+    ("12 : 5 = 2 dư 2", 0, 1),
+    ("12 : 5 = 2", 1, 0),
+    ("2/3 = 4/6", 0, 1),
+    ("10 : 3 = 3,33", 0, 1),
+    ("a + 2 + 3 = 5", 0, 0),
+    ("Số lẻ không chia hết cho 2, ví dụ 25 : 2 = 12 dư 1", 0, 1),
+    ("Ví dụ 12 : 2 = 7 sai", 1, 0),
+]
+
+
+class CountingChatModel(FakeLatencyChatModel):
+    """Fake validator đếm số lần được gọi"""
+
+    calls: int = 0
+
+    async def _agenerate(self, *args, **kwargs):
+        self.calls += 1
+        return await super()._agenerate(*args, **kwargs)
+
+
+def check_arithmetic_cases():
+    """check_arithmetic trên ARITHMETIC_CASES, dừng nếu có kết quả sai"""
+    from agent.tools.grounding_tool import check_arithmetic
+
+    failures = []
+    for text, expected_wrong, expected_correct in ARITHMETIC_CASES:
+        wrong, correct = check_arithmetic(text)
+        if (len(wrong), len(correct)) != (expected_wrong, expected_correct):
+            failures.append(f"{text!r}: sai={wrong} đúng={correct}")
+    print(f"check_arithmetic: {len(ARITHMETIC_CASES) - len(failures)}/{len(ARITHMETIC_CASES)} trường hợp đúng")
+    assert not failures, "\n".join(failures)
+
+
+async def run_chat(app, label: str, total: int) -> list:
+    """/chat lần lượt `total` request, trả về latency (ms)"""
+    latencies = []
+    for i in range(total):
+        start = time.perf_counter()
+        await app.chat_endpoint(app.ChatRequest(thread_id=f"{label}_{i}", user_message=QUESTION))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+async def run_stream(app, label: str, total: int) -> tuple:
+    """/chat/stream lần lượt `total` request, trả về (ms tới khi đủ giải thích, ms tới done, số correction)"""
+    answer_ms, total_ms, corrections = [], [], 0
+    for i in range(total):
+        start = time.perf_counter()
+        response = await app.chat_stream_endpoint(app.ChatRequest(thread_id=f"{label}_{i}", user_message=QUESTION))
+        events = await read_stream(response)
+        types = [event["type"] for _, event in events]
+        assert "error" not in types, events
+        # Giải thích đã đủ: event validating nếu validator chạy nền, ngược lại là done
+        answer_at = next(at for at, event in events if event["type"] in ("validating", "done"))
+        answer_ms.append((answer_at - start) * 1000)
+        total_ms.append((events[-1][0] - start) * 1000)
+        corrections += types.count("correction")
+    return answer_ms, total_ms, corrections
+
+
+async def main_async(args):
+    install_fakes(args.latency, args.retrieval_latency)
+    from agent.tools import explain_tool, grounding_tool, retriever_tool, validator_tool
+    import app
+
+    retriever_tool._retriever = TranscriptRetriever(args.retrieval_latency, build_lexical_index())
+    validator = CountingChatModel(latency=args.validator_latency, response=json.dumps({
+        "is_valid": False, "confidence": 40, "issues": ["12 : 2 = 6"], "corrected_answer": GROUNDED_ANSWER
+    }))
+    validator_tool.validator_llm_json = validator
+    explain_tags = explain_tool.llm.tags
+    min_term_overlap = grounding_tool.GROUNDING_MIN_TERM_OVERLAP
+
+    print("=" * 60)
+    print(f"BENCHMARK: deep mode validation, {args.requests} request mỗi cấu hình (fake LLM)")
+    print("=" * 60)
+    print(f"Explain latency: {args.latency}s | Validator latency: {args.validator_latency}s | "
+          f"Retrieval latency: {args.retrieval_latency}s")
+    check_arithmetic_cases()
+
+    for kind, answer in (("grounded", GROUNDED_ANSWER), ("wrong", WRONG_ANSWER)):
+        explain_tool.llm = FakeLatencyChatModel(latency=args.latency, response=answer, tags=explain_tags)
+        context = retriever_tool.get_context(QUESTION, k=5)
+        grounding = grounding_tool.check_grounding(answer, context, QUESTION)
+        print(f"\n[{kind}] grounded={grounding['grounded']} số={grounding['number_coverage']:.0%} "
+              f"cụm từ={grounding['term_overlap']:.0%} issues={grounding['issues']}")
+
+        for mode in ("always-llm", "local-gate"):
+            # always-llm: không câu trả lời nào qua được grounding check
+            grounding_tool.GROUNDING_MIN_TERM_OVERLAP = float("inf") if mode == "always-llm" else min_term_overlap
+            validator.calls = 0
+            latencies = await run_chat(app, f"{kind}_{mode}", args.requests)
+            print(f"{mode:<11} mean={statistics.mean(latencies):7.0f}ms  p50={statistics.median(latencies):7.0f}ms  "
+                  f"validator calls={validator.calls}")
+
+        app.BACKGROUND_VALIDATION = True
+        validator.calls = 0
+        answer_ms, total_ms, corrections = await run_stream(app, f"{kind}_stream", args.requests)
+        app.BACKGROUND_VALIDATION = False
+        print(f"{'background':<11} answer={statistics.mean(answer_ms):7.0f}ms  done={statistics.mean(total_ms):7.0f}ms  "
+              f"validator calls={validator.calls}  corrections={corrections}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.8, help="Độ trễ của LLM giải thích (GPT-4, giây)")
+    parser.add_argument("--validator-latency", type=float, default=1.0, help="Độ trễ của validator (GPT-4, giây)")
+    parser.add_argument("--retrieval-latency", type=float, default=0.05, help="Độ trễ mỗi lần retrieve (giây)")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Benchmark: peak RSS của pipeline ingest khi corpus lớn dần
+
+Sinh corpus transcript giả lập với kích thước tăng dần, chạy ingest trong một
+subprocess riêng cho mỗi kích thước và đo peak RSS của subprocess đó:
+
+- streaming: file → pages → chunks → batches (iter_file_chunks + run_embedding_pipeline)
+- eager: load_documents_from_directory + split_documents (load toàn bộ rồi mới embed)
+- build: toàn bộ `python vector_store/build_chroma.py` (ghi Chroma thật, lexical index,
+  snapshot, lesson digests) trên thư mục tạm
+
+Embedding dùng fake model chạy local. Với streaming/eager, chunk được ghi vào
+collection giả (bỏ qua dữ liệu) để chỉ đo bộ nhớ của pipeline ingest: với
+streaming, peak RSS phải gần như không đổi khi corpus tăng (chỉ còn tăng theo
+danh sách id chunk trong checkpoint/manifest, cỡ vài chục byte mỗi chunk).
+Với build, phần tăng theo corpus chủ yếu là BM25 index (giữ nội dung các chunk)
+và bộ nhớ của Chroma; các bước đọc lại collection đều đọc theo trang.
+
+Chạy (build ghi Chroma thật nên chậm hơn nhiều, cỡ vài giây mỗi MB):
+    python benchmarks/bench_ingest_memory.py --sizes 5 20 80
+    python benchmarks/bench_ingest_memory.py --sizes 5 20 --modes build
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Cho phép chạy trực tiếp từ thư mục gốc của repo
+sys.path.insert(0, str(ROOT))
+
+WORDS = (
+    "số chẵn số lẻ phân số tử số mẫu số hàng nghìn hàng chục nghìn phép cộng phép trừ "
+    "phép nhân phép chia biểu thức so sánh làm tròn chúng mình cùng nhau đi tìm hiểu "
+    "bài học hôm nay các con học sinh thân mến đúng không nhỉ"
+).split()
+
+FILE_MB = 5
+
+
+def generate_corpus(directory: Path, size_mb: int):
+    """Sinh các file .txt (mỗi file FILE_MB MB) tổng cộng size_mb MB"""
+    rng = random.Random(size_mb)
+    directory.mkdir(parents=True, exist_ok=True)
+    remaining = size_mb * 1024 * 1024
+    index = 0
+    while remaining > 0:
+        target = min(FILE_MB * 1024 * 1024, remaining)
+        written = 0
+        with open(directory / f"lesson_{index:03d}.txt", "w", encoding="utf-8") as f:
+            while written < target:
+                sentence = " ".join(rng.choice(WORDS) for _ in range(12)) + f" {rng.randint(1000, 99999)}.\n"
+                if rng.random() < 0.1:
+                    sentence += "\n"
+                f.write(sentence)
+                written += len(sentence.encode("utf-8"))
+        remaining -= written
+        index += 1
+
+
+def peak_rss_mb() -> float:
+    # Linux: ru_maxrss tính bằng KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class NullCollection:
+    """Collection giả: bỏ qua dữ liệu, chỉ đếm"""
+
+    def __init__(self):
+        self.count = 0
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.count += len(ids)
+
+
+def run_build(corpus: Path, batch_size: int, jobs: int) -> int:
+    """Chạy main() của build_chroma.py trên corpus, chroma_db nằm trong thư mục tạm"""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    from vector_store import build_chroma
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        build_chroma.TRANSCRIPTS_DIR = corpus
+        build_chroma.CHROMA_DB_PATH = Path(db_dir)
+        build_chroma.create_embeddings = lambda: DeterministicFakeEmbedding(size=64)
+        os.environ.setdefault("OPENAI_API_KEY", "fake")
+        sys.argv = ["build_chroma.py", "--jobs", str(jobs), "--batch-size", str(batch_size)]
+        build_chroma.main()
+        return build_chroma.open_vector_store(Path(db_dir), DeterministicFakeEmbedding(size=64))._collection.count()
+
+
+def run_child(mode: str, corpus: Path, batch_size: int, jobs: int):
+    """Chạy ingest trong subprocess và in kết quả dạng JSON"""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    from vector_store.build_chroma import (
+        iter_file_chunks, list_source_files, load_documents_from_directory, split_documents
+    )
+    from vector_store.embedding_pipeline import BuildCheckpoint, run_embedding_pipeline
+
+    baseline = peak_rss_mb()
+    embeddings = DeterministicFakeEmbedding(size=64)
+    collection = NullCollection()
+
+    if mode == "build":
+        start = time.perf_counter()
+        total_chunks = run_build(corpus, batch_size, jobs)
+        elapsed = time.perf_counter() - start
+    else:
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            checkpoint = BuildCheckpoint(checkpoint_dir)
+            start = time.perf_counter()
+            if mode == "streaming":
+                work = (item for file_path in list_source_files(corpus) for item in iter_file_chunks(file_path))
+            else:
+                chunks = split_documents(load_documents_from_directory(corpus))
+                work = [(str(i), chunk) for i, chunk in enumerate(chunks)]
+            run_embedding_pipeline(embeddings, collection, work, checkpoint, lambda chunk_id: None,
+                                   jobs=jobs, batch_size=batch_size)
+            elapsed = time.perf_counter() - start
+            checkpoint.clear()
+        total_chunks = collection.count
+
+    print(json.dumps({
+        "chunks": total_chunks,
+        "seconds": elapsed,
+        "baseline_mb": baseline,
+        "peak_mb": peak_rss_mb(),
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 20, 80], help="Kích thước corpus (MB)")
+    parser.add_argument("--modes", nargs="+", default=["streaming", "eager", "build"],
+                        choices=["streaming", "eager", "build"])
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--child", choices=["streaming", "eager", "build"], help=argparse.SUPPRESS)
+    parser.add_argument("--corpus", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.corpus, args.batch_size, args.jobs)
+        return
+
+    print("=" * 60)
+    print("BENCHMARK: peak RSS của ingest (streaming vs eager vs build đầy đủ)")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size_mb in args.sizes:
+            corpus = Path(tmp) / f"corpus_{size_mb}mb"
+            generate_corpus(corpus, size_mb)
+            for mode in args.modes:
+                output = subprocess.run(
+                    [sys.executable, __file__, "--child", mode, "--corpus", str(corpus),
+                     "--batch-size", str(args.batch_size), "--jobs", str(args.jobs)],
+                    capture_output=True, text=True, check=True, cwd=ROOT,
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                print(f"corpus={size_mb:>4}MB  mode={mode:<9}  chunks={result['chunks']:>7}  "
+                      f"time={result['seconds']:6.1f}s  peak RSS={result['peak_mb']:7.1f}MB  "
+                      f"(+{result['peak_mb'] - result['baseline_mb']:6.1f}MB so với sau import)")
+
+
+if __name__ == "__main__":
+    main()
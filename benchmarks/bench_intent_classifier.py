@@ -0,0 +1,145 @@
+"""
+Benchmark: intent classifier chỉ dùng GPT-4 so với local classifier trước (keyword automaton + BM25)
+
+Build BM25 index từ data/transcripts (không cần OpenAI / ChromaDB), gắn vào retriever
+toàn cục rồi phân loại một bộ câu hỏi đã gán nhãn:
+- llm: luôn gọi LLM (fake LLM với độ trễ giả lập của GPT-4)
+- local: CurriculumClassifier trước, chỉ gọi LLM khi confidence < LOCAL_INTENT_MIN_CONFIDENCE
+
+In ra latency trung bình, số câu phải gọi LLM, độ chính xác của các câu local tự trả lời
+và lesson_id local trả về có nằm trong index hay không. Cuối cùng kiểm tra khi retriever chưa
+có BM25 index thì mọi câu IN-SCOPE đều được chuyển cho LLM.
+
+Chạy:
+    python benchmarks/bench_intent_classifier.py --latency 0.6
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Cho phép chạy trực tiếp từ thư mục gốc của repo
+sys.path.insert(0, str(ROOT))
+
+# Session/checkpoint giữ trong RAM
+os.environ.setdefault("PERSISTENCE_BACKEND", "memory")
+
+from fakes import FakeLatencyChatModel, build_lexical_index
+
+# (câu hỏi, tên bài trong CURRICULUM_MAP hoặc None nếu ngoài chương trình)
+QUESTIONS = [
+    ("Chữ số 6 trong 36547 thuộc hàng nào?", "Bài 1: Ôn tập các số đến 100000"),
+    ("Đọc số 45678 như thế nào ạ?", "Bài 1: Ôn tập các số đến 100000"),
+    ("Giá trị của chữ số 3 trong số 93 210 là bao nhiêu?", "Bài 1: Ôn tập các số đến 100000"),
+    ("Số 70 000 có mấy chữ số?", "Bài 1: Ôn tập các số đến 100000"),
+    ("Làm sao đặt tính rồi tính phép nhân?", "Bài 2: Ôn tập các phép tính trong phạm vi 100000"),
+    ("Tính nhẩm 4000 x 3 thế nào?", "Bài 2: Ôn tập các phép tính trong phạm vi 100000"),
+    ("Tổng của 2 và 3 là bao nhiêu?", "Bài 2: Ôn tập các phép tính trong phạm vi 100000"),
+    ("Hiệu của hai số là gì?", "Bài 2: Ôn tập các phép tính trong phạm vi 100000"),
+    ("Số 25 là số chẵn hay số lẻ?", "Bài 3: Số chẵn số lẻ"),
+    ("Số nào chia hết cho 2?", "Bài 3: Số chẵn số lẻ"),
+    ("so chan la gi", "Bài 3: Số chẵn số lẻ"),
+    ("Phân số là gì?", "Bài về Phân số"),
+    ("phan so la gi", "Bài về Phân số"),
+    ("So sánh phân số 2/3 và 3/4", "Bài về Phân số"),
+    ("Quy đồng mẫu số như thế nào?", "Bài về Phân số"),
+    ("Rút gọn phân số 6/8", "Bài về Phân số"),
+    ("Chu vi hình chữ nhật tính thế nào?", "Bài về Hình học"),
+    ("Diện tích hình vuông cạnh 4cm", "Bài về Hình học"),
+    ("Căn bậc hai của 16 là gì?", None),
+    ("Giải phương trình x + 2 = 5", None),
+    ("What is a fraction?", None),
+    ("Em chưa hiểu bài này", "Bài về Phân số"),
+    ("Tính 3456 + 1234 bằng bao nhiêu?", "Bài 2: Ôn tập các phép tính trong phạm vi 100000"),
+    ("12 chia 5 dư mấy?", "Bài 3: Số chẵn số lẻ"),
+]
+
+
+async def main_async(args):
+    from agent.tools import intent_classifier_tool, retriever_tool
+    from agent.tools.intent_classifier_tool import CURRICULUM_MAP, aclassify_intent
+
+    retriever_tool._retriever.lexical_index = build_lexical_index()
+    classifier = intent_classifier_tool.get_curriculum_classifier()
+    stored_ids = set(classifier.lexical_index.lessons())
+
+    print("=" * 60)
+    print(f"BENCHMARK: intent classifier, {len(QUESTIONS)} câu hỏi, LLM latency {args.latency}s")
+    print("=" * 60)
+    for title, lesson_id in classifier.lesson_ids.items():
+        print(f"  {title} -> {lesson_id or '(chưa có transcript)'}")
+
+    # Fake GPT-4: trả lời IN-SCOPE với id cũ của curriculum (như trước đây)
+    legacy_id = next(iter(CURRICULUM_MAP.values()))["lesson_id"]
+    intent_classifier_tool.llm_json = FakeLatencyChatModel(latency=args.latency, response=json.dumps({
+        "topic": "Bài 1", "lesson_id": legacy_id, "classification": "IN-SCOPE", "confidence": 0.9, "reasoning": "fake"
+    }))
+
+    # Latency của riêng local classifier
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        local_results = [classifier.classify(question) for question, _ in QUESTIONS]
+    local_us = (time.perf_counter() - start) * 1e6 / (args.repeat * len(QUESTIONS))
+
+    accepted = [
+        (result, expected) for result, (_, expected) in zip(local_results, QUESTIONS)
+        if result["confidence"] >= intent_classifier_tool.LOCAL_INTENT_MIN_CONFIDENCE
+    ]
+    correct = sum(
+        (result["classification"] == "OUT-OF-SCOPE") if expected is None else (result["topic"] == expected)
+        for result, expected in accepted
+    )
+    valid_ids = sum(result["lesson_id"] is None or result["lesson_id"] in stored_ids for result, _ in accepted)
+
+    for mode in ("llm", "local"):
+        threshold = intent_classifier_tool.LOCAL_INTENT_MIN_CONFIDENCE
+        if mode == "llm":
+            intent_classifier_tool.LOCAL_INTENT_MIN_CONFIDENCE = float("inf")
+        latencies = []
+        for question, _ in QUESTIONS:
+            start = time.perf_counter()
+            result = await aclassify_intent(question)
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert result["lesson_id"] is None or result["lesson_id"] in stored_ids
+        intent_classifier_tool.LOCAL_INTENT_MIN_CONFIDENCE = threshold
+        print(f"{mode:<6} mean={statistics.mean(latencies):7.1f}ms  p50={statistics.median(latencies):7.1f}ms")
+
+    print(f"Local classifier: {local_us:.0f}µs/câu, tự trả lời {len(accepted)}/{len(QUESTIONS)} câu "
+          f"(đúng {correct}/{len(accepted)}), gọi LLM {len(QUESTIONS) - len(accepted)} câu")
+    print(f"lesson_id local có trong index: {valid_ids}/{len(accepted)}")
+
+    await check_no_index_escalates()
+
+
+async def check_no_index_escalates():
+    """Không có BM25 index: local classifier không tự trả lời câu IN-SCOPE nào"""
+    from agent.tools import intent_classifier_tool, retriever_tool
+
+    lexical_index = retriever_tool._retriever.lexical_index
+    retriever_tool._retriever.lexical_index = None
+    try:
+        results = [await intent_classifier_tool.aclassify_intent(question) for question, _ in QUESTIONS]
+    finally:
+        retriever_tool._retriever.lexical_index = lexical_index
+    # Fake GPT-4 trả về reasoning "fake"
+    local = [result for result in results if result["reasoning"] != "fake"]
+    assert all(result["classification"] == "OUT-OF-SCOPE" for result in local), local
+    print(f"Không có BM25 index: gọi LLM {len(results) - len(local)}/{len(results)} câu, "
+          f"local chỉ trả lời {len(local)} câu OUT-OF-SCOPE")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.6, help="Độ trễ mỗi lần gọi GPT-4 (giây)")
+    parser.add_argument("--repeat", type=int, default=200, help="Số lần lặp khi đo latency local")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Benchmark: overhead mỗi LLM call khi tạo client mới so với pool kết nối dùng chung (agent/llm_registry.py)
+
+Chạy một stub server OpenAI-compatible local (trả về chat completion cố định, không có độ trễ
+model) để chỉ đo phần overhead phía client: tạo ChatOpenAI/HTTP client và mở kết nối.
+Mỗi "lượt" gọi lần lượt các vai trò json -> answer_json -> validator như một lượt /chat.
+
+- per_call: tạo ChatOpenAI + HTTP client mới cho mỗi call (mỗi call mở kết nối mới)
+- registry: get_llm(role), mọi vai trò dùng chung một pool keep-alive
+
+In ra latency mỗi call (sync), thời gian chạy --concurrency lượt song song (async) và số kết
+nối TCP stub server đã nhận. Mỗi HTTP client mới phải load CA bundle (certifi) và mở kết nối
+mới; với --tls stub server dùng HTTPS (cert tự ký tạo bằng openssl) nên mỗi kết nối mới còn
+phải bắt tay TLS, gần với kết nối thật tới OpenAI hơn (chưa tính RTT mạng).
+
+Chạy:
+    python benchmarks/bench_llm_clients.py --turns 200 --concurrency 20 --tls
+"""
+import argparse
+import asyncio
+import json
+import os
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Cho phép chạy trực tiếp từ thư mục gốc của repo
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Import agent cần API key (stub server không kiểm tra); không tạo DB mặc định của app
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-dummy")
+os.environ.setdefault("PERSISTENCE_BACKEND", "memory")
+
+ROLES = ("json", "answer_json", "validator")
+COMPLETION = json.dumps({
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "stub",
+    "choices": [{
+        "index": 0,
+        "message": {"role": "assistant", "content": json.dumps({"answer": "Phân số là một phần của tổng thể.", "confidence": 0.9})},
+        "finish_reason": "stop",
+    }],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+}).encode("utf-8")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """POST /v1/chat/completions: trả về completion cố định, giữ kết nối (HTTP/1.1 keep-alive)"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(COMPLETION)))
+        self.end_headers()
+        self.wfile.write(COMPLETION)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_server(cert_dir: str = None) -> tuple:
+    """Chạy stub server trong thread nền, trả về (server, base_url, CA bundle cho client)"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    scheme, cert_file = "http", None
+    if cert_dir:
+        cert_file, key_file = os.path.join(cert_dir, "cert.pem"), os.path.join(cert_dir, "key.pem")
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=127.0.0.1",
+             "-addext", "subjectAltName=IP:127.0.0.1", "-keyout", key_file, "-out", cert_file],
+            check=True, capture_output=True,
+        )
+        # CA bundle = certifi + cert tự ký: client mới vẫn load cả bundle như khi gọi OpenAI thật
+        import certifi
+        ca_file = os.path.join(cert_dir, "ca.pem")
+        with open(ca_file, "w") as out:
+            out.write(Path(certifi.where()).read_text() + Path(cert_file).read_text())
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_file, key_file)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme, cert_file = "https", ca_file
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"{scheme}://127.0.0.1:{server.server_address[1]}/v1", cert_file
+
+
+def measure(label: str, server, get_client, turns: int, concurrency: int):
+    from langchain_core.messages import HumanMessage
+
+    messages = [HumanMessage(content="Phân số là gì?")]
+    # Warmup (import, khởi tạo lazy của SDK)
+    get_client(ROLES[0]).invoke(messages)
+    server.connections = 0
+
+    latencies = []
+    for _ in range(turns):
+        for role in ROLES:
+            start = time.perf_counter()
+            get_client(role).invoke(messages)
+            latencies.append((time.perf_counter() - start) * 1000)
+    sync_connections = server.connections
+
+    async def run_async():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one_turn():
+            async with semaphore:
+                for role in ROLES:
+                    await get_client(role).ainvoke(messages)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one_turn() for _ in range(turns)))
+        return time.perf_counter() - start
+
+    server.connections = 0
+    elapsed = asyncio.run(run_async())
+    print(f"{label:<10} sync p50={statistics.median(latencies):6.2f}ms  mean={statistics.mean(latencies):6.2f}ms  "
+          f"kết nối={sync_connections:>4}  |  async {turns} lượt={elapsed:6.2f}s "
+          f"({turns * len(ROLES) / elapsed:6.0f} call/s)  kết nối={server.connections:>4}")
+    return statistics.mean(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200, help="Số lượt (mỗi lượt 3 LLM call)")
+    parser.add_argument("--concurrency", type=int, default=20, help="Số lượt chạy song song khi đo async")
+    parser.add_argument("--tls", action="store_true", help="Stub server dùng HTTPS (cần openssl)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server, base_url, cert_file = start_stub_server(tmp if args.tls else None)
+        # Đặt trước khi import agent: các tool tạo client từ registry ngay khi import
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ["OPENAI_API_BASE"] = base_url
+        if cert_file:
+            # httpx tin cert tự ký của stub server qua SSL_CERT_FILE
+            os.environ["SSL_CERT_FILE"] = cert_file
+
+        import httpx
+        from agent.llm_registry import LLM_ROLES, get_llm
+        from langchain_openai import ChatOpenAI
+
+        def per_call(role: str) -> ChatOpenAI:
+            # Như khi mỗi call tự tạo ChatOpenAI: HTTP client riêng, không dùng lại kết nối
+            config = LLM_ROLES[role]
+            return ChatOpenAI(
+                model=config["model"],
+                temperature=0,
+                model_kwargs={"response_format": {"type": "json_object"}} if config.get("json") else {},
+                http_client=httpx.Client(),
+                http_async_client=httpx.AsyncClient(),
+            )
+
+        print("=" * 60)
+        print(f"BENCHMARK: LLM client, {args.turns} lượt x {len(ROLES)} call, stub server {base_url}")
+        print("=" * 60)
+        baseline = measure("per_call", server, per_call, args.turns, args.concurrency)
+        shared = measure("registry", server, get_llm, args.turns, args.concurrency)
+        print(f"Overhead bỏ được mỗi call (sync): {baseline - shared:.2f}ms ({baseline / shared:.1f}x)")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
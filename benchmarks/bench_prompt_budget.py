@@ -0,0 +1,109 @@
+"""
+Benchmark: số token context khi cắt theo số chunk cố định và theo ngân sách token
+
+Với mỗi câu hỏi có nhãn (dùng chung với bench_retrieval_modes.py), lấy top-k chunk
+bằng BM25 rồi so sánh context cố định k chunk (k=7 normal, k=10 deep như trước đây)
+với context đã xếp vào ngân sách token của call site (ANSWER_BUDGET, EXPLAIN_BUDGET).
+Cột recall cho biết chunk chứa đáp án còn nằm trong context hay không.
+
+Với --llm (cần OPENAI_API_KEY), gọi thêm gpt-3.5-turbo với cả hai context để so latency.
+
+Chạy:
+    python benchmarks/bench_prompt_budget.py
+    python benchmarks/bench_prompt_budget.py --llm --repeat 3
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Cho phép chạy trực tiếp từ thư mục gốc của repo
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Import agent cần API key (không gọi OpenAI nếu không có --llm)
+HAS_API_KEY = bool(os.getenv("OPENAI_API_KEY"))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-dummy")
+
+from bench_retrieval_modes import LABELLED_QUERIES, is_relevant, load_lexical_index
+from vector_store.tokens import count_tokens
+
+
+def p95(values):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * 0.95))]
+
+
+def measure_llm(llm, prompts, repeat: int) -> float:
+    """Latency trung vị (ms) khi gọi LLM với các prompt"""
+    from langchain_core.messages import HumanMessage
+
+    latencies = []
+    for prompt in prompts:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            llm.invoke([HumanMessage(content=prompt)])
+            latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm", action="store_true", help="Đo thêm latency LLM (cần OPENAI_API_KEY)")
+    parser.add_argument("--repeat", type=int, default=1, help="Số lần gọi LLM mỗi prompt")
+    args = parser.parse_args()
+
+    from agent.graph import ANSWER_BUDGET, EXPLAIN_BUDGET
+    from agent.prompt_budget import pack_chunks
+    from agent.prompts import NORMAL_ANSWER_PROMPT
+    from agent.tools.retriever_tool import format_results
+    from vector_store.build_chroma import CHROMA_DB_PATH
+
+    print("=" * 60)
+    print("BENCHMARK: context theo số chunk vs theo ngân sách token")
+    print("=" * 60)
+
+    index = load_lexical_index(Path(CHROMA_DB_PATH))
+    print(f"Chunks: {len(index)} | Queries: {len(LABELLED_QUERIES)}")
+
+    for site, k, budget in (("answer", 7, ANSWER_BUDGET), ("explain", 10, EXPLAIN_BUDGET)):
+        fixed_tokens, budget_tokens = [], []
+        fixed_hits = budget_hits = 0
+        fixed_prompts, budget_prompts = [], []
+        for query, lesson_key, phrase in LABELLED_QUERIES:
+            results = index.search(query, k=k)
+            packed, _, _ = pack_chunks(results, budget.context_tokens)
+            fixed_context, budget_context = format_results(results), format_results(packed)
+            fixed_tokens.append(count_tokens(fixed_context))
+            budget_tokens.append(count_tokens(budget_context))
+            fixed_hits += any(is_relevant(result, lesson_key, phrase) for result in results)
+            budget_hits += any(is_relevant(result, lesson_key, phrase) for result in packed)
+            fixed_prompts.append(NORMAL_ANSWER_PROMPT.format(context=fixed_context, question=query))
+            budget_prompts.append(NORMAL_ANSWER_PROMPT.format(context=budget_context, question=query))
+
+        total = len(LABELLED_QUERIES)
+        print(f"\n[{site}] k={k} | budget={budget.context_tokens} tokens")
+        print(f"  fixed k   avg={statistics.mean(fixed_tokens):7.0f}  p95={p95(fixed_tokens):6d} tokens  "
+              f"recall={fixed_hits / total:4.2f}")
+        print(f"  budgeted  avg={statistics.mean(budget_tokens):7.0f}  p95={p95(budget_tokens):6d} tokens  "
+              f"recall={budget_hits / total:4.2f}")
+        print(f"  giảm {1 - sum(budget_tokens) / sum(fixed_tokens):5.1%} prompt tokens")
+
+        if args.llm:
+            if not HAS_API_KEY:
+                print("  Bỏ qua --llm: cần OPENAI_API_KEY")
+                continue
+            from langchain_openai import ChatOpenAI
+            llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0, max_tokens=150)
+            fixed_ms = measure_llm(llm, fixed_prompts, args.repeat)
+            budget_ms = measure_llm(llm, budget_prompts, args.repeat)
+            print(f"  LLM p50: fixed={fixed_ms:7.0f}ms  budgeted={budget_ms:7.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
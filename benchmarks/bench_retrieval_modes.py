@@ -0,0 +1,167 @@
+"""
+Benchmark: so sánh latency/recall của các chế độ retrieval (lexical, vector, hybrid)
+
+Dùng một tập câu hỏi có nhãn trên các transcript đi kèm repo. Một câu hỏi được
+tính là "recall" nếu trong top-k có chunk thuộc đúng bài và chứa cụm từ mong đợi.
+
+- lexical: luôn chạy được (build BM25 index trực tiếp từ data/transcripts nếu
+  chroma_db chưa có lexical index)
+- vector/hybrid: chỉ chạy khi có OPENAI_API_KEY và chroma_db đã được build
+
+Trước đó kiểm tra RETRIEVER_MODE=lexical không gọi embedding API (retrieval và
+semantic answer cache), có lần gọi nào thì dừng.
+
+Chạy:
+    python benchmarks/bench_retrieval_modes.py --k 3 --repeat 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Cho phép chạy trực tiếp từ thư mục gốc của repo
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from vector_store.lexical_index import BM25Index, LEXICAL_INDEX_FILE
+
+# (câu hỏi, từ khóa trong tên bài, cụm từ phải có trong chunk)
+LABELLED_QUERIES = [
+    ("Chữ số 2 trong số 52.431 thuộc hàng nào?", "Bài 1", "52.431"),
+    ("So sánh số dân 41217 và 46616", "Bài 1", "41.217"),
+    ("Số 100000 được viết như thế nào?", "Bài 1", "100.000"),
+    ("Tổng của 53640 và 8290 là bao nhiêu?", "Bài 2", "53.640"),
+    ("Tích của 29073 và 3", "Bài 2", "29.073"),
+    ("54658 chia cho 9 bằng mấy?", "Bài 2", "54.658"),
+    ("Biểu thức có dấu ngoặc thì tính thế nào?", "Bài 2", "ngoặ"),
+    ("Số chẵn là số như thế nào?", "Bài 3", "chia hết cho 2"),
+    ("Dấu hiệu nhận biết số lẻ", "Bài 3", "số lẻ"),
+    ("Tử số và mẫu số là gì?", "phan_so", "mẫu số"),
+    ("Phân số lớn hơn 1 khi nào?", "phan_so", "lớn hơn mẫu số"),
+    ("phan so bang 1", "phan_so", "bằng mẫu số"),
+]
+
+
+def is_relevant(result: dict, lesson_key: str, phrase: str) -> bool:
+    return lesson_key in result.get("lesson_id", "") and phrase.lower() in result.get("content", "").lower()
+
+
+def evaluate(name: str, search, k: int, repeat: int):
+    """Chạy toàn bộ tập câu hỏi, in latency (p50/p95) và recall@k"""
+    latencies = []
+    hits = 0
+    misses = []
+    for query, lesson_key, phrase in LABELLED_QUERIES:
+        results = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results = search(query, k)
+            latencies.append((time.perf_counter() - start) * 1000)
+        if any(is_relevant(result, lesson_key, phrase) for result in results):
+            hits += 1
+        else:
+            misses.append(query)
+
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{name:<8} recall@{k}={hits / len(LABELLED_QUERIES):5.2f}  "
+          f"p50={statistics.median(latencies):8.2f}ms  p95={p95:8.2f}ms")
+    for query in misses:
+        print(f"         miss: {query}")
+
+
+def load_lexical_index(db_path: Path) -> BM25Index:
+    """Dùng lexical index đã build cùng ChromaDB, nếu chưa có thì build từ transcripts"""
+    path = db_path / LEXICAL_INDEX_FILE
+    if path.exists():
+        return BM25Index.load(path)
+
+    from vector_store.build_chroma import TRANSCRIPTS_DIR, load_documents_from_directory, split_documents
+    chunks = split_documents(load_documents_from_directory(TRANSCRIPTS_DIR))
+    return BM25Index.build((chunk.page_content, chunk.metadata) for chunk in chunks)
+
+
+class CountingEmbeddings:
+    """Embedding giả, đếm số lần bị gọi (lexical mode phải giữ ở 0)"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_queries(self, texts):
+        self.calls += 1
+        return [[1.0, 0.0] for _ in texts]
+
+    async def aembed_queries(self, texts):
+        return self.embed_queries(texts)
+
+    async def aembed_query(self, text):
+        return self.embed_queries([text])[0]
+
+
+def check_lexical_no_embedding(index: BM25Index):
+    """RETRIEVER_MODE=lexical: retrieval + semantic cache (miss, store, hit) không gọi embedding"""
+    # Import agent cần OPENAI_API_KEY (LLM khởi tạo lúc import), không gọi mạng
+    api_key = os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-dummy")
+    from agent.semantic_cache import SemanticAnswerCache
+    from agent.tools.retriever_tool import RetrieverTool
+    if api_key == "sk-benchmark-dummy":
+        del os.environ["OPENAI_API_KEY"]
+
+    async def run(retriever, cache, query: str):
+        assert await cache.alookup("", query) is None
+        await retriever.aretrieve_many([query], k=3)
+        await cache.astore("", query, "Cô trả lời em nhé!")
+        assert await cache.alookup("", query) == "Cô trả lời em nhé!"
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        index.save(Path(db_dir) / LEXICAL_INDEX_FILE)
+        retriever = RetrieverTool(db_path=db_dir, mode="lexical")
+        embeddings = CountingEmbeddings()
+        retriever.embeddings = embeddings
+        cache = SemanticAnswerCache(embed_query=embeddings.aembed_query, can_embed=retriever.can_embed, db_path=db_dir)
+        for query, _, _ in LABELLED_QUERIES:
+            asyncio.run(run(retriever, cache, query))
+    print(f"lexical mode: {embeddings.calls} lần gọi embedding cho {len(LABELLED_QUERIES)} câu hỏi "
+          f"(semantic cache hit={cache.hits}, miss={cache.misses})")
+    assert embeddings.calls == 0, "RETRIEVER_MODE=lexical vẫn gọi embedding API"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5, help="Số lần lặp mỗi câu hỏi để đo latency")
+    args = parser.parse_args()
+
+    from vector_store.build_chroma import CHROMA_DB_PATH
+    db_path = Path(CHROMA_DB_PATH)
+
+    print("=" * 60)
+    print("BENCHMARK: retrieval modes (lexical / vector / hybrid)")
+    print("=" * 60)
+    print(f"Queries: {len(LABELLED_QUERIES)} | k: {args.k} | repeat: {args.repeat}")
+
+    index = load_lexical_index(db_path)
+    check_lexical_no_embedding(index)
+    evaluate("lexical", lambda query, k: index.search(query, k=k), args.k, args.repeat)
+
+    if not os.getenv("OPENAI_API_KEY") or not (db_path / "chroma.sqlite3").exists():
+        print("Bỏ qua vector/hybrid: cần OPENAI_API_KEY và chroma_db (python vector_store/build_chroma.py)")
+        return
+
+    from agent.tools.retriever_tool import RetrieverTool
+    retriever = RetrieverTool(db_path=str(db_path))
+    for mode in ("vector", "hybrid"):
+        retriever.mode = mode
+        # Lần lặp đầu gọi embedding API, các lần sau dùng embedding cache
+        evaluate(mode, lambda query, k: retriever.retrieve(query, k=k), args.k, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark: chi phí đọc history của một thread dài (GET /session)
+
+So sánh ba cách đọc history sau mỗi lượt khi thread dài dần:
+- rebuild: render lại toàn bộ "Học sinh:/Trợ giảng:" từ danh sách message (cách cũ)
+- full: toàn bộ history từ buffer đã render sẵn (get_conversation_history)
+- poll: chỉ các message mới kể từ lần poll trước (get_history_page với cursor)
+
+In ra thời gian mỗi lần đọc (ms) và payload (KB) tại một số độ dài thread, cùng
+bộ nhớ của session (tracemalloc) khi lưu dạng list message so với buffer.
+
+--backend sqlite đo SQLiteSessionMemory (file DB tạm): poll cắt trang theo vị trí byte
+đã lưu của từng message, thời gian không tăng theo độ dài thread.
+
+Chạy:
+    python benchmarks/bench_session_history.py --turns 2000
+    python benchmarks/bench_session_history.py --turns 2000 --backend sqlite
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+# Cho phép chạy trực tiếp từ thư mục gốc của repo
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Import agent cần API key (benchmark không gọi OpenAI); session giữ trong RAM
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-dummy")
+os.environ.setdefault("PERSISTENCE_BACKEND", "memory")
+
+QUESTION = "Cô ơi, muốn so sánh hai phân số khác mẫu số thì mình làm thế nào ạ?"
+ANSWER = "Em quy đồng mẫu số hai phân số trước, sau đó so sánh tử số: phân số nào có tử số lớn hơn thì lớn hơn nhé! " * 3
+
+
+def rebuild(messages) -> str:
+    """Cách cũ: render lại toàn bộ history từ danh sách message"""
+    history = []
+    for role, content in messages:
+        if role == "user":
+            history.append(f"Học sinh: {content}")
+        elif role == "assistant":
+            history.append(f"Trợ giảng: {content}")
+    return "\n".join(history)
+
+
+def timed(fn, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) * 1000 / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=2000, help="Số lượt hỏi đáp của thread")
+    parser.add_argument("--repeat", type=int, default=20, help="Số lần đọc mỗi điểm đo")
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory")
+    args = parser.parse_args()
+
+    from agent.memory import SessionMemory, SQLiteSessionMemory
+    from agent.persistence import SQLitePool
+
+    print("=" * 60)
+    print(f"BENCHMARK: đọc history của thread {args.turns} lượt ({args.backend})")
+    print("=" * 60)
+
+    if args.backend == "sqlite":
+        db_dir = tempfile.TemporaryDirectory()
+        memory = SQLiteSessionMemory(SQLitePool(os.path.join(db_dir.name, "sessions.sqlite"), 2))
+    else:
+        memory = SessionMemory()
+    messages = []
+    cursor = 0
+    checkpoints = {args.turns // 10, args.turns // 2, args.turns}
+    total = {"rebuild": 0.0, "full": 0.0, "poll": 0.0}
+    for turn in range(1, args.turns + 1):
+        for role, content in (("user", f"{QUESTION} (lượt {turn})"), ("assistant", f"{ANSWER} (lượt {turn})")):
+            memory.add_message("t", role, content)
+            messages.append((role, content))
+
+        # Dashboard poll sau mỗi lượt
+        rebuild_ms, rebuilt = timed(lambda: rebuild(messages), 1)
+        full_ms, _ = timed(lambda: memory.get_conversation_history("t"), 1)
+        poll_ms, page = timed(lambda: memory.get_history_page("t", cursor, 100, 65536), 1)
+        cursor = page["next_cursor"]
+        total["rebuild"] += rebuild_ms
+        total["full"] += full_ms
+        total["poll"] += poll_ms
+
+        if turn in checkpoints:
+            rebuild_ms, rebuilt = timed(lambda: rebuild(messages), args.repeat)
+            full_ms, full = timed(lambda: memory.get_conversation_history("t"), args.repeat)
+            poll_ms, page = timed(lambda: memory.get_history_page("t", cursor - 2, 100, 65536), args.repeat)
+            assert full == rebuilt
+            print(f"{turn:>6} lượt  rebuild={rebuild_ms:7.3f}ms ({len(rebuilt.encode()) / 1024:7.1f}KB)  "
+                  f"full={full_ms:7.3f}ms  poll={poll_ms:6.3f}ms ({len(page['conversation_history'].encode()) / 1024:4.1f}KB)")
+
+    print(f"Tổng thời gian poll sau mỗi lượt: rebuild={total['rebuild']:.0f}ms  "
+          f"full={total['full']:.0f}ms  poll={total['poll']:.0f}ms")
+    if args.backend == "sqlite":
+        return
+
+    # Bộ nhớ: list message (dict như trước đây) so với buffer của Session
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    # Mỗi content là một bản sao riêng, như khi message đến từ request
+    as_dicts = [{"role": role, "content": content.encode("utf-8").decode("utf-8"), "timestamp": None}
+                for role, content in messages]
+    dict_bytes = tracemalloc.get_traced_memory()[0] - before
+    del as_dicts
+    before = tracemalloc.get_traced_memory()[0]
+    other = SessionMemory()
+    for role, content in messages:
+        other.add_message("t", role, content)
+    buffer_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"Bộ nhớ session: list dict={dict_bytes / 1024:.0f}KB  buffer={buffer_bytes / 1024:.0f}KB")
+
+
+if __name__ == "__main__":
+    main()
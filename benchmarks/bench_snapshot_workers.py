@@ -0,0 +1,140 @@
+"""
+Benchmark: startup và bộ nhớ mỗi worker khi dùng mmap snapshot so với NumPy index
+
+Tạo Chroma collection giả lập với số chunk tăng dần, export snapshot như
+build_chroma.py, rồi khởi động N worker (subprocess) chạy song song, mỗi worker:
+load index (numpy: đọc từ Chroma / snapshot: mmap) + chạy 1 query. Khi tất cả
+worker đã sẵn sàng, mỗi worker đọc /proc/self/smaps_rollup và báo cáo:
+
+- load: thời gian load index + query đầu tiên
+- RSS: tăng thêm so với sau khi import (gồm cả page dùng chung)
+- private: bộ nhớ riêng của worker (không dùng chung với worker khác)
+- PSS: bộ nhớ chia đều phần dùng chung cho các worker
+
+Chỉ chạy trên Linux. Không cần OPENAI_API_KEY.
+
+Chạy:
+    python benchmarks/bench_snapshot_workers.py --chunks 2000 10000 20000 --workers 4
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Cho phép chạy trực tiếp từ thư mục gốc của repo
+sys.path.insert(0, str(ROOT))
+
+import numpy as np
+
+
+def memory_mb() -> dict:
+    """RSS / private / PSS của process hiện tại (MB)"""
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss": values.get("Rss", 0.0),
+        "pss": values.get("Pss", 0.0),
+        "private": values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0),
+    }
+
+
+def run_worker(backend: str, db_path: str, dim: int):
+    """Worker: load index, query, chờ parent báo rồi đo bộ nhớ"""
+    import chromadb
+
+    from vector_store.numpy_index import NumpyVectorIndex
+    from vector_store.snapshot import load_snapshot
+
+    before = memory_mb()
+    start = time.perf_counter()
+    if backend == "snapshot":
+        index = load_snapshot(db_path).to_index()
+    else:
+        collection = chromadb.PersistentClient(path=db_path).get_collection("langchain")
+        index = NumpyVectorIndex.from_collection(collection)
+    index.search_many(np.random.default_rng(1).standard_normal((1, dim)), k=3)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    print("ready", flush=True)
+    sys.stdin.readline()
+    after = memory_mb()
+    print(json.dumps({
+        "load_ms": load_ms,
+        "rss": after["rss"] - before["rss"],
+        "private": after["private"] - before["private"],
+        "pss": after["pss"],
+    }), flush=True)
+    sys.stdin.read()
+
+
+def run_workers(backend: str, db_path: str, dim: int, workers: int) -> list:
+    """Chạy `workers` worker đồng thời, trả về kết quả đo của từng worker"""
+    processes = [
+        subprocess.Popen(
+            [sys.executable, __file__, "--worker", backend, "--db", db_path, "--dim", str(dim)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, cwd=ROOT,
+        )
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.stdout.readline()
+    for process in processes:
+        process.stdin.write("measure\n")
+        process.stdin.flush()
+    results = [json.loads(process.stdout.readline()) for process in processes]
+    for process in processes:
+        process.stdin.close()
+        process.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[2000, 10000, 20000])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--lessons", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--worker", choices=["numpy", "snapshot"], help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.db, args.dim)
+        return
+
+    import chromadb
+
+    from bench_vector_backends import build_collection
+    from vector_store.snapshot import SNAPSHOT_FILE, export_collection_snapshot
+
+    print("=" * 60)
+    print(f"BENCHMARK: {args.workers} worker, NumPy index (load từ Chroma) vs mmap snapshot")
+    print("=" * 60)
+
+    for chunks in args.chunks:
+        with tempfile.TemporaryDirectory() as db_path:
+            build_collection(db_path, chunks, args.lessons, args.dim, np.random.default_rng(0))
+            collection = chromadb.PersistentClient(path=db_path).get_collection("langchain")
+            export_collection_snapshot(collection, Path(db_path) / SNAPSHOT_FILE)
+
+            for backend in ("numpy", "snapshot"):
+                results = run_workers(backend, db_path, args.dim, args.workers)
+                print(f"chunks={chunks:>6}  backend={backend:<8}  "
+                      f"load={statistics.mean(r['load_ms'] for r in results):8.1f}ms  "
+                      f"RSS/worker=+{statistics.mean(r['rss'] for r in results):6.1f}MB  "
+                      f"private/worker=+{statistics.mean(r['private'] for r in results):6.1f}MB  "
+                      f"PSS tổng={sum(r['pss'] for r in results):7.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark: latency của answer_node khi confidence thấp, fallback tuần tự so với SPECULATIVE_FALLBACK
+
+Dùng fake LLM/retriever (benchmarks/fakes.py). Câu trả lời đầu tiên có confidence thấp
+(--confidence), intent classifier trả về IN-SCOPE kèm lesson_id nên answer_node re-retrieve
+và trả lời lại. Với câu hỏi confidence cao (--high), nhánh speculative bị hủy: benchmark
+cho thấy latency không đổi nhưng mỗi câu tốn thêm một call classifier đã bắt đầu.
+
+Chạy:
+    python benchmarks/bench_speculative_fallback.py --requests 10 --latency 0.3 --intent-latency 0.6
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Cho phép chạy trực tiếp từ thư mục gốc của repo
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Session/checkpoint giữ trong RAM
+os.environ.setdefault("PERSISTENCE_BACKEND", "memory")
+
+from fakes import FakeLatencyChatModel, install_fakes
+
+
+async def run(chat_endpoint, request_cls, label: str, total: int) -> list:
+    """Gửi lần lượt `total` request, trả về latency (ms) từng request"""
+    latencies = []
+    for i in range(total):
+        start = time.perf_counter()
+        # Câu hỏi không có keyword của curriculum: local classifier chuyển cho GPT-4
+        await chat_endpoint(request_cls(thread_id=f"{label}_{i}", user_message=f"Câu {i} này em chưa hiểu ạ?", lesson_id="fake"))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+async def main_async(args):
+    install_fakes(args.latency, args.retrieval_latency)
+    from agent import graph
+    from agent.tools import answer_tool, intent_classifier_tool, retriever_tool
+    from app import ChatRequest, chat_endpoint
+    from vector_store.lexical_index import BM25Index
+
+    # Bài "fake" có trong index để lesson_id của classifier được dùng khi re-retrieve
+    retriever_tool._retriever.lexical_index = BM25Index.build([("Phân số", {"source": "fake.txt", "lesson_id": "fake"})])
+
+    answer_json = json.dumps({"answer": "Phân số là một phần của tổng thể em ạ!", "confidence": args.confidence, "reasoning": "ok"})
+    answer_tool.llm_json = FakeLatencyChatModel(latency=args.latency, response=answer_json, tags=answer_tool.llm_json.tags)
+    intent_classifier_tool.llm_json = FakeLatencyChatModel(latency=args.intent_latency, response=json.dumps({
+        "topic": "Phân số", "lesson_id": "fake", "classification": "IN-SCOPE", "confidence": 0.9, "reasoning": "ok"
+    }))
+
+    print("=" * 60)
+    print(f"BENCHMARK: answer_node fallback, confidence={args.confidence} (fake LLM)")
+    print("=" * 60)
+    print(f"Requests: {args.requests} | LLM latency: {args.latency}s | Intent latency: {args.intent_latency}s | "
+          f"Retrieval latency: {args.retrieval_latency}s")
+
+    # Warmup (import, khởi tạo lazy) trước khi đo
+    await run(chat_endpoint, ChatRequest, "warmup", 1)
+
+    baseline = None
+    for speculative in (False, True):
+        graph.SPECULATIVE_FALLBACK = speculative
+        label = "speculative" if speculative else "sequential"
+        latencies = await run(chat_endpoint, ChatRequest, label, args.requests)
+        mean = statistics.mean(latencies)
+        baseline = baseline or mean
+        print(f"{label:<12} p50={statistics.median(latencies):7.0f}ms  mean={mean:7.0f}ms  speedup={baseline / mean:5.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.3, help="Độ trễ mỗi lần gọi LLM trả lời (giây)")
+    parser.add_argument("--intent-latency", type=float, default=0.6, help="Độ trễ intent classifier (GPT-4, giây)")
+    parser.add_argument("--retrieval-latency", type=float, default=0.05, help="Độ trễ mỗi lần retrieve (giây)")
+    parser.add_argument("--confidence", type=float, default=0.5, help="Confidence của câu trả lời")
+    parser.add_argument("--high", action="store_const", const=0.9, dest="confidence",
+                        help="Câu trả lời confidence cao (nhánh speculative bị hủy)")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
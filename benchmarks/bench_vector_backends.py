@@ -0,0 +1,128 @@
+"""
+Benchmark: NumPy vector index so với Chroma (query latency + startup)
+
+Tạo một Chroma collection giả lập (vector ngẫu nhiên đã normalize, chia đều cho
+các bài giảng) rồi so sánh:
+- startup: mở Chroma + query đầu tiên / load NumpyVectorIndex từ collection
+- latency p50/p95 của 1 query và batch 4 query (có/không filter lesson_id)
+- overlap top-k giữa hai backend (Chroma dùng HNSW nên là xấp xỉ)
+
+Không cần OPENAI_API_KEY.
+
+Chạy:
+    python benchmarks/bench_vector_backends.py --chunks 5000 --lessons 50
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Cho phép chạy trực tiếp từ thư mục gốc của repo
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import chromadb
+import numpy as np
+
+from vector_store.numpy_index import NumpyVectorIndex
+
+
+def build_collection(path: str, chunks: int, lessons: int, dim: int, rng: np.random.Generator):
+    """Ghi collection giả lập vào Chroma (giống layout của build_chroma.py)"""
+    client = chromadb.PersistentClient(path=path)
+    collection = client.get_or_create_collection("langchain")
+    vectors = rng.standard_normal((chunks, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    for start in range(0, chunks, 1000):
+        end = min(start + 1000, chunks)
+        collection.add(
+            ids=[f"chunk-{i}" for i in range(start, end)],
+            embeddings=vectors[start:end],
+            documents=[f"Nội dung chunk {i}" for i in range(start, end)],
+            metadatas=[
+                {"lesson_id": f"lesson_{i % lessons:03d}", "source": f"lesson_{i % lessons:03d}.txt", "chunk_index": i}
+                for i in range(start, end)
+            ],
+        )
+
+
+def timed(fn, repeat: int):
+    latencies = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return result, statistics.median(latencies), latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+
+def chroma_search(collection, vectors, k, lesson_id):
+    response = collection.query(
+        query_embeddings=vectors,
+        n_results=k,
+        where={"lesson_id": lesson_id} if lesson_id else None,
+        include=["documents", "metadatas"],
+    )
+    return [[{"content": content} for content in documents] for documents in response["documents"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--lessons", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=1536, help="Số chiều embedding (text-embedding-ada-002: 1536)")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+
+    print("=" * 60)
+    print("BENCHMARK: NumPy vector index vs Chroma")
+    print("=" * 60)
+    print(f"Chunks: {args.chunks} | Lessons: {args.lessons} | Dim: {args.dim} | k: {args.k}")
+
+    with tempfile.TemporaryDirectory() as path:
+        build_collection(path, args.chunks, args.lessons, args.dim, rng)
+        queries = rng.standard_normal((4, args.dim)).astype(np.float32)
+
+        # Startup: mở collection như một worker mới
+        start = time.perf_counter()
+        collection = chromadb.PersistentClient(path=path).get_collection("langchain")
+        chroma_search(collection, queries[:1], args.k, None)
+        chroma_startup = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        index = NumpyVectorIndex.from_collection(collection)
+        numpy_startup = (time.perf_counter() - start) * 1000
+
+        print(f"\nStartup   chroma={chroma_startup:8.1f}ms   numpy (load từ Chroma)={numpy_startup:8.1f}ms")
+        print(f"NumPy index: {index.matrix.nbytes / 1024 / 1024:.1f}MB float32\n")
+
+        lesson_id = "lesson_007"
+        cases = [
+            ("1 query", queries[:1], None),
+            ("1 query + lesson", queries[:1], lesson_id),
+            ("4 queries", queries, None),
+            ("4 queries + lesson", queries, lesson_id),
+        ]
+        for name, vectors, lesson in cases:
+            chroma_results, chroma_p50, chroma_p95 = timed(
+                lambda: chroma_search(collection, vectors.tolist(), args.k, lesson), args.repeat
+            )
+            numpy_results, numpy_p50, numpy_p95 = timed(
+                lambda: index.search_many(vectors, k=args.k, lesson_id=lesson), args.repeat
+            )
+            overlap = statistics.mean(
+                len({r["content"] for r in a} & {r["content"] for r in b}) / args.k
+                for a, b in zip(chroma_results, numpy_results)
+            )
+            print(f"{name:<20} chroma p50={chroma_p50:7.2f}ms p95={chroma_p95:7.2f}ms | "
+                  f"numpy p50={numpy_p50:7.2f}ms p95={numpy_p95:7.2f}ms | "
+                  f"speedup={chroma_p50 / numpy_p50:6.1f}x overlap@{args.k}={overlap:4.2f}")
+
+
+if __name__ == "__main__":
+    main()
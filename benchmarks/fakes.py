@@ -0,0 +1,152 @@
+"""
+Fake LLM / retriever dùng chung cho các benchmark (không gọi OpenAI, không cần ChromaDB)
+
+- FakeLatencyChatModel: chat model trả về response cố định sau một độ trễ giả lập
+- FakeRetriever / TranscriptRetriever: retriever giả lập (nội dung cố định / chunk transcript thật)
+- install_fakes: thay các LLM/retriever toàn cục của agent bằng bản fake
+- build_lexical_index: BM25 index trên data/transcripts
+- read_stream: đọc SSE stream của các endpoint /.../stream
+
+Import module này trước agent/app: nó đặt OPENAI_API_KEY giả và tắt semantic cache
+(đo đúng chi phí của pipeline) nếu chưa được cấu hình.
+"""
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Không gọi OpenAI thật trong benchmark
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-dummy")
+
+# Tắt semantic cache để đo đúng chi phí của pipeline
+os.environ.setdefault("SEMANTIC_CACHE_ENABLED", "0")
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeLatencyChatModel(BaseChatModel):
+    """Chat model giả lập: trả về response cố định sau `latency` giây"""
+
+    latency: float = 0.3
+    response: str = "Cô trả lời em nhé!"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-latency"
+
+    def _result(self) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return self._result()
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._result()
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any):
+        # Chia response thành nhiều token, độ trễ chia đều cho các token
+        tokens = [self.response[i:i + 4] for i in range(0, len(self.response), 4)]
+        for token in tokens:
+            await asyncio.sleep(self.latency / len(tokens))
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class FakeRetriever:
+    """Retriever giả lập thay cho Chroma + OpenAIEmbeddings"""
+
+    def __init__(self, latency: float, lexical_index=None):
+        self.latency = latency
+        # BM25 index cho local intent classifier (get_lexical_index)
+        self.lexical_index = lexical_index
+
+    def _refresh_indexes(self):
+        pass
+
+    def can_embed(self) -> bool:
+        return True
+
+    def _results(self, query: str) -> list:
+        return [{"content": f"Nội dung bài học liên quan tới: {query}", "source": "fake.txt", "lesson_id": "fake"}]
+
+    def retrieve(self, query: str, k: int = 3, lesson_id: str = None) -> list:
+        time.sleep(self.latency)
+        return self._results(query)
+
+    async def aretrieve(self, query: str, k: int = 3, lesson_id: str = None) -> list:
+        await asyncio.sleep(self.latency)
+        return self._results(query)
+
+    def retrieve_many(self, queries: list, k: int = 3, lesson_id: str = None) -> list:
+        time.sleep(self.latency)
+        return [self._results(query) for query in queries]
+
+    async def aretrieve_many(self, queries: list, k: int = 3, lesson_id: str = None) -> list:
+        await asyncio.sleep(self.latency)
+        return [self._results(query) for query in queries]
+
+    async def aembed_query(self, query: str) -> list:
+        # Vector giả lập ổn định theo nội dung câu hỏi
+        await asyncio.sleep(self.latency)
+        return [float((hash(query) >> shift) & 0xFF) for shift in range(0, 64, 8)]
+
+
+class TranscriptRetriever(FakeRetriever):
+    """Fake retriever trả về chunk transcript thật (BM25) thay cho nội dung cố định"""
+
+    def _results(self, query: str) -> list:
+        return self.lexical_index.search(query, k=5)
+
+
+def install_fakes(llm_latency: float, retrieval_latency: float):
+    """Thay các LLM/retriever toàn cục bằng bản fake"""
+    from agent.tools import answer_tool, explain_tool, intent_classifier_tool, retriever_tool, validator_tool
+
+    answer_json = json.dumps({"answer": "Phân số là một phần của tổng thể em ạ!", "confidence": 0.9, "reasoning": "ok"})
+    # Giữ nguyên tags của LLM thật để /chat/stream vẫn stream token
+    answer_tool.llm = FakeLatencyChatModel(latency=llm_latency, tags=answer_tool.llm.tags)
+    answer_tool.llm_json = FakeLatencyChatModel(latency=llm_latency, response=answer_json, tags=answer_tool.llm_json.tags)
+    explain_tool.llm = FakeLatencyChatModel(latency=llm_latency, tags=explain_tool.llm.tags)
+    validator_tool.validator_llm_json = FakeLatencyChatModel(
+        latency=llm_latency, response=json.dumps({"is_valid": True, "confidence": 90})
+    )
+    intent_classifier_tool.llm_json = FakeLatencyChatModel(
+        latency=llm_latency, response=json.dumps({"classification": "IN-SCOPE", "confidence": 0.9})
+    )
+    retriever_tool._retriever = FakeRetriever(retrieval_latency)
+
+
+def build_lexical_index():
+    """BM25 index trên chunk của data/transcripts, cùng cách chia chunk với build_chroma.py"""
+    from vector_store.build_chroma import iter_file_chunks, list_source_files
+    from vector_store.lexical_index import BM25Index
+
+    chunks = (
+        (document.page_content, document.metadata)
+        for file_path in list_source_files(ROOT / "data" / "transcripts")
+        for _, document in iter_file_chunks(file_path)
+    )
+    return BM25Index.build(chunks)
+
+
+async def read_stream(response) -> list:
+    """Đọc SSE stream của StreamingResponse, trả về [(thời điểm nhận, event)]"""
+    events = []
+    async for chunk in response.body_iterator:
+        for line in chunk.splitlines():
+            if line.startswith("data: "):
+                events.append((time.perf_counter(), json.loads(line[len("data: "):])))
+    return events
@@ -2,16 +2,28 @@
 Script xây dựng ChromaDB vector store từ transcript files
 Chạy script này để tạo vector store từ các file transcript trong data/transcripts/
 """
+import argparse
 import os
+import sys
+import time
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterator, List, Tuple
 from langchain_community.vectorstores import Chroma
 from langchain_openai import OpenAIEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import TextLoader, PyPDFLoader
+from langchain_community.document_loaders import PyPDFLoader
 from langchain_core.documents import Document
 from dotenv import load_dotenv
 
+# Cho phép chạy trực tiếp `python vector_store/build_chroma.py` từ thư mục gốc
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vector_store.build_manifest import BuildManifest, ChunkIdGenerator, content_hash, file_sha256
+from vector_store.embedding_pipeline import BuildCheckpoint, run_embedding_pipeline
+from vector_store.index_version import bump_index_version, new_index_version
+from vector_store.lesson_digest import LESSON_DIGESTS_FILE, build_lesson_digests, write_lesson_digests
+from vector_store.lexical_index import BM25Index, LEXICAL_INDEX_FILE
+from vector_store.snapshot import SNAPSHOT_FILE, EmbeddingSnapshot, export_collection_snapshot
+
 # Load environment variables
 load_dotenv()
 
@@ -21,6 +33,91 @@ TRANSCRIPTS_DIR = BASE_DIR / "data" / "transcripts"
 CHROMA_DB_PATH = BASE_DIR / "chroma_db"
 
 
+SUPPORTED_SUFFIXES = (".txt", ".pdf")
+
+# Kích thước mỗi "page" khi đọc dần file .txt (ký tự)
+TEXT_PAGE_CHARS = 20000
+
+# Số chunk mỗi lần xóa/cập nhật metadata trong Chroma (Chroma giới hạn kích thước batch)
+UPSERT_BATCH_SIZE = 500
+
+# Số chunk mỗi lần đọc từ Chroma khi build lexical index
+LEXICAL_PAGE_SIZE = 500
+
+# Cấu hình embed khi build (ghi đè bằng --jobs / --batch-size)
+DEFAULT_EMBED_JOBS = int(os.getenv("BUILD_EMBED_JOBS", "4"))
+DEFAULT_EMBED_BATCH_SIZE = int(os.getenv("BUILD_EMBED_BATCH_SIZE", "100"))
+
+# Giới hạn token của lesson digest (context cho /mindmap, /analyzer khi không có topic)
+LESSON_DIGEST_MAX_TOKENS = int(os.getenv("LESSON_DIGEST_MAX_TOKENS", "2500"))
+
+
+def list_source_files(directory: Path) -> List[Path]:
+    """Danh sách file transcript được hỗ trợ, sắp xếp theo tên"""
+    files = []
+    for file_path in sorted(directory.glob("*")):
+        if file_path.suffix in SUPPORTED_SUFFIXES:
+            files.append(file_path)
+        elif file_path.is_file():
+            print(f"Bỏ qua file không hỗ trợ: {file_path.name}")
+    return files
+
+
+def _page_document(text: str, file_path: Path, page: int) -> Document:
+    # Thêm metadata cho mỗi page
+    return Document(
+        page_content=text,
+        metadata={
+            "lesson_id": file_path.stem,  # Tên file không có extension
+            "lesson_name": file_path.name,
+            "source": str(file_path),
+            "page": page,
+        }
+    )
+
+
+def iter_text_pages(file_path: Path, page_chars: int = TEXT_PAGE_CHARS) -> Iterator[Document]:
+    """
+    Đọc file .txt theo từng "page" khoảng page_chars ký tự, cắt ở ranh giới đoạn
+    văn (dòng trống) nếu có, không đọc cả file vào RAM
+    """
+    lines: List[str] = []
+    size = 0
+    page = 0
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            lines.append(line)
+            size += len(line)
+            at_paragraph_end = not line.strip()
+            if (size >= page_chars and at_paragraph_end) or size >= 4 * page_chars:
+                yield _page_document("".join(lines), file_path, page)
+                lines, size = [], 0
+                page += 1
+    if any(line.strip() for line in lines):
+        yield _page_document("".join(lines), file_path, page)
+
+
+def iter_file_pages(file_path: Path) -> Iterator[Document]:
+    """
+    Đọc dần một file .txt/.pdf thành các page Document
+    Thêm metadata: lesson_id, lesson_name, source, page
+    """
+    if file_path.suffix == ".txt":
+        yield from iter_text_pages(file_path)
+        return
+    
+    for page, doc in enumerate(PyPDFLoader(str(file_path)).lazy_load()):
+        yield _page_document(doc.page_content, file_path, page)
+
+
+def load_file(file_path: Path) -> List[Document]:
+    """
+    Load một file .txt/.pdf
+    Thêm metadata: lesson_id, lesson_name, source
+    """
+    return list(iter_file_pages(file_path))
+
+
 def load_documents_from_directory(directory: Path) -> List[Document]:
     """
     Load tất cả documents từ thư mục transcripts
@@ -33,8 +130,7 @@ def load_documents_from_directory(directory: Path) -> List[Document]:
         print(f"Thư mục {directory} không tồn tại!")
         return documents
     
-    # Lấy tất cả files trong thư mục
-    files = list(directory.glob("*"))
+    files = list_source_files(directory)
     
     if not files:
         print(f"Không tìm thấy file nào trong {directory}")
@@ -42,82 +138,283 @@ def load_documents_from_directory(directory: Path) -> List[Document]:
     
     for file_path in files:
         try:
-            if file_path.suffix == ".txt":
-                loader = TextLoader(str(file_path), encoding="utf-8")
-                docs = loader.load()
-                
-                # Thêm metadata cho mỗi document
-                lesson_id = file_path.stem  # Tên file không có extension
-                for doc in docs:
-                    doc.metadata["lesson_id"] = lesson_id
-                    doc.metadata["lesson_name"] = file_path.name
-                    doc.metadata["source"] = str(file_path)
-                
-                documents.extend(docs)
-                print(f"Đã load: {file_path.name} (lesson_id: {lesson_id})")
-            
-            elif file_path.suffix == ".pdf":
-                loader = PyPDFLoader(str(file_path))
-                docs = loader.load()
-                
-                # Thêm metadata cho mỗi document
-                lesson_id = file_path.stem
-                for doc in docs:
-                    doc.metadata["lesson_id"] = lesson_id
-                    doc.metadata["lesson_name"] = file_path.name
-                    doc.metadata["source"] = str(file_path)
-                
-                documents.extend(docs)
-                print(f"Đã load: {file_path.name} (lesson_id: {lesson_id})")
-            
-            else:
-                print(f"Bỏ qua file không hỗ trợ: {file_path.name}")
-        
+            documents.extend(load_file(file_path))
+            print(f"Đã load: {file_path.name} (lesson_id: {file_path.stem})")
         except Exception as e:
             print(f"Lỗi khi load {file_path.name}: {e}")
     
     return documents
 
 
-def split_documents(documents: List[Document], chunk_size: int = 1000, chunk_overlap: int = 200) -> List[Document]:
-    """
-    Chia nhỏ documents thành các chunks
-    """
-    text_splitter = RecursiveCharacterTextSplitter(
+def get_text_splitter(chunk_size: int = 1000, chunk_overlap: int = 200) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
         length_function=len,
         separators=["\n\n", "\n", " ", ""]
     )
-    
-    chunks = text_splitter.split_documents(documents)
+
+
+def split_documents(documents: List[Document], chunk_size: int = 1000, chunk_overlap: int = 200) -> List[Document]:
+    """
+    Chia nhỏ documents thành các chunks
+    """
+    chunks = get_text_splitter(chunk_size, chunk_overlap).split_documents(documents)
     print(f"Đã chia thành {len(chunks)} chunks")
     return chunks
 
 
-def build_vector_store(documents: List[Document], persist_directory: Path):
+def iter_file_chunks(file_path: Path) -> Iterator[Tuple[str, Document]]:
     """
-    Xây dựng và lưu ChromaDB vector store
+    Sinh dần các chunk của một file (file → pages → chunks), gắn
+    chunk_index/content_hash vào metadata
+    
+    Returns:
+        Iterator các cặp (chunk_id, chunk)
     """
-    # Khởi tạo embeddings
-    embeddings = OpenAIEmbeddings()
+    splitter = get_text_splitter()
+    id_generator = ChunkIdGenerator(file_path.name)
+    index = 0
+    for page in iter_file_pages(file_path):
+        for chunk in splitter.split_documents([page]):
+            chunk.metadata["chunk_index"] = index
+            chunk.metadata["content_hash"] = content_hash(chunk.page_content)
+            index += 1
+            yield id_generator.next_id(chunk.page_content), chunk
+
+
+def create_embeddings() -> OpenAIEmbeddings:
+    """Embedding model cho build (retry do embed_with_backoff đảm nhận)"""
+    return OpenAIEmbeddings(max_retries=0)
+
+
+def open_vector_store(persist_directory: Path, embeddings: OpenAIEmbeddings = None) -> Chroma:
+    """Mở ChromaDB (tạo mới nếu chưa có)"""
+    return Chroma(
+        persist_directory=str(persist_directory),
+        embedding_function=embeddings or create_embeddings()
+    )
+
+
+def delete_chunks(vectorstore: Chroma, ids: List[str]):
+    """Xóa chunk khỏi Chroma theo id"""
+    for start in range(0, len(ids), UPSERT_BATCH_SIZE):
+        vectorstore.delete(ids=ids[start:start + UPSERT_BATCH_SIZE])
+
+
+def update_chunk_metadata(vectorstore: Chroma, ids: List[str], metadatas: List[Dict]):
+    """Cập nhật metadata (chunk_index, page...) của chunk đã có trong Chroma, không embed lại"""
+    for start in range(0, len(ids), UPSERT_BATCH_SIZE):
+        vectorstore._collection.update(
+            ids=ids[start:start + UPSERT_BATCH_SIZE],
+            metadatas=metadatas[start:start + UPSERT_BATCH_SIZE],
+        )
+
+
+def build_vector_store(
+    source_dir: Path,
+    persist_directory: Path,
+    full: bool = False,
+    jobs: int = DEFAULT_EMBED_JOBS,
+    batch_size: int = DEFAULT_EMBED_BATCH_SIZE,
+) -> Tuple[Chroma, Dict]:
+    """
+    Build ChromaDB tăng dần theo build manifest:
+    - File không đổi (cùng sha256): bỏ qua, không load/embed lại
+    - File mới/sửa: chỉ embed chunk có id mới, xóa chunk cũ không còn; chunk giữ
+      lại được cập nhật metadata theo vị trí mới (chunk_index, page)
+    - File đã xóa: xóa toàn bộ chunk của file
+    
+    Chunk được sinh dần và embed theo batch trên `jobs` thread (bộ nhớ không
+    tăng theo kích thước corpus), mỗi batch xong được ghi ngay vào Chroma và
+    checkpoint; build bị dừng giữa chừng sẽ chạy tiếp từ đó.
     
-    # Tạo vector store
-    print("Đang tạo embeddings và lưu vào ChromaDB...")
-    vectorstore = Chroma.from_documents(
-        documents=documents,
-        embedding=embeddings,
-        persist_directory=str(persist_directory)
+    Args:
+        source_dir: Thư mục transcripts
+        persist_directory: Thư mục ChromaDB
+        full: Bỏ qua manifest, build lại từ đầu
+        jobs: Số batch embed đồng thời
+        batch_size: Số chunk mỗi batch
+        
+    Returns:
+        (vectorstore, dict thống kê files/chunks added, removed, unchanged + throughput)
+    """
+    manifest = BuildManifest.load(persist_directory)
+    checkpoint = BuildCheckpoint(persist_directory).load()
+    embeddings = create_embeddings()
+    vectorstore = open_vector_store(persist_directory, embeddings)
+    
+    # Collection cũ (build trước khi có manifest, id ngẫu nhiên) hoặc --full: xóa để tránh trùng lặp
+    if full or (not manifest.exists() and vectorstore._collection.count() > 0):
+        print("Không có build manifest hợp lệ (hoặc --full): xóa collection cũ và build lại")
+        vectorstore.delete_collection()
+        vectorstore = open_vector_store(persist_directory, embeddings)
+        manifest.files = {}
+        checkpoint.clear()
+    elif checkpoint.done_ids:
+        print(f"Tiếp tục build trước đó: {len(checkpoint.done_ids)} chunks đã có trong checkpoint")
+    
+    stats = {"files_changed": 0, "files_unchanged": 0, "files_removed": 0,
+             "chunks_added": 0, "chunks_removed": 0, "chunks_updated": 0, "chunks_resumed": 0,
+             "chunks_total": 0}
+    files = list_source_files(source_dir) if source_dir.exists() else []
+    current_keys = {file_path.name for file_path in files}
+    
+    # File đã bị xóa khỏi thư mục transcripts
+    for file_key in sorted(set(manifest.files) - current_keys):
+        removed_ids = manifest.files.pop(file_key).get("chunk_ids", [])
+        delete_chunks(vectorstore, removed_ids)
+        stats["files_removed"] += 1
+        stats["chunks_removed"] += len(removed_ids)
+        print(f"Đã xóa: {file_key} ({len(removed_ids)} chunks)")
+    manifest.save()
+    
+    # Chunk cần embed được sinh dần (file → pages → chunks) và chỉ được đọc tiếp
+    # khi pipeline còn chỗ, nên không giữ toàn bộ corpus trong RAM
+    remaining: Dict[str, int] = {}
+    pending_entries: Dict[str, Dict] = {}
+    owner: Dict[str, str] = {}
+    
+    def maybe_finish_file(file_key: str):
+        # Manifest của một file chỉ được cập nhật khi đã đọc hết file và mọi chunk đã ghi xong
+        if remaining.get(file_key) == 0 and file_key in pending_entries:
+            manifest.files[file_key] = pending_entries.pop(file_key)
+            manifest.save()
+    
+    def on_chunk_done(chunk_id: str):
+        file_key = owner.pop(chunk_id)
+        remaining[file_key] -= 1
+        maybe_finish_file(file_key)
+    
+    def iter_work() -> Iterator[Tuple[str, Document]]:
+        for file_path in files:
+            file_key = file_path.name
+            sha = file_sha256(file_path)
+            entry = manifest.files.get(file_key)
+            if entry and entry.get("sha256") == sha:
+                stats["files_unchanged"] += 1
+                continue
+            
+            old_ids = set(entry.get("chunk_ids", [])) if entry else set()
+            ids: List[str] = []
+            added = resumed = updated = 0
+            # Chunk đã có trong Chroma (không đổi nội dung) nhưng có thể đã đổi vị trí
+            kept_ids: List[str] = []
+            kept_metadatas: List[Dict] = []
+            remaining[file_key] = 0
+            try:
+                for chunk_id, chunk in iter_file_chunks(file_path):
+                    ids.append(chunk_id)
+                    if chunk_id in old_ids or chunk_id in checkpoint.done_ids:
+                        kept_ids.append(chunk_id)
+                        kept_metadatas.append(chunk.metadata)
+                        if len(kept_ids) >= UPSERT_BATCH_SIZE:
+                            update_chunk_metadata(vectorstore, kept_ids, kept_metadatas)
+                            updated += len(kept_ids)
+                            kept_ids, kept_metadatas = [], []
+                    if chunk_id in old_ids:
+                        continue
+                    added += 1
+                    if chunk_id in checkpoint.done_ids:
+                        resumed += 1
+                        continue
+                    owner[chunk_id] = file_key
+                    remaining[file_key] += 1
+                    yield chunk_id, chunk
+            except Exception as e:
+                # Chunk đã embed của file lỗi nằm trong checkpoint, được dọn ở cuối build
+                print(f"Lỗi khi load {file_key}: {e}")
+                continue
+            
+            update_chunk_metadata(vectorstore, kept_ids, kept_metadatas)
+            updated += len(kept_ids)
+            removed_ids = sorted(old_ids - set(ids))
+            delete_chunks(vectorstore, removed_ids)
+            pending_entries[file_key] = {"sha256": sha, "lesson_id": file_path.stem, "chunk_ids": ids}
+            maybe_finish_file(file_key)
+            
+            stats["files_changed"] += 1
+            stats["chunks_added"] += added
+            stats["chunks_removed"] += len(removed_ids)
+            stats["chunks_updated"] += updated
+            stats["chunks_resumed"] += resumed
+            print(f"Đã đọc: {file_key} (+{added} / -{len(removed_ids)} / ~{updated} chunks)")
+    
+    print(f"Embed chunks mới (batch {batch_size}, {jobs} jobs)")
+    stats["embedding"] = run_embedding_pipeline(
+        embeddings, vectorstore._collection, iter_work(), checkpoint, on_chunk_done,
+        jobs=jobs, batch_size=batch_size
     )
     
-    print(f"Đã lưu vector store tại: {persist_directory}")
-    return vectorstore
+    # Chunk trong checkpoint không còn thuộc file nào (file bị sửa/xóa giữa 2 lần chạy)
+    orphan_ids = sorted(checkpoint.done_ids - set(manifest.all_chunk_ids()))
+    delete_chunks(vectorstore, orphan_ids)
+    checkpoint.clear()
+    
+    stats["chunks_total"] = len(manifest.all_chunk_ids())
+    return vectorstore, stats
+
+
+def iter_collection_chunks(collection, page_size: int = LEXICAL_PAGE_SIZE) -> Iterator[Tuple[str, Dict]]:
+    """
+    Đọc dần các chunk (content, metadata) của collection theo thứ tự transcript
+    (source, chunk_index)
+    
+    Đọc metadata theo trang để sắp xếp, rồi đọc nội dung theo từng trang đúng thứ
+    tự đó (giống export snapshot), không lấy cả corpus trong một lần get.
+    """
+    keys = []
+    for offset in range(0, collection.count(), page_size):
+        page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        for chunk_id, metadata in zip(page["ids"], page["metadatas"]):
+            metadata = metadata or {}
+            keys.append((metadata.get("source", ""), metadata.get("chunk_index", 0), chunk_id))
+    ordered_ids = [chunk_id for _, _, chunk_id in sorted(keys)]
+    del keys
+    
+    for start in range(0, len(ordered_ids), page_size):
+        page_ids = ordered_ids[start:start + page_size]
+        page = collection.get(ids=page_ids, include=["documents", "metadatas"])
+        by_id = {
+            chunk_id: (content, metadata or {})
+            for chunk_id, content, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+        }
+        for chunk_id in page_ids:
+            yield by_id[chunk_id]
+
+
+def build_lexical_index(vectorstore: Chroma, persist_directory: Path) -> BM25Index:
+    """
+    Xây dựng BM25 index trên toàn bộ chunk trong Chroma
+    (dùng cho hybrid/lexical retrieval)
+    """
+    index = BM25Index.build(iter_collection_chunks(vectorstore._collection))
+    index.save(persist_directory / LEXICAL_INDEX_FILE)
+    print(f"Đã lưu lexical index ({len(index.postings)} terms) tại: {persist_directory / LEXICAL_INDEX_FILE}")
+    return index
+
+
+def warm_mindmaps():
+    """Tạo sẵn mindmap mặc định cho mọi bài (gọi gpt-4o cho bài mới/thay đổi)"""
+    print("\nWarmup mindmap mặc định cho các bài giảng")
+    # Import muộn: chỉ cần agent khi dùng --warm-mindmaps
+    from agent.mindmap_store import warm_default_mindmaps
+    stats = warm_default_mindmaps()
+    print(f"Mindmap: {stats['generated']} tạo mới, {stats['cached']} đã có, {stats['failed']} lỗi")
 
 
 def main():
     """
     Hàm chính để build vector store
     """
+    parser = argparse.ArgumentParser(description="Build ChromaDB vector store từ transcript files")
+    parser.add_argument("--full", action="store_true", help="Bỏ qua build manifest, embed lại toàn bộ")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_EMBED_JOBS, help="Số batch embed đồng thời")
+    parser.add_argument("--warm-mindmaps", action="store_true",
+                        help="Sau khi build, tạo sẵn mindmap mặc định cho các bài chưa có trong mindmap store")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_EMBED_BATCH_SIZE, help="Số chunk mỗi batch embed")
+    args = parser.parse_args()
+    
     print("=" * 60)
     print("XÂY DỰNG CHROMADB VECTOR STORE")
     print("=" * 60)
@@ -127,31 +424,68 @@ def main():
         print("CẢNH BÁO: OPENAI_API_KEY chưa được thiết lập trong .env")
         return
     
-    # Load documents
-    print(f"\n1. Load documents từ {TRANSCRIPTS_DIR}")
-    documents = load_documents_from_directory(TRANSCRIPTS_DIR)
+    # Build vector store (chỉ embed phần thay đổi)
+    print(f"\n1. Cập nhật vector store từ {TRANSCRIPTS_DIR}")
+    start = time.perf_counter()
+    vectorstore, stats = build_vector_store(
+        TRANSCRIPTS_DIR, CHROMA_DB_PATH, full=args.full, jobs=args.jobs, batch_size=args.batch_size
+    )
     
-    if not documents:
+    if not stats["chunks_total"]:
         print("Không có document nào để xử lý!")
         print(f"Vui lòng thêm file .txt hoặc .pdf vào thư mục: {TRANSCRIPTS_DIR}")
+    
+    changed = stats["chunks_added"] or stats["chunks_removed"] or stats["files_changed"] or stats["files_removed"]
+    derived_files = (
+        CHROMA_DB_PATH / LEXICAL_INDEX_FILE,
+        CHROMA_DB_PATH / SNAPSHOT_FILE,
+        CHROMA_DB_PATH / LESSON_DIGESTS_FILE,
+    )
+    if not changed and all(path.exists() for path in derived_files):
+        print(f"\nKhông có thay đổi ({stats['files_unchanged']} files, {stats['chunks_total']} chunks), "
+              f"bỏ qua ({time.perf_counter() - start:.2f}s)")
+        if args.warm_mindmaps:
+            warm_mindmaps()
         return
     
-    print(f"Đã load {len(documents)} documents")
+    # Build lexical index
+    print("\n2. Xây dựng lexical index (BM25)")
+    build_lexical_index(vectorstore, CHROMA_DB_PATH)
     
-    # Split documents
-    print("\n2. Chia nhỏ documents thành chunks")
-    chunks = split_documents(documents)
+    # Export snapshot embedding (mmap, dùng chung giữa các worker)
+    print("\n3. Export embedding snapshot")
+    index_version = new_index_version()
+    footer = export_collection_snapshot(vectorstore._collection, CHROMA_DB_PATH / SNAPSHOT_FILE, index_version)
+    print(f"Đã lưu snapshot ({footer['count']} x {footer['dimension']}) tại: {CHROMA_DB_PATH / SNAPSHOT_FILE}")
     
-    # Build vector store
-    print("\n3. Xây dựng vector store")
-    build_vector_store(chunks, CHROMA_DB_PATH)
+    # Lesson digest: chunk đại diện cho từng bài, theo thứ tự transcript
+    print("\n4. Xây dựng lesson digests")
+    digests = build_lesson_digests(EmbeddingSnapshot(CHROMA_DB_PATH / SNAPSHOT_FILE), LESSON_DIGEST_MAX_TOKENS)
+    write_lesson_digests(CHROMA_DB_PATH / LESSON_DIGESTS_FILE, digests, index_version, LESSON_DIGEST_MAX_TOKENS)
+    for lesson_id, digest in digests.items():
+        print(f"  {lesson_id}: {len(digest['chunks'])}/{digest['total_chunks']} chunks, {digest['tokens']} tokens")
+    
+    # Đánh version mới để các cache ở runtime tự invalidate
+    bump_index_version(CHROMA_DB_PATH, index_version)
     
     print("\n" + "=" * 60)
     print("HOÀN THÀNH!")
     print("=" * 60)
     print(f"Vector store đã được lưu tại: {CHROMA_DB_PATH}")
-    print(f"Tổng số documents: {len(documents)}")
-    print(f"Tổng số chunks: {len(chunks)}")
+    print(f"Files: {stats['files_changed']} thay đổi, {stats['files_unchanged']} giữ nguyên, {stats['files_removed']} đã xóa")
+    print(f"Chunks: +{stats['chunks_added']} / -{stats['chunks_removed']} / "
+          f"{stats['chunks_updated']} cập nhật metadata (tổng {stats['chunks_total']})")
+    embedding = stats["embedding"]
+    if embedding["chunks"]:
+        print(f"Embedding: {embedding['chunks']} chunks / {embedding['batches']} batches trong "
+              f"{embedding['seconds']:.2f}s ({embedding['chunks_per_second']:.1f} chunks/s)")
+    if stats["chunks_resumed"]:
+        print(f"Tiếp tục từ checkpoint: {stats['chunks_resumed']} chunks không phải embed lại")
+    print(f"Thời gian: {time.perf_counter() - start:.2f}s")
+    print(f"Index version: {index_version}")
+    
+    if args.warm_mindmaps:
+        warm_mindmaps()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,86 @@
+"""
+Build manifest của vector store
+
+Ghi lại hash nội dung của từng file transcript và id các chunk đã embed từ file
+đó, để build_chroma.py chỉ embed chunk mới/thay đổi và xóa chunk của file đã
+bị xóa/sửa thay vì embed lại toàn bộ corpus mỗi lần chạy.
+
+Chunk id được tính từ (file, nội dung chunk) nên chunk không đổi giữ nguyên id
+kể cả khi file được sửa ở chỗ khác.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Union
+
+BUILD_MANIFEST_FILE = "build_manifest.json"
+MANIFEST_FORMAT = 1
+
+
+def file_sha256(path: Union[str, Path]) -> str:
+    """Hash nội dung file (đọc theo block, không load cả file vào RAM)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_hash(text: str) -> str:
+    """Hash nội dung một chunk"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class ChunkIdGenerator:
+    """
+    Tính id ổn định cho các chunk của một file, theo thứ tự xuất hiện
+    (dùng được khi chunk được sinh dần từ generator)
+    """
+
+    def __init__(self, file_key: str):
+        self.file_key = file_key
+        self._seen: Dict[str, int] = {}
+
+    def next_id(self, text: str) -> str:
+        """Id của chunk tiếp theo; chunk trùng nội dung được phân biệt bằng số lần xuất hiện"""
+        digest = content_hash(text)
+        occurrence = self._seen.get(digest, 0)
+        self._seen[digest] = occurrence + 1
+        return hashlib.sha256(f"{self.file_key}\0{digest}\0{occurrence}".encode("utf-8")).hexdigest()[:32]
+
+
+class BuildManifest:
+    """Manifest {file: {sha256, lesson_id, chunk_ids}} lưu cạnh ChromaDB"""
+
+    def __init__(self, path: Union[str, Path], files: Dict[str, Dict] = None):
+        self.path = Path(path)
+        self.files: Dict[str, Dict] = files or {}
+
+    @classmethod
+    def load(cls, db_path: Union[str, Path]) -> "BuildManifest":
+        """Đọc manifest, trả về manifest rỗng nếu chưa có hoặc sai format"""
+        path = Path(db_path) / BUILD_MANIFEST_FILE
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return cls(path)
+        if data.get("format") != MANIFEST_FORMAT:
+            return cls(path)
+        return cls(path, data.get("files", {}))
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def save(self):
+        """Ghi manifest (file tạm + rename để không bị ghi dở)"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(
+            json.dumps({"format": MANIFEST_FORMAT, "files": self.files}, ensure_ascii=False, indent=2),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, self.path)
+
+    def all_chunk_ids(self) -> List[str]:
+        return [chunk_id for entry in self.files.values() for chunk_id in entry.get("chunk_ids", [])]
@@ -0,0 +1,232 @@
+"""
+Cache embedding của query trên đĩa (SQLite)
+
+Mỗi lần similarity_search, Chroma gọi embed_query qua mạng tới OpenAI, kể cả với
+các chuỗi cố định (TOPIC_EXPANSIONS, "Toán lớp 4", ...). CachedEmbeddings bọc
+embedding model gốc, lưu vector theo (model, hash của text) vào SQLite nên cache
+vẫn còn sau khi restart. Chỉ text mới thật sự mới tốn một round trip.
+
+- Vector lưu dạng float32 bytes (nhỏ gọn, không qua JSON)
+- Giới hạn số entry, evict entry ít dùng gần đây nhất
+- Thêm một LRU nhỏ trong RAM trước SQLite
+"""
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Chỉ cập nhật last_used khi entry đã lâu không dùng, tránh ghi đĩa mỗi lần hit
+_TOUCH_INTERVAL_SECONDS = 3600
+
+
+def _cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class SQLiteEmbeddingCache:
+    """Lưu embedding theo (model, text hash) trong SQLite, có giới hạn số entry"""
+
+    def __init__(self, path: Union[str, Path], max_entries: int = 50000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Lấy embedding đã cache, None cho text chưa có"""
+        keys = [_cache_key(model, text) for text in texts]
+        found = {}
+        now = int(time.time())
+        touched = False
+        with self._lock:
+            # SQLite giới hạn số tham số mỗi câu lệnh, chia theo lô
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector, last_used FROM embeddings WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                for key, blob, _ in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+                stale = [(now, key) for key, _, last_used in rows if now - last_used > _TOUCH_INTERVAL_SECONDS]
+                if stale:
+                    self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", stale)
+                    touched = True
+            # Hit thường không ghi gì, chỉ commit khi đã cập nhật last_used
+            if touched:
+                self._conn.commit()
+        return [found.get(key) for key in keys]
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        """Lưu embedding, evict entry cũ nhất nếu vượt max_entries"""
+        now = int(time.time())
+        rows = [
+            (_cache_key(model, text), model, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._count += self._conn.total_changes - before
+            if self._count > self.max_entries:
+                # Evict thêm 10% để không phải evict ở mỗi lần ghi
+                to_delete = self._count - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (to_delete,),
+                )
+                self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        return self._count
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Bọc một Embeddings bất kỳ, cache embedding của query (RAM LRU + SQLite)
+
+    embed_documents (dùng khi build vector store) đi thẳng tới model gốc.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        cache: SQLiteEmbeddingCache,
+        model_name: Optional[str] = None,
+        memory_size: int = 1024,
+    ):
+        self.underlying = underlying
+        self.cache = cache
+        self.model_name = model_name or getattr(underlying, "model", None) or type(underlying).__name__
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _memory_get(self, text: str) -> Optional[List[float]]:
+        with self._memory_lock:
+            vector = self._memory.get(text)
+            if vector is not None:
+                self._memory.move_to_end(text)
+            return vector
+
+    def _memory_put(self, text: str, vector: List[float]):
+        with self._memory_lock:
+            self._memory[text] = vector
+            self._memory.move_to_end(text)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _lookup_disk(self, texts: Sequence[str], vectors: List[Optional[List[float]]]):
+        """Điền các vector còn thiếu (None) từ SQLite"""
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            stored = self.cache.get_many(self.model_name, [texts[i] for i in missing])
+            for i, vector in zip(missing, stored):
+                if vector is not None:
+                    vectors[i] = vector
+                    self._memory_put(texts[i], vector)
+
+    def _lookup(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Tra RAM rồi tới SQLite, trả về None cho text chưa có"""
+        vectors = [self._memory_get(text) for text in texts]
+        self._lookup_disk(texts, vectors)
+        return vectors
+
+    def _store(self, texts: Sequence[str], vectors: Sequence[List[float]]):
+        for text, vector in zip(texts, vectors):
+            self._memory_put(text, vector)
+        self.cache.put_many(self.model_name, texts, vectors)
+
+    def embed_queries(self, texts: Sequence[str]) -> List[List[float]]:
+        """
+        Embed nhiều query, các text chưa cache được gửi trong MỘT request
+
+        Args:
+            texts: Danh sách query
+
+        Returns:
+            List vector theo đúng thứ tự texts
+        """
+        texts = list(texts)
+        vectors = self._lookup(texts)
+        missing = sorted({texts[i] for i, vector in enumerate(vectors) if vector is None})
+        self.hits += len(texts) - sum(1 for vector in vectors if vector is None)
+        if missing:
+            self.misses += len(missing)
+            new_vectors = self.underlying.embed_documents(missing)
+            self._store(missing, new_vectors)
+            by_text = dict(zip(missing, new_vectors))
+            vectors = [vector if vector is not None else by_text[text] for text, vector in zip(texts, vectors)]
+        return vectors
+
+    async def aembed_queries(self, texts: Sequence[str]) -> List[List[float]]:
+        """Bản async của embed_queries (I/O SQLite chạy trong thread pool, không block event loop)"""
+        texts = list(texts)
+        vectors = [self._memory_get(text) for text in texts]
+        if any(vector is None for vector in vectors):
+            await asyncio.to_thread(self._lookup_disk, texts, vectors)
+        missing = sorted({texts[i] for i, vector in enumerate(vectors) if vector is None})
+        self.hits += len(texts) - sum(1 for vector in vectors if vector is None)
+        if missing:
+            self.misses += len(missing)
+            new_vectors = await self.underlying.aembed_documents(missing)
+            await asyncio.to_thread(self._store, missing, new_vectors)
+            by_text = dict(zip(missing, new_vectors))
+            vectors = [vector if vector is not None else by_text[text] for text, vector in zip(texts, vectors)]
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_queries([text]))[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.underlying.aembed_documents(texts)
+
+    def stats(self) -> dict:
+        """Thống kê hit/miss và số entry trên đĩa"""
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self.cache),
+            "max_disk_entries": self.cache.max_entries,
+        }
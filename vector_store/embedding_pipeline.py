@@ -0,0 +1,212 @@
+"""
+Embed chunk theo batch, chạy song song, có checkpoint để build bị dừng giữa chừng
+có thể chạy tiếp
+
+- Chunk được đọc dần từ generator, chỉ giữ tối đa max_in_flight batch trong RAM
+- Các batch được embed trên một pool thread giới hạn (--jobs)
+- Gặp rate limit / lỗi mạng tạm thời thì chờ (exponential backoff + jitter) rồi thử lại
+- Batch xong được ghi thẳng vào Chroma (kèm embedding đã tính) ở thread chính
+- Id của chunk đã ghi được append vào checkpoint JSONL; lần chạy sau bỏ qua các id này
+"""
+import json
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Set, Union
+
+import openai
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+BUILD_CHECKPOINT_FILE = "build_checkpoint.jsonl"
+
+# Lỗi tạm thời: thử lại sau khi backoff
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class BuildCheckpoint:
+    """Checkpoint append-only: mỗi dòng là danh sách id chunk đã ghi vào Chroma"""
+
+    def __init__(self, db_path: Union[str, Path]):
+        self.path = Path(db_path) / BUILD_CHECKPOINT_FILE
+        self.done_ids: Set[str] = set()
+        self._file = None
+
+    def load(self) -> "BuildCheckpoint":
+        """Đọc checkpoint của lần build trước (bỏ qua dòng cuối bị ghi dở)"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.done_ids.update(json.loads(line)["ids"])
+                    except (ValueError, KeyError):
+                        continue
+        except OSError:
+            pass
+        return self
+
+    def record(self, ids: List[str]):
+        """Ghi nhận một batch đã ghi xong (flush + fsync để không mất khi crash)"""
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps({"ids": ids}) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.done_ids.update(ids)
+
+    def clear(self):
+        """Xóa checkpoint (gọi khi build hoàn tất)"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.done_ids.clear()
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+
+def embed_with_backoff(
+    embeddings: Embeddings,
+    texts: List[str],
+    max_attempts: int = 6,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+) -> List[List[float]]:
+    """
+    Embed một batch, thử lại với exponential backoff khi gặp rate limit / lỗi tạm thời
+
+    Args:
+        embeddings: Embedding model
+        texts: Nội dung các chunk
+        max_attempts: Số lần thử tối đa
+        base_delay: Thời gian chờ ban đầu (giây)
+        max_delay: Thời gian chờ tối đa giữa 2 lần thử (giây)
+
+    Returns:
+        List vector theo đúng thứ tự texts
+    """
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return embeddings.embed_documents(texts)
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_attempts:
+                raise
+            delay = min(max_delay, base_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            print(f"  [{type(e).__name__}] thử lại batch {len(texts)} chunks sau {delay:.1f}s "
+                  f"(lần {attempt}/{max_attempts})")
+            time.sleep(delay)
+
+
+def iter_batches(items: Iterable, batch_size: int) -> Iterator[list]:
+    """Gom iterable thành các batch, không materialize toàn bộ"""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def run_embedding_pipeline(
+    embeddings: Embeddings,
+    collection,
+    work: Iterable[tuple],
+    checkpoint: BuildCheckpoint,
+    on_chunk_done: Callable[[str], None],
+    jobs: int = 4,
+    batch_size: int = 100,
+    max_in_flight: int = None,
+) -> Dict:
+    """
+    Embed và upsert các chunk vào Chroma
+
+    `work` được đọc dần: chỉ lấy batch tiếp theo khi số batch đang embed nhỏ hơn
+    max_in_flight (backpressure), nên bộ nhớ không phụ thuộc kích thước corpus.
+
+    Args:
+        embeddings: Embedding model
+        collection: Chroma collection (vectorstore._collection)
+        work: Iterable (có thể là generator) các cặp (chunk_id, Document) cần embed
+        checkpoint: Checkpoint để ghi nhận batch đã xong
+        on_chunk_done: Callback với chunk_id sau khi chunk đã được ghi
+        jobs: Số batch embed đồng thời
+        batch_size: Số chunk mỗi batch
+        max_in_flight: Số batch tối đa đã đọc mà chưa ghi xong (mặc định 2 * jobs)
+
+    Returns:
+        Dict thống kê: chunks, batches, seconds, chunks_per_second
+    """
+    max_in_flight = max_in_flight or 2 * jobs
+    stats = {"chunks": 0, "batches": 0, "seconds": 0.0, "chunks_per_second": 0.0}
+    batches = iter_batches(work, batch_size)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = {}
+
+        def submit_next() -> bool:
+            batch = next(batches, None)
+            if batch is None:
+                return False
+            future = executor.submit(embed_with_backoff, embeddings, [doc.page_content for _, doc in batch])
+            pending[future] = batch
+            return True
+
+        try:
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < max_in_flight:
+                    exhausted = not submit_next()
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = pending.pop(future)
+                    _upsert_batch(collection, batch, future.result())
+                    ids = [chunk_id for chunk_id, _ in batch]
+                    checkpoint.record(ids)
+                    for chunk_id in ids:
+                        on_chunk_done(chunk_id)
+                    stats["chunks"] += len(batch)
+                    stats["batches"] += 1
+                    print(f"  Đã embed {stats['chunks']} chunks "
+                          f"({stats['chunks'] / (time.perf_counter() - start):.1f} chunks/s)")
+        except BaseException:
+            # Dừng các batch chưa chạy, batch đã ghi vẫn nằm trong checkpoint
+            for future in pending:
+                future.cancel()
+            raise
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["chunks_per_second"] = stats["chunks"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+def _upsert_batch(collection, batch: List[tuple], vectors: List[List[float]]):
+    """Ghi một batch (kèm embedding đã tính) vào Chroma"""
+    collection.upsert(
+        ids=[chunk_id for chunk_id, _ in batch],
+        embeddings=vectors,
+        documents=[doc.page_content for _, doc in batch],
+        metadatas=[_clean_metadata(doc) for _, doc in batch],
+    )
+
+
+def _clean_metadata(doc: Document) -> Dict:
+    """Chroma chỉ nhận metadata kiểu str/int/float/bool"""
+    return {
+        key: value
+        for key, value in doc.metadata.items()
+        if isinstance(value, (str, int, float, bool))
+    }
@@ -0,0 +1,77 @@
+"""
+Version của vector store
+
+build_chroma.py ghi một version mới sau mỗi lần build; các cache ở runtime
+(semantic answer cache, ...) so sánh version để tự invalidate khi index thay đổi.
+"""
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Union
+
+INDEX_VERSION_FILE = "INDEX_VERSION"
+
+
+def new_index_version() -> str:
+    """Sinh version mới (timestamp + id ngẫu nhiên)"""
+    return f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def bump_index_version(db_path: Union[str, Path], version: Optional[str] = None) -> str:
+    """
+    Ghi version mới cho vector store (gọi sau khi build xong)
+
+    Args:
+        db_path: Thư mục ChromaDB
+        version: Version cần ghi (mặc định sinh version mới)
+
+    Returns:
+        Version mới
+    """
+    version = version or new_index_version()
+    path = Path(db_path) / INDEX_VERSION_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Ghi file tạm rồi rename để reader không đọc phải file ghi dở
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(version, encoding="utf-8")
+    os.replace(tmp_path, path)
+    return version
+
+
+def read_index_version(db_path: Union[str, Path]) -> str:
+    """Đọc version hiện tại, trả về "" nếu chưa build"""
+    try:
+        return (Path(db_path) / INDEX_VERSION_FILE).read_text(encoding="utf-8").strip()
+    except OSError:
+        return ""
+
+
+class IndexVersionWatcher:
+    """Theo dõi version của vector store, chỉ đọc lại file khi mtime thay đổi"""
+
+    def __init__(self, db_path: Union[str, Path]):
+        self.path = Path(db_path) / INDEX_VERSION_FILE
+        self._mtime: Optional[int] = None
+        self.version = ""
+        self.changed()
+
+    def _stat(self) -> Optional[int]:
+        try:
+            return self.path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def changed(self) -> bool:
+        """True nếu version đã thay đổi kể từ lần kiểm tra trước"""
+        mtime = self._stat()
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        version = read_index_version(self.path.parent)
+        if version == self.version:
+            return False
+        self.version = version
+        return True
+
@@ -0,0 +1,105 @@
+"""
+Automaton Aho-Corasick: tìm cùng lúc nhiều keyword trong một đoạn text
+
+Biên dịch một lần từ danh sách keyword, sau đó mỗi lần tìm chỉ quét text một
+lượt (O(độ dài text + số kết quả)) bất kể có bao nhiêu keyword.
+
+Text và keyword được chuẩn hóa bằng normalize_phrase (NFC, lowercase, dấu câu
+thành khoảng trắng, thêm khoảng trắng hai đầu) nên keyword chỉ khớp nguyên từ:
+"số" không khớp trong "sống", "chia" không khớp trong "chiaa".
+"""
+import re
+import unicodedata
+from collections import deque
+from typing import Any, Dict, Iterable, List, Tuple
+
+from .lexical_index import strip_diacritics
+
+_SEPARATOR_RE = re.compile(r"[\W_]+")
+
+
+def normalize_phrase(text: str, plain: bool = False) -> str:
+    """
+    Chuẩn hóa text để so khớp theo từ
+
+    Args:
+        text: Text cần chuẩn hóa
+        plain: Bỏ dấu tiếng Việt ("phân số" → "phan so")
+
+    Returns:
+        Text dạng " từ từ ... " (một khoảng trắng giữa các từ và ở hai đầu)
+    """
+    text = unicodedata.normalize("NFC", text).lower()
+    if plain:
+        text = strip_diacritics(text)
+    return f" {_SEPARATOR_RE.sub(' ', text).strip()} "
+
+
+class KeywordAutomaton:
+    """Automaton Aho-Corasick trên text đã chuẩn hóa, mỗi keyword gắn một giá trị"""
+
+    def __init__(self, keywords: Iterable[Tuple[str, Any]]):
+        """
+        Args:
+            keywords: Các cặp (keyword đã chuẩn hóa bằng normalize_phrase, giá trị trả về khi khớp)
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Các keyword kết thúc tại mỗi state: (độ dài keyword, giá trị)
+        self._output: List[List[Tuple[int, Any]]] = [[]]
+        self._size = 0
+
+        for keyword, value in keywords:
+            self._add(keyword, value)
+        self._build()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _add(self, keyword: str, value: Any):
+        state = 0
+        for ch in keyword:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((len(keyword), value))
+        self._size += 1
+
+    def _build(self):
+        """Tính failure link theo BFS, gộp output của failure state vào từng state"""
+        # Các state độ sâu 1 có failure link về gốc (mặc định 0)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(ch, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find(self, text: str) -> List[Tuple[int, int, Any]]:
+        """
+        Tìm mọi keyword xuất hiện trong text (kể cả chồng lấn nhau)
+
+        Args:
+            text: Text đã chuẩn hóa bằng normalize_phrase
+
+        Returns:
+            List (vị trí bắt đầu, vị trí kết thúc, giá trị) theo thứ tự vị trí kết thúc
+        """
+        matches = []
+        state = 0
+        for position, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for length, value in self._output[state]:
+                matches.append((position + 1 - length, position + 1, value))
+        return matches
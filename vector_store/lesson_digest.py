@@ -0,0 +1,171 @@
+"""
+Lesson digest: tóm lược cố định của từng bài giảng, tính sẵn lúc build
+
+/mindmap và /analyzer khi không có topic trước đây similarity search với một
+query vô nghĩa ("toàn bộ bài học", "Toán lớp 4") nên nhận về một tập chunk tùy
+ý, không theo thứ tự. Digest chọn các chunk đại diện cho cả bài:
+- MMR quanh centroid embedding của bài (đại diện + không trùng lặp)
+- Giới hạn theo số token
+- Sắp xếp lại theo thứ tự trong transcript
+
+Runtime chỉ cần tra dict theo lesson_id, không embed, không vector search.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from .index_version import IndexVersionWatcher
+from .tokens import count_tokens
+
+LESSON_DIGESTS_FILE = "lesson_digests.json"
+DIGEST_FORMAT = 1
+
+
+def select_digest_rows(
+    matrix: np.ndarray,
+    token_counts: Sequence[int],
+    max_tokens: int,
+    diversity: float = 0.3,
+) -> List[int]:
+    """
+    Chọn các dòng đại diện cho bài bằng MMR quanh centroid, trong giới hạn token
+
+    Args:
+        matrix: Embedding đã normalize của các chunk trong bài (theo thứ tự transcript)
+        token_counts: Số token của từng chunk
+        max_tokens: Tổng số token tối đa
+        diversity: Trọng số phạt chunk giống chunk đã chọn (0 = chỉ xét độ đại diện)
+
+    Returns:
+        Index các dòng được chọn, theo thứ tự transcript
+    """
+    rows = len(token_counts)
+    if sum(token_counts) <= max_tokens:
+        return list(range(rows))
+
+    centroid = matrix.mean(axis=0)
+    norm = np.linalg.norm(centroid)
+    relevance = matrix @ (centroid / norm) if norm else np.zeros(rows, dtype=np.float32)
+    max_similarity = np.zeros(rows, dtype=np.float32)
+    available = np.ones(rows, dtype=bool)
+    selected: List[int] = []
+    remaining = max_tokens
+
+    while True:
+        fits = available & (np.asarray(token_counts) <= remaining)
+        if not fits.any():
+            break
+        scores = (1 - diversity) * relevance - diversity * max_similarity
+        scores[~fits] = -np.inf
+        row = int(np.argmax(scores))
+        selected.append(row)
+        available[row] = False
+        remaining -= token_counts[row]
+        max_similarity = np.maximum(max_similarity, matrix @ matrix[row])
+
+    return sorted(selected)
+
+
+def build_lesson_digests(snapshot, max_tokens: int = 2500) -> Dict[str, Dict]:
+    """
+    Tính digest cho mọi bài từ embedding snapshot
+
+    Args:
+        snapshot: EmbeddingSnapshot (dòng nhóm theo lesson_id, theo thứ tự chunk)
+        max_tokens: Giới hạn token của mỗi digest
+
+    Returns:
+        Dict lesson_id -> digest {version, lesson_version, tokens, chunks: [{content, source, chunk_index}]}
+    """
+    digests = {}
+    for lesson_id, (start, end) in snapshot.lesson_ranges.items():
+        contents = [snapshot.contents[row] for row in range(start, end)]
+        token_counts = [count_tokens(content) for content in contents]
+        selected = select_digest_rows(np.asarray(snapshot.matrix[start:end]), token_counts, max_tokens)
+
+        chunks = [
+            {
+                "content": contents[i],
+                "source": snapshot.sources[start + i],
+                "chunk_index": int(snapshot.chunk_index[start + i]),
+            }
+            for i in selected
+        ]
+        version = hashlib.sha256(
+            "\0".join(chunk["content"] for chunk in chunks).encode("utf-8")
+        ).hexdigest()[:16]
+        # Version của cả bài: chỉ đổi khi nội dung bài thay đổi (dùng làm key cho cache theo bài)
+        lesson_version = hashlib.sha256("\0".join(contents).encode("utf-8")).hexdigest()[:16]
+        digests[lesson_id] = {
+            "version": version,
+            "lesson_version": lesson_version,
+            "tokens": sum(token_counts[i] for i in selected),
+            "total_chunks": end - start,
+            "chunks": chunks,
+        }
+    return digests
+
+
+def write_lesson_digests(path: Union[str, Path], digests: Dict[str, Dict], index_version: str = "", max_tokens: int = 0):
+    """Ghi digest ra file JSON (file tạm + rename)"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(
+        json.dumps(
+            {"format": DIGEST_FORMAT, "index_version": index_version, "max_tokens": max_tokens, "lessons": digests},
+            ensure_ascii=False,
+        ),
+        encoding="utf-8",
+    )
+    os.replace(tmp_path, path)
+
+
+class LessonDigestStore:
+    """Đọc lesson_digests.json, tự load lại khi vector store được build lại"""
+
+    def __init__(self, db_path: Union[str, Path]):
+        self.path = Path(db_path) / LESSON_DIGESTS_FILE
+        self._version_watcher = IndexVersionWatcher(db_path)
+        self._lessons: Dict[str, Dict] = {}
+        self._load()
+
+    def _load(self):
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self._lessons = {}
+            return
+        if data.get("format") != DIGEST_FORMAT:
+            self._lessons = {}
+            return
+        self._lessons = data.get("lessons", {})
+
+    def get(self, lesson_id: Optional[str]) -> Optional[Dict]:
+        """
+        Digest của bài giảng
+
+        Args:
+            lesson_id: ID bài giảng
+
+        Returns:
+            Dict {version, lesson_version, tokens, chunks}, hoặc None nếu chưa có
+        """
+        if not lesson_id:
+            return None
+        if self._version_watcher.changed():
+            self._load()
+        return self._lessons.get(lesson_id)
+
+    def lesson_ids(self) -> List[str]:
+        """Danh sách bài giảng có digest"""
+        if self._version_watcher.changed():
+            self._load()
+        return list(self._lessons)
+
+    def __len__(self) -> int:
+        return len(self._lessons)
@@ -0,0 +1,237 @@
+"""
+Inverted index BM25 cho transcript tiếng Việt (chạy hoàn toàn in-process)
+
+Câu hỏi toán như "chữ số 6 trong 36547 thuộc hàng nào" phụ thuộc vào từ và số
+chính xác, dense embedding xử lý kém. Index này được build cùng lúc với ChromaDB
+trên cùng các chunk, dùng cho:
+- Hybrid retrieval: gộp kết quả BM25 với vector search
+- Lexical-only: trả lời không cần gọi mạng khi embedding service chậm/lỗi
+
+Chuẩn hóa tiếng Việt:
+- Unicode NFC + lowercase
+- Mỗi âm tiết được index cả dạng có dấu và không dấu ("phân" + "phan", đ → d)
+- Thêm bigram âm tiết có dấu ("phân_số") vì từ tiếng Việt thường gồm 2 âm tiết
+- Số có dấu phân cách hàng nghìn được gộp lại: "36.547" / "36,547" → "36547"
+"""
+import gzip
+import heapq
+import json
+import math
+import re
+import unicodedata
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+LEXICAL_INDEX_FILE = "lexical_index.json.gz"
+
+_NUMBER_PATTERN = r"\d{1,3}(?:[.,]\d{3})+(?!\d)|\d+"
+_TOKEN_RE = re.compile(rf"({_NUMBER_PATTERN})|([^\W\d_]+)")
+
+
+def strip_diacritics(text: str) -> str:
+    """Bỏ dấu tiếng Việt: "phân số" → "phan so", "đơn" → "don" """
+    text = text.replace("đ", "d").replace("Đ", "D")
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tách text thành các term để index/tìm kiếm
+
+    Args:
+        text: Nội dung cần tách
+
+    Returns:
+        List term: số, âm tiết (có dấu + không dấu), bigram âm tiết
+    """
+    text = unicodedata.normalize("NFC", text).lower()
+    terms = []
+    previous_word = None
+
+    for match in _TOKEN_RE.finditer(text):
+        number, word = match.group(1), match.group(2)
+        if number:
+            terms.append(re.sub(r"[.,]", "", number))
+            previous_word = None
+            continue
+
+        terms.append(word)
+        plain = strip_diacritics(word)
+        if plain != word:
+            terms.append(plain)
+        if previous_word:
+            terms.append(f"{previous_word}_{word}")
+        previous_word = word
+
+    return terms
+
+
+class BM25Index:
+    """Inverted index BM25 nhỏ gọn, lọc được theo lesson_id"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.contents: List[str] = []
+        self.sources: List[str] = []
+        self.lesson_ids: List[str] = []
+        self.doc_lengths = array("I")
+        # term -> (doc ids, term frequencies)
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self._lesson_docs: Dict[str, set] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.contents)
+
+    def add(self, content: str, source: str = "unknown", lesson_id: str = ""):
+        """Thêm một chunk vào index"""
+        doc_id = len(self.contents)
+        self.contents.append(content)
+        self.sources.append(source)
+        self.lesson_ids.append(lesson_id)
+
+        terms = tokenize(content)
+        self.doc_lengths.append(len(terms))
+
+        frequencies: Dict[str, int] = {}
+        for term in terms:
+            frequencies[term] = frequencies.get(term, 0) + 1
+        for term, frequency in frequencies.items():
+            doc_ids, tfs = self.postings.setdefault(term, (array("I"), array("I")))
+            doc_ids.append(doc_id)
+            tfs.append(frequency)
+
+        self._lesson_docs.setdefault(lesson_id, set()).add(doc_id)
+        self._total_length += len(terms)
+
+    @classmethod
+    def build(cls, chunks: Iterable[Tuple[str, Dict]], **kwargs) -> "BM25Index":
+        """
+        Build index từ các chunk (content, metadata)
+
+        Args:
+            chunks: Iterable các cặp (nội dung, metadata có source/lesson_id)
+
+        Returns:
+            BM25Index đã build
+        """
+        index = cls(**kwargs)
+        for content, metadata in chunks:
+            index.add(content, metadata.get("source", "unknown"), metadata.get("lesson_id", ""))
+        return index
+
+    def _score(self, query: str, allowed: Optional[set] = None) -> Dict[int, float]:
+        """Điểm BM25 của các chunk chứa ít nhất một term của query"""
+        total_docs = len(self.contents)
+        avg_length = self._total_length / total_docs or 1.0
+        scores: Dict[int, float] = {}
+
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            doc_ids, tfs = posting
+            idf = math.log(1 + (total_docs - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            for doc_id, tf in zip(doc_ids, tfs):
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                length_norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+
+        return scores
+
+    def search(self, query: str, k: int = 3, lesson_id: Optional[str] = None) -> List[Dict]:
+        """
+        Tìm top-k chunk theo điểm BM25
+
+        Args:
+            query: Câu truy vấn
+            k: Số lượng kết quả
+            lesson_id: Chỉ tìm trong bài giảng này (tùy chọn)
+
+        Returns:
+            List dict content/source/lesson_id giống RetrieverTool.retrieve
+        """
+        if not self.contents:
+            return []
+
+        allowed = self._lesson_docs.get(lesson_id, set()) if lesson_id else None
+        if allowed is not None and not allowed:
+            return []
+
+        scores = self._score(query, allowed)
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [
+            {
+                "content": self.contents[doc_id],
+                "source": self.sources[doc_id],
+                "lesson_id": self.lesson_ids[doc_id],
+            }
+            for doc_id, _ in top
+        ]
+
+    def lesson_scores(self, query: str) -> Dict[str, float]:
+        """
+        Điểm BM25 của query theo từng bài giảng (điểm của chunk khớp nhất trong bài)
+
+        Args:
+            query: Câu truy vấn
+
+        Returns:
+            dict lesson_id -> điểm, chỉ gồm các bài có chunk khớp query
+        """
+        if not self.contents:
+            return {}
+
+        lessons: Dict[str, float] = {}
+        for doc_id, score in self._score(query).items():
+            lesson_id = self.lesson_ids[doc_id]
+            if score > lessons.get(lesson_id, 0.0):
+                lessons[lesson_id] = score
+        return lessons
+
+    def lessons(self) -> List[str]:
+        """Các lesson_id có trong index"""
+        return sorted(self._lesson_docs)
+
+    def save(self, path: Union[str, Path]):
+        """Lưu index ra file JSON nén gzip"""
+        data = {
+            "format": 1,
+            "k1": self.k1,
+            "b": self.b,
+            "contents": self.contents,
+            "sources": self.sources,
+            "lesson_ids": self.lesson_ids,
+            "doc_lengths": self.doc_lengths.tolist(),
+            "postings": {term: [doc_ids.tolist(), tfs.tolist()] for term, (doc_ids, tfs) in self.postings.items()},
+        }
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "BM25Index":
+        """Đọc index đã lưu bằng save()"""
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+
+        index = cls(k1=data["k1"], b=data["b"])
+        index.contents = data["contents"]
+        index.sources = data["sources"]
+        index.lesson_ids = data["lesson_ids"]
+        index.doc_lengths = array("I", data["doc_lengths"])
+        index.postings = {
+            term: (array("I", doc_ids), array("I", tfs))
+            for term, (doc_ids, tfs) in data["postings"].items()
+        }
+        for doc_id, lesson_id in enumerate(index.lesson_ids):
+            index._lesson_docs.setdefault(lesson_id, set()).add(doc_id)
+        index._total_length = sum(index.doc_lengths)
+        return index
@@ -0,0 +1,145 @@
+"""
+Vector index in-memory bằng NumPy (thay thế cho truy vấn Chroma)
+
+Corpus chỉ vài nghìn chunk nên một phép nhân ma trận float32 nhanh hơn đi qua
+SQLite + HNSW + metadata filter của Chroma:
+- Toàn bộ embedding nằm trong một ma trận float32 liên tục, đã chia cho norm
+  (norm được tính sẵn lúc load) → cosine similarity = một phép nhân ma trận
+- Các dòng được sắp xếp theo lesson_id, filter theo bài = cắt một đoạn dòng
+- Top-k dùng argpartition, chỉ sort k phần tử
+"""
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Số dòng mỗi lần đọc từ Chroma collection khi load
+_LOAD_PAGE_SIZE = 1000
+
+
+class NumpyVectorIndex:
+    """Ma trận embedding + metadata dạng cột, các dòng nhóm theo lesson_id"""
+
+    def __init__(
+        self,
+        matrix: np.ndarray,
+        contents: Sequence[str],
+        sources: Sequence[str],
+        lesson_ids: Sequence[str],
+        normalized: bool = False,
+        lesson_ranges: Optional[Dict[str, Tuple[int, int]]] = None,
+    ):
+        """
+        Args:
+            matrix: Ma trận embedding (n x d), các dòng đã sắp xếp theo lesson_id
+            contents: Nội dung chunk theo dòng
+            sources: Source theo dòng
+            lesson_ids: lesson_id theo dòng
+            normalized: Các dòng của matrix đã được chia cho norm (dùng trực tiếp, không copy)
+            lesson_ranges: lesson_id -> (dòng bắt đầu, dòng kết thúc), tính từ lesson_ids nếu không truyền
+        """
+        if normalized:
+            self.matrix = matrix
+        else:
+            matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True) if len(matrix) else np.ones((0, 1), np.float32)
+            norms[norms == 0] = 1.0
+            self.matrix = matrix / norms
+        self.contents = contents
+        self.sources = sources
+        self.lesson_ids = lesson_ids
+        self.lesson_ranges = lesson_ranges if lesson_ranges is not None else _lesson_ranges(lesson_ids)
+
+    def __len__(self) -> int:
+        return len(self.contents)
+
+    @property
+    def dimension(self) -> int:
+        return self.matrix.shape[1] if self.matrix.ndim == 2 else 0
+
+    @classmethod
+    def from_rows(cls, rows: List[Tuple[Sequence[float], str, Dict]]) -> "NumpyVectorIndex":
+        """
+        Tạo index từ các dòng (embedding, content, metadata)
+
+        Dòng được sắp xếp theo (lesson_id, source, chunk_index) để mỗi bài là một
+        đoạn liên tục và giữ thứ tự trong transcript.
+        """
+        rows = sorted(rows, key=lambda row: row_sort_key(row[2]))
+        matrix = np.array([row[0] for row in rows], dtype=np.float32) if rows else np.zeros((0, 0), np.float32)
+        return cls(
+            matrix,
+            [row[1] for row in rows],
+            [row[2].get("source", "unknown") for row in rows],
+            [row[2].get("lesson_id", "") for row in rows],
+        )
+
+    @classmethod
+    def from_collection(cls, collection) -> "NumpyVectorIndex":
+        """Load toàn bộ embedding + metadata từ Chroma collection"""
+        return cls.from_rows(list(iter_collection_rows(collection)))
+
+    def search_many(self, vectors: Sequence[Sequence[float]], k: int = 3, lesson_id: Optional[str] = None) -> List[List[Dict]]:
+        """
+        Top-k chunk theo cosine similarity cho nhiều query cùng lúc
+
+        Args:
+            vectors: Embedding của các query
+            k: Số lượng kết quả mỗi query
+            lesson_id: Chỉ tìm trong bài giảng này (tùy chọn)
+
+        Returns:
+            List kết quả (dict content/source/lesson_id) cho từng query
+        """
+        start, end = self.lesson_ranges.get(lesson_id, (0, 0)) if lesson_id else (0, len(self))
+        if end <= start or not len(vectors):
+            return [[] for _ in vectors]
+
+        queries = np.asarray(vectors, dtype=np.float32)
+        query_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        query_norms[query_norms == 0] = 1.0
+        # (rows x d) @ (d x q): duyệt ma trận theo thứ tự bộ nhớ, nhanh hơn q @ M.T
+        scores = np.ascontiguousarray((self.matrix[start:end] @ (queries / query_norms).T).T)
+
+        k = min(k, end - start)
+        if k < end - start:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(end - start), (len(queries), 1))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.take_along_axis(top, np.argsort(-top_scores, axis=1), axis=1)
+
+        return [[self._result(start + int(row)) for row in rows] for rows in order]
+
+    def _result(self, row: int) -> Dict:
+        return {
+            "content": self.contents[row],
+            "source": self.sources[row],
+            "lesson_id": self.lesson_ids[row],
+        }
+
+
+def row_sort_key(metadata: Dict) -> Tuple[str, str, int]:
+    """Thứ tự dòng: nhóm theo lesson_id, giữ thứ tự chunk trong transcript"""
+    return (metadata.get("lesson_id", ""), metadata.get("source", ""), metadata.get("chunk_index", 0))
+
+
+def iter_collection_rows(collection, include_embeddings: bool = True) -> Iterator[Tuple]:
+    """Đọc dần (embedding, content, metadata) từ Chroma collection theo trang"""
+    include = ["embeddings", "documents", "metadatas"] if include_embeddings else ["documents", "metadatas"]
+    total = collection.count()
+    for offset in range(0, total, _LOAD_PAGE_SIZE):
+        page = collection.get(include=include, limit=_LOAD_PAGE_SIZE, offset=offset)
+        vectors = page["embeddings"] if include_embeddings else [None] * len(page["documents"])
+        for vector, content, metadata in zip(vectors, page["documents"], page["metadatas"]):
+            yield vector, content, metadata or {}
+
+
+def _lesson_ranges(lesson_ids: List[str]) -> Dict[str, Tuple[int, int]]:
+    """lesson_id -> (dòng bắt đầu, dòng kết thúc) với lesson_ids đã sắp xếp"""
+    ranges: Dict[str, Tuple[int, int]] = {}
+    start = 0
+    for row in range(1, len(lesson_ids) + 1):
+        if row == len(lesson_ids) or lesson_ids[row] != lesson_ids[start]:
+            ranges[lesson_ids[start]] = (start, row)
+            start = row
+    return ranges
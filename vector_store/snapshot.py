@@ -0,0 +1,280 @@
+"""
+Snapshot embedding chỉ-đọc, dùng chung giữa các uvicorn worker qua mmap
+
+build_chroma.py export toàn bộ embedding + metadata ra một file nhị phân có
+version. Mỗi worker mmap file này: các worker trên cùng máy dùng chung page
+của OS page cache, load gần như tức thì (zero-copy) và RSS riêng của worker
+không tăng theo kích thước corpus.
+
+Layout (các section căn lề 64 byte, little-endian):
+
+    MAGIC (8 byte)
+    matrix          float32 [n x d]   embedding đã normalize, dòng nhóm theo lesson_id
+    norms           float32 [n]       norm gốc của từng embedding
+    chunk_index     int32   [n]
+    source_codes    uint32  [n]       index vào bảng sources trong footer
+    lesson_codes    uint32  [n]       index vào bảng lesson_ids trong footer
+    content_offsets uint64  [n + 1]   vị trí nội dung chunk trong content_blob
+    content_blob    bytes             nội dung chunk (UTF-8) nối liền nhau
+    footer          JSON              format, index_version, n, d, vị trí các section,
+                                      bảng sources / lesson_ids, lesson_ranges
+    footer_length   uint64
+    MAGIC (8 byte)
+
+File được ghi ra file tạm rồi rename: worker đang mmap bản cũ vẫn đọc được
+bản cũ cho tới khi load lại.
+"""
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .numpy_index import NumpyVectorIndex, row_sort_key
+
+SNAPSHOT_FILE = "embeddings.snapshot"
+SNAPSHOT_FORMAT = 1
+MAGIC = b"VCSNAP01"
+_ALIGNMENT = 64
+_TRAILER = struct.Struct("<Q8s")
+
+# Số dòng mỗi lần đọc embedding từ Chroma khi export
+_EXPORT_PAGE_SIZE = 500
+
+
+class _StringColumn:
+    """Cột string đọc lazy từ mmap (chỉ decode dòng được truy cập)"""
+
+    def __init__(self, offsets: np.ndarray, blob: memoryview):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return bytes(self._blob[int(self._offsets[row]):int(self._offsets[row + 1])]).decode("utf-8")
+
+
+class _DictionaryColumn:
+    """Cột string mã hóa dạng dictionary (mã uint32 + bảng giá trị)"""
+
+    def __init__(self, codes: np.ndarray, values: List[str]):
+        self._codes = codes
+        self._values = values
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def __getitem__(self, row: int) -> str:
+        return self._values[self._codes[row]]
+
+
+def _pad(f, alignment: int = _ALIGNMENT) -> int:
+    """Ghi thêm byte 0 để vị trí hiện tại chia hết cho alignment"""
+    position = f.tell()
+    padding = (-position) % alignment
+    if padding:
+        f.write(b"\0" * padding)
+    return position + padding
+
+
+def write_snapshot(
+    path: Union[str, Path],
+    rows: Iterable[Tuple[Iterable[float], str, Dict]],
+    index_version: str = "",
+) -> Dict:
+    """
+    Ghi snapshot từ các dòng (embedding, content, metadata) đã sắp xếp theo lesson_id
+
+    Args:
+        path: Đường dẫn file snapshot
+        rows: Iterable các dòng theo thứ tự row_sort_key (được đọc dần, không giữ cả corpus)
+        index_version: Version của vector store mà snapshot tương ứng
+
+    Returns:
+        Footer của snapshot (n, d, ...)
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+
+    norms: List[float] = []
+    chunk_indexes: List[int] = []
+    source_codes: List[int] = []
+    lesson_codes: List[int] = []
+    content_offsets: List[int] = [0]
+    sources: Dict[str, int] = {}
+    lessons: Dict[str, int] = {}
+    lesson_ranges: Dict[str, List[int]] = {}
+    dimension = 0
+
+    with open(tmp_path, "wb") as f, tempfile.TemporaryFile() as blob:
+        f.write(MAGIC)
+        matrix_offset = _pad(f)
+
+        for row, (vector, content, metadata) in enumerate(rows):
+            vector = np.asarray(vector, dtype=np.float32)
+            if not dimension:
+                dimension = len(vector)
+            elif len(vector) != dimension:
+                raise ValueError(f"Embedding dòng {row} có {len(vector)} chiều, cần {dimension}")
+
+            norm = float(np.linalg.norm(vector))
+            f.write((vector / norm if norm else vector).astype("<f4").tobytes())
+            norms.append(norm)
+
+            lesson_id = metadata.get("lesson_id", "")
+            source = metadata.get("source", "unknown")
+            lesson_codes.append(lessons.setdefault(lesson_id, len(lessons)))
+            source_codes.append(sources.setdefault(source, len(sources)))
+            chunk_indexes.append(int(metadata.get("chunk_index", 0)))
+            lesson_ranges.setdefault(lesson_id, [row, row])[1] = row + 1
+
+            encoded = content.encode("utf-8")
+            blob.write(encoded)
+            content_offsets.append(content_offsets[-1] + len(encoded))
+
+        count = len(norms)
+        sections = {"matrix": [matrix_offset, "<f4", count * dimension]}
+        for name, dtype, values in (
+            ("norms", "<f4", norms),
+            ("chunk_index", "<i4", chunk_indexes),
+            ("source_codes", "<u4", source_codes),
+            ("lesson_codes", "<u4", lesson_codes),
+            ("content_offsets", "<u8", content_offsets),
+        ):
+            offset = _pad(f)
+            f.write(np.asarray(values, dtype=dtype).tobytes())
+            sections[name] = [offset, dtype, len(values)]
+
+        offset = _pad(f)
+        blob.seek(0)
+        shutil.copyfileobj(blob, f)
+        sections["content_blob"] = [offset, "u1", content_offsets[-1]]
+
+        footer = {
+            "format": SNAPSHOT_FORMAT,
+            "index_version": index_version,
+            "count": count,
+            "dimension": dimension,
+            "sections": sections,
+            "sources": list(sources),
+            "lesson_ids": list(lessons),
+            "lesson_ranges": lesson_ranges,
+        }
+        encoded_footer = json.dumps(footer, ensure_ascii=False).encode("utf-8")
+        f.write(encoded_footer)
+        f.write(_TRAILER.pack(len(encoded_footer), MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+    return footer
+
+
+def export_collection_snapshot(collection, path: Union[str, Path], index_version: str = "") -> Dict:
+    """
+    Export Chroma collection ra snapshot
+
+    Đọc metadata trước để sắp xếp dòng theo lesson_id, sau đó đọc embedding theo
+    từng trang đúng thứ tự đó nên bộ nhớ không tăng theo kích thước corpus.
+    """
+    keys = []
+    total = collection.count()
+    for offset in range(0, total, _EXPORT_PAGE_SIZE):
+        page = collection.get(include=["metadatas"], limit=_EXPORT_PAGE_SIZE, offset=offset)
+        for chunk_id, metadata in zip(page["ids"], page["metadatas"]):
+            keys.append((row_sort_key(metadata or {}), chunk_id))
+    ordered_ids = [chunk_id for _, chunk_id in sorted(keys)]
+
+    def iter_rows():
+        for start in range(0, len(ordered_ids), _EXPORT_PAGE_SIZE):
+            page_ids = ordered_ids[start:start + _EXPORT_PAGE_SIZE]
+            page = collection.get(ids=page_ids, include=["embeddings", "documents", "metadatas"])
+            by_id = {
+                chunk_id: (vector, content, metadata or {})
+                for chunk_id, vector, content, metadata in zip(
+                    page["ids"], page["embeddings"], page["documents"], page["metadatas"]
+                )
+            }
+            for chunk_id in page_ids:
+                yield by_id[chunk_id]
+
+    return write_snapshot(path, iter_rows(), index_version)
+
+
+class EmbeddingSnapshot:
+    """Snapshot đã mmap (read-only)"""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        buffer = memoryview(self._mmap)
+        if bytes(buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{self.path} không phải snapshot hợp lệ")
+        footer_length, magic = _TRAILER.unpack_from(buffer, len(buffer) - _TRAILER.size)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} bị ghi dở hoặc hỏng")
+        footer_start = len(buffer) - _TRAILER.size - footer_length
+        self.footer = json.loads(bytes(buffer[footer_start:footer_start + footer_length]).decode("utf-8"))
+        if self.footer.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Snapshot format {self.footer.get('format')} không được hỗ trợ")
+
+        self.index_version: str = self.footer["index_version"]
+        self.count: int = self.footer["count"]
+        self.dimension: int = self.footer["dimension"]
+
+        sections = {
+            name: np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+            for name, (offset, dtype, count) in self.footer["sections"].items()
+            if name != "content_blob"
+        }
+        blob_offset, _, blob_length = self.footer["sections"]["content_blob"]
+
+        self.matrix = sections["matrix"].reshape(self.count, self.dimension)
+        self.norms = sections["norms"]
+        self.chunk_index = sections["chunk_index"]
+        self.contents = _StringColumn(sections["content_offsets"], buffer[blob_offset:blob_offset + blob_length])
+        self.sources = _DictionaryColumn(sections["source_codes"], self.footer["sources"])
+        self.lesson_ids = _DictionaryColumn(sections["lesson_codes"], self.footer["lesson_ids"])
+        self.lesson_ranges = {lesson_id: tuple(bounds) for lesson_id, bounds in self.footer["lesson_ranges"].items()}
+
+    def to_index(self) -> NumpyVectorIndex:
+        """NumpyVectorIndex đọc trực tiếp trên mmap (không copy ma trận)"""
+        return NumpyVectorIndex(
+            self.matrix,
+            self.contents,
+            self.sources,
+            self.lesson_ids,
+            normalized=True,
+            lesson_ranges=self.lesson_ranges,
+        )
+
+
+def load_snapshot(db_path: Union[str, Path], expected_version: Optional[str] = None) -> Optional[EmbeddingSnapshot]:
+    """
+    Mở snapshot trong thư mục ChromaDB
+
+    Args:
+        db_path: Thư mục ChromaDB
+        expected_version: Version hiện tại của vector store; snapshot khác version bị bỏ qua
+
+    Returns:
+        EmbeddingSnapshot, hoặc None nếu chưa có / đã cũ
+    """
+    path = Path(db_path) / SNAPSHOT_FILE
+    if not path.exists():
+        return None
+    snapshot = EmbeddingSnapshot(path)
+    if expected_version and snapshot.index_version != expected_version:
+        print(f"[SNAPSHOT] Snapshot version {snapshot.index_version} khác index version {expected_version}, bỏ qua")
+        return None
+    return snapshot
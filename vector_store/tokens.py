@@ -0,0 +1,62 @@
+"""
+Đếm token (tiktoken) dùng chung cho các phần cần giới hạn kích thước context
+"""
+from functools import lru_cache
+
+TOKEN_ENCODING = "cl100k_base"
+
+# Ước lượng khi không load được encoding (máy không có mạng lần đầu chạy):
+# tiếng Việt với cl100k_base trung bình khoảng 2 ký tự / token
+_FALLBACK_CHARS_PER_TOKEN = 2
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception as e:
+        print(f"[TOKENS] Không load được tiktoken encoding {TOKEN_ENCODING}, dùng ước lượng: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Số token của text theo encoding của model OpenAI"""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is None:
+        return max(1, len(text) // _FALLBACK_CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, marker: str = " …") -> str:
+    """
+    Cắt text về tối đa max_tokens token, ưu tiên cắt tại ranh giới dòng/câu
+
+    Args:
+        text: Nội dung cần cắt
+        max_tokens: Số token tối đa (tính cả marker)
+        marker: Chuỗi nối vào cuối khi đã bị cắt
+
+    Returns:
+        Text gốc nếu đã vừa, ngược lại phần đầu của text + marker
+    """
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    limit = max(1, max_tokens - count_tokens(marker))
+    encoding = _encoding()
+    if encoding is None:
+        head = text[:limit * _FALLBACK_CHARS_PER_TOKEN]
+    else:
+        # Token bị cắt giữa ký tự nhiều byte decode ra U+FFFD
+        head = encoding.decode(encoding.encode(text, disallowed_special=())[:limit]).rstrip("\ufffd")
+
+    # Lùi về cuối dòng/câu gần nhất nếu không mất quá nửa đoạn đã giữ
+    boundary = max(head.rfind(separator) for separator in ("\n", ". ", "? ", "! "))
+    if boundary >= len(head) // 2:
+        head = head[:boundary + 1]
+    return head.rstrip() + marker